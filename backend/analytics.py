@@ -0,0 +1,273 @@
+"""
+Expense aggregation shared by the analytics routes
+
+A rollup is the per-user, per-month aggregate the storage backends keep
+current on every expense write, in integer cents (see money.py):
+
+    {'month': 'YYYY-MM', 'total_cents': 0, 'count': 0,
+     'categories': {category: {'total_cents': 0, 'count': 0}}}
+
+get_summary and get_report are built from a rollup plus the month's
+budgets, so they no longer scan every expense. Multi-month trends are
+bucketed from a single date-range scan.
+"""
+
+from datetime import date, datetime
+import calendar
+
+import numpy as np
+
+from money import BudgetRecord, ExpenseColumns, amount_cents, from_cents, to_cents
+
+
+def month_range(month_str):
+    """
+    Return the first and last moment of a month (YYYY-MM).
+    Raises ValueError for malformed months.
+    """
+    year, month = map(int, month_str.split('-'))
+    start_date = datetime(year, month, 1)
+    # Get last day of month
+    last_day = calendar.monthrange(year, month)[1]
+    end_date = datetime(year, month, last_day, 23, 59, 59)
+    return start_date, end_date
+
+
+def month_key(date):
+    """Return the YYYY-MM month an expense date belongs to"""
+    return date.strftime('%Y-%m')
+
+
+def month_keys(start_date, end_date):
+    """Every YYYY-MM month from start_date's to end_date's, inclusive"""
+    first = start_date.year * 12 + start_date.month - 1
+    last = end_date.year * 12 + end_date.month - 1
+    return [f"{index // 12:04d}-{index % 12 + 1:02d}" for index in range(first, last + 1)]
+
+
+def rollup_category(category):
+    """Category key used in rollups (expenses without one count as 'Other')"""
+    return category or 'Other'
+
+
+def new_rollup(month):
+    """Return an empty rollup for a month"""
+    return {'month': month, 'total_cents': 0, 'count': 0, 'categories': {}}
+
+
+def rollup_cents(entry):
+    """
+    Total cents of a rollup or rollup category. Firestore rollups written
+    before amounts were kept in cents also hold a float total, which later
+    writes leave alone; both parts are added up.
+    """
+    return entry.get('total_cents', 0) + (to_cents(entry['total']) if entry.get('total') else 0)
+
+
+def expense_columns(expenses):
+    """Expense documents as ExpenseColumns (returned as they are if already columns)"""
+    if isinstance(expenses, ExpenseColumns):
+        return expenses
+    columns = ExpenseColumns()
+    for expense in expenses:
+        columns.append(amount_cents(expense), rollup_category(expense.get('category')), expense['date'].toordinal())
+    return columns
+
+
+def summarize_expenses(month, expenses):
+    """Build a rollup from raw expense documents or ExpenseColumns"""
+    rollup = new_rollup(month)
+    for category, (cents, count) in expense_columns(expenses).category_totals().items():
+        rollup['categories'][category] = {'total_cents': cents, 'count': count}
+        rollup['total_cents'] += cents
+        rollup['count'] += count
+    return rollup
+
+
+def build_summary(month, rollup, budgets):
+    """Financial summary payload for /api/summary"""
+    total_expenses = rollup_cents(rollup)
+    total_budget = sum(BudgetRecord.from_document(budget).amount_cents for budget in budgets)
+
+    # Calculate remaining budget and status (in cents, so the comparisons are exact)
+    remaining_budget = total_budget - total_expenses
+    budget_usage_percent = (total_expenses / total_budget * 100) if total_budget > 0 else 0
+
+    # Determine budget status
+    if total_budget == 0:
+        budget_status = 'no_budget'
+    elif remaining_budget >= 0:
+        budget_status = 'under_budget'
+    else:
+        budget_status = 'over_budget'
+
+    return {
+        'month': month,
+        'total_expenses': from_cents(total_expenses),
+        'total_budget': from_cents(total_budget),
+        'remaining_budget': from_cents(remaining_budget),
+        'budget_usage_percent': round(budget_usage_percent, 2),
+        'budget_status': budget_status,
+        'expense_count': rollup.get('count', 0),
+        'budget_count': len(budgets)
+    }
+
+
+def build_report(month, rollup, budgets):
+    """Detailed per-category report payload for /api/report"""
+    # Create budget lookup (cents)
+    budget_lookup = {}
+    for budget in map(BudgetRecord.from_document, budgets):
+        budget_lookup[budget.category] = budget.amount_cents
+
+    total_expenses = rollup_cents(rollup)
+    category_expenses = {}
+    top_category = None
+    top_amount = 0
+    over_budget_count = 0
+
+    for category, totals in rollup.get('categories', {}).items():
+        # Categories whose expenses were all moved or deleted
+        if totals.get('count', 0) <= 0:
+            continue
+
+        amount = rollup_cents(totals)
+        data = {
+            'total_amount': amount,
+            'count': totals['count'],
+            'budget': budget_lookup.get(category, 0),
+            'over_budget': False,
+            # Percentage of total expenses
+            'percentage': (amount / total_expenses * 100) if total_expenses > 0 else 0
+        }
+
+        # Check if over budget
+        if data['budget'] > 0 and amount > data['budget']:
+            data['over_budget'] = True
+            over_budget_count += 1
+
+        # Track top spending category
+        if amount > top_amount:
+            top_amount = amount
+            top_category = category
+
+        # Back to currency units
+        data['total_amount'] = from_cents(amount)
+        data['budget'] = from_cents(data['budget'])
+        data['percentage'] = round(data['percentage'], 2)
+        category_expenses[category] = data
+
+    return {
+        'month': month,
+        'expenses_by_category': category_expenses,
+        'top_spending_category': {
+            'category': top_category,
+            'amount': from_cents(top_amount)
+        } if top_category else None,
+        'over_budget_categories_count': over_budget_count,
+        'total_expenses': from_cents(total_expenses),
+        'total_categories': len(category_expenses)
+    }
+
+
+# Trends
+TREND_GRANULARITIES = ('day', 'week', 'month')
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def _month_index(year, month):
+    return year * 12 + month - 1
+
+
+def _trend_periods(start_date, end_date, granularity):
+    """Return (first period ordinal/index, period labels) for the range"""
+    if granularity == 'day':
+        first = start_date.toordinal()
+        labels = [
+            date.fromordinal(ordinal).isoformat()
+            for ordinal in range(first, end_date.toordinal() + 1)
+        ]
+    elif granularity == 'week':
+        # Weeks start on Monday; labelled by their first day
+        first = start_date.toordinal() - start_date.weekday()
+        labels = [
+            date.fromordinal(ordinal).isoformat()
+            for ordinal in range(first, end_date.toordinal() + 1, 7)
+        ]
+    else:
+        first = _month_index(start_date.year, start_date.month)
+        last = _month_index(end_date.year, end_date.month)
+        labels = [f"{index // 12:04d}-{index % 12 + 1:02d}" for index in range(first, last + 1)]
+    return first, labels
+
+
+def build_trends(expenses, start_date, end_date, granularity='month'):
+    """
+    Bucket expenses (documents or ExpenseColumns) by period and category
+    for charting.
+
+    Bucketing is done with NumPy (bincount over period indices) on the
+    columns' arrays, so the cost is a single pass over the range instead of
+    one query per month. Amounts are summed in cents: float64 holds integer
+    sums exactly up to 2**53 cents.
+    """
+    columns = expense_columns(expenses)
+    ordinals = np.frombuffer(columns.ordinals, dtype=np.int32).astype(np.int64)
+    cents = np.frombuffer(columns.amount_cents, dtype=np.int64)
+
+    first, periods = _trend_periods(start_date, end_date, granularity)
+    first_month, month_labels = _trend_periods(start_date, end_date, 'month')
+    period_count = len(periods)
+
+    # Month index (year * 12 + month - 1) of each date, via NumPy's calendar
+    days = (ordinals - EPOCH_ORDINAL).astype('datetime64[D]')
+    months = days.astype('datetime64[M]').astype(np.int64) + _month_index(1970, 1) - first_month
+    if granularity == 'day':
+        period_index = ordinals - first
+    elif granularity == 'week':
+        period_index = (ordinals - first) // 7
+    else:
+        period_index = months
+
+    totals = np.bincount(period_index, weights=cents, minlength=period_count)
+    counts = np.bincount(period_index, minlength=period_count)
+
+    # Per-category series: one bincount over (category, period) cells
+    codes = np.frombuffer(columns.category_codes, dtype=np.uint32).astype(np.int64)
+    cells = np.bincount(
+        codes * period_count + period_index,
+        weights=cents,
+        minlength=len(columns.categories) * period_count
+    ).reshape(len(columns.categories), period_count)
+
+    # Month-over-month deltas are always computed on monthly totals
+    monthly = np.bincount(months, weights=cents, minlength=len(month_labels))
+    month_over_month = []
+    for index in range(1, len(month_labels)):
+        previous, current = int(monthly[index - 1]), int(monthly[index])
+        month_over_month.append({
+            'month': month_labels[index],
+            'total': from_cents(current),
+            'change': from_cents(current - previous),
+            'change_percent': round((current - previous) / previous * 100, 2) if previous > 0 else None
+        })
+
+    return {
+        'granularity': granularity,
+        'periods': periods,
+        'totals': _from_cents_series(totals),
+        'counts': counts.tolist(),
+        'categories': {
+            name: _from_cents_series(cells[code])
+            for code, name in sorted(enumerate(columns.categories), key=lambda item: item[1])
+        },
+        'total_expenses': from_cents(columns.total_cents()),
+        'expense_count': len(columns),
+        'month_over_month': month_over_month
+    }
+
+
+def _from_cents_series(cents):
+    """A float64 array of (integral) cent sums as a list of amounts, as from_cents would give"""
+    return (cents / 100).tolist()
@@ -3,15 +3,39 @@ Finance Tracker Backend - Flask API with Firebase Integration
 IB Computer Science Internal Assessment
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
-import firebase_admin
-from firebase_admin import credentials, firestore, auth
-from datetime import datetime, timedelta
-import calendar
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from datetime import datetime
 from functools import wraps
+import click
+import contextvars
 import os
 import logging
+import queue
+import time
+from analytics import build_report, build_summary, build_trends, month_key
+from export import (
+    EXPORT_MIMETYPES, EXPORT_PAGE_SIZE, budgets_in_range, export_filename, iter_expense_pages, new_export
+)
+from firebase_app import READINESS_TIMEOUT, Readiness, firebase
+from fleet_stats import STATS_SHARDS, STATS_WORKERS, StatsJob
+from helpers import (
+    ANALYTICS_BUDGET_FIELDS, DEFAULT_PAGE_SIZE, IMPORT_MIMETYPES, MAX_PAGE_SIZE,
+    budgets_payload, decode_cursor, encode_cursor, expenses_payload, get_current_month, get_month_range,
+    iter_import_batches, month_keys, new_import_report, parse_dashboard_sections, parse_date, parse_expense_filters,
+    parse_export_params, parse_trend_params, record_import_batch, record_import_error, validate_budget,
+    validate_expense, validate_expense_update, validate_recurring_rule, validate_recurring_update, versions_etag
+)
+from live_status import LIVE_HEARTBEAT, SSE_HEARTBEAT, SSE_RETRY, LiveStatusHub, live_status
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, InstrumentedStorage, create_metrics, stats_gauges
+from responses import OrjsonProvider, compress, compressible, encode_json, negotiate_encoding
+from recurring import RecurringScheduler, materialize_user, today_utc
+from result_cache import create_result_cache
+from single_flight import Overloaded, SingleFlight
+from storage import create_storage
+from token_cache import TokenCache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -21,33 +45,106 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app, origins=["http://localhost:3000"])  # Allow frontend access
 
-# Initialize Firebase Admin SDK
-try:
-    # Initialize Firebase with service account key
-    cred = credentials.Certificate('serviceAccountKey.json')
-    firebase_admin.initialize_app(cred)
-    db = firestore.client()
-    logger.info("Firebase initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize Firebase: {e}")
-    raise
+class AppJSONProvider(OrjsonProvider, JSONProvider):
+    """orjson encoding for jsonify and request.get_json (datetimes as ISO 8601)"""
+
+app.json = AppJSONProvider(app)
+
+# Storage backend: firestore (default), memory or sqlite
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'firestore').lower()
+
+# The Firebase Admin SDK and Firestore client are initialized on first use,
+# once per process (see firebase_app); warm_up() does it ahead of traffic
+
+# Request, auth and storage metrics served at /metrics
+metrics = create_metrics()
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+storage = InstrumentedStorage(create_storage(STORAGE_BACKEND), metrics)
+logger.info(f"Using {storage.name} storage backend")
+
+# Shared, bounded pool for running a handler's independent queries concurrently
+query_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('QUERY_WORKERS', 16)),
+    thread_name_prefix='storage-query'
+)
+
+# Cached summary/report payloads, valid for the data version they were computed for
+result_cache = create_result_cache()
+
+# Decoded ID tokens, reused until their 'exp' claim
+token_cache = TokenCache(max_size=int(os.environ.get('TOKEN_CACHE_SIZE', 1024)))
+metrics.add_collector(lambda: stats_gauges('token_cache', 'ID token cache', token_cache.stats()))
+metrics.add_collector(lambda: stats_gauges('result_cache', 'Analytics result cache', result_cache.stats()))
+
+# Identical analytics queries in flight are run once; each user gets a few
+# query slots and a bounded queue (see single_flight)
+analytics_flight = SingleFlight()
+metrics.add_collector(lambda: stats_gauges('analytics_flight', 'Analytics query coalescing', analytics_flight.stats()))
+
+# Result of the last readiness check, reported by /health
+readiness = Readiness()
 
 # Helper Functions
+def check_readiness(force=False):
+    """
+    Check that Firebase is initialized and storage is reachable. The result
+    is reused for READINESS_TTL seconds unless force is set.
+    """
+    if force or readiness.stale():
+        try:
+            firebase.app()
+            if readiness.pending is None or readiness.pending.done():
+                readiness.pending = submit_query(storage.ping)
+            readiness.pending.result(timeout=READINESS_TIMEOUT)
+            readiness.record()
+        except FuturesTimeoutError:
+            logger.error("Readiness check failed: storage did not answer in time")
+            readiness.record(f"Storage did not answer within {READINESS_TIMEOUT:g} s")
+        except Exception as e:
+            logger.error(f"Readiness check failed: {e}")
+            readiness.record(e)
+    return readiness.ready
+
+def warm_up():
+    """
+    Initialize Firebase and the storage connection of this process ahead of
+    the first request (e.g. from a pre-fork server's post_fork hook)
+    """
+    started = time.perf_counter()
+    ready = check_readiness(force=True)
+    logger.info(f"Warm-up {'succeeded' if ready else 'failed'} in {(time.perf_counter() - started) * 1000:.0f} ms")
+    # Background materialization of recurring expenses, if RECURRING_INTERVAL is set
+    recurring_scheduler.start()
+    return ready
+
 def verify_firebase_token(token):
     """
     Verify Firebase ID token and return user info
     """
+    started = time.perf_counter()
+    outcome = 'failed'
     try:
         # Remove 'Bearer ' prefix if present
         if token.startswith('Bearer '):
             token = token[7:]
         
+        # Reuse a previous verification of the same token
+        decoded_token = token_cache.get(token)
+        if decoded_token is not None:
+            outcome = 'cached'
+            return decoded_token
+        
         # Verify the token
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = firebase.verify_id_token(token)
+        token_cache.put(token, decoded_token)
+        outcome = 'verified'
         return decoded_token
     except Exception as e:
         logger.error(f"Token verification failed: {e}")
         return None
+    finally:
+        metrics.record_auth(outcome, time.perf_counter() - started)
 
 def require_auth(f):
     """
@@ -76,28 +173,62 @@ def require_auth(f):
     
     return decorated_function
 
-def get_current_month():
-    """Get current month in YYYY-MM format"""
-    return datetime.now().strftime('%Y-%m')
+def data_etag(user_id, months):
+    """Weak ETag for a response built from a user's data in the given months"""
+    return versions_etag(user_id, storage.get_versions(user_id, months))
 
-def parse_date(date_string):
-    """Parse date string to datetime object"""
-    try:
-        return datetime.strptime(date_string, '%Y-%m-%d')
-    except ValueError:
-        return None
+def with_etag(response, etag):
+    """Attach an ETag and make clients revalidate before reusing the response"""
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
-def get_month_range(month_str):
-    """Get start and end dates for a given month (YYYY-MM)"""
-    try:
-        year, month = map(int, month_str.split('-'))
-        start_date = datetime(year, month, 1)
-        # Get last day of month
-        last_day = calendar.monthrange(year, month)[1]
-        end_date = datetime(year, month, last_day, 23, 59, 59)
-        return start_date, end_date
-    except ValueError:
-        return None, None
+def not_modified(etag):
+    """304 response if the client's If-None-Match already matches etag, else None"""
+    if request.if_none_match.contains_weak(etag):
+        return with_etag(Response(status=304), etag)
+    return None
+
+def overloaded_response(error):
+    """429 asking the client to retry after error.retry_after seconds"""
+    response = jsonify({'error': 'Too many concurrent analytics requests, retry shortly'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+# Request Metrics
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.request_timing = metrics.start_request()
+
+@app.after_request
+def record_request_metrics(response):
+    # Label by route pattern, not path, so user ids do not create new series
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.finish_request(request.method, route, response.status_code, time.perf_counter() - g.request_started)
+    if g.request_timing is not None:
+        response.headers['Server-Timing'] = g.request_timing.header()
+    return response
+
+@app.teardown_request
+def end_request_metrics(error=None):
+    metrics.end_request()
+
+# Response Compression
+@app.after_request
+def compress_response(response):
+    """Compress large JSON/text bodies with the client's preferred encoding (br or gzip)"""
+    if response.is_streamed or response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    if not compressible(response.mimetype, response.content_length):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding:
+        response.set_data(compress(response.get_data(), encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
 
 # Error Handlers
 @app.errorhandler(404)
@@ -111,18 +242,43 @@ def internal_error(error):
 # Health Check Route
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
+    """
+    Health check endpoint. 'ready' tells whether Firebase and storage are
+    reachable; with ?ready=1 the response is 503 while they are not.
+    """
+    ready = check_readiness()
     return jsonify({
         'status': 'healthy',
+        'ready': ready,
+        'readiness_error': readiness.error,
         'timestamp': datetime.now().isoformat(),
-        'service': 'Finance Tracker Backend'
-    })
+        'service': 'Finance Tracker Backend',
+        'firebase': firebase.status(),
+        'token_cache': token_cache.stats(),
+        'result_cache': result_cache.stats(),
+        'analytics_flight': analytics_flight.stats(),
+        'live_status': live_hub.stats(),
+        'recurring': recurring_scheduler.stats()
+    }), 503 if request.args.get('ready') and not ready else 200
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics (requires 'Bearer <METRICS_TOKEN>' when METRICS_TOKEN is set)"""
+    if METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}":
+        return jsonify({'error': 'Invalid metrics token'}), 401
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
 
 # EXPENSE ROUTES
 @app.route('/api/users/<user_id>/expenses', methods=['GET'])
 @require_auth
 def get_expenses(user_id):
-    """Get all expenses for current month or specified month"""
+    """
+    Get all expenses for current month or specified month.
+    Supports cursor pagination (page_size, start_after) and NDJSON
+    streaming (stream=1). category, min_amount, max_amount, sort and q
+    (note search) filter and order the expenses in storage. Answers
+    If-None-Match with 304 while the month's data version is unchanged.
+    """
     try:
         # Get month parameter (default to current month)
         month = request.args.get('month', get_current_month())
@@ -131,26 +287,75 @@ def get_expenses(user_id):
         if not start_date or not end_date:
             return jsonify({'error': 'Invalid month format. Use YYYY-MM'}), 400
         
-        # Query Firestore for expenses in date range
-        expenses_ref = db.collection('users').document(user_id).collection('expenses')
-        query = expenses_ref.where('date', '>=', start_date).where('date', '<=', end_date)
-        expenses = query.stream()
-        
-        # Format response
-        expense_list = []
-        for expense in expenses:
-            expense_data = expense.to_dict()
-            expense_data['id'] = expense.id
-            # Convert timestamp to ISO string
-            if 'date' in expense_data:
-                expense_data['date'] = expense_data['date'].isoformat()
-            expense_list.append(expense_data)
+        filters, error = parse_expense_filters(request.args)
+        if error:
+            return jsonify({'error': error}), 400
+        sort = filters['sort'] if filters else 'date'
+        
+        # Resume after the last expense of the previous page
+        start_after = None
+        cursor = request.args.get('start_after')
+        if cursor:
+            start_after = decode_cursor(cursor, sort)
+            if not start_after:
+                return jsonify({'error': 'Invalid start_after cursor'}), 400
+        
+        # Skip the query entirely if the client's copy is current
+        etag = data_etag(user_id, [month])
+        cached_response = not_modified(etag)
+        if cached_response:
+            return cached_response
+        
+        # Streaming mode: one expense per line, sent as documents are read
+        if request.args.get('stream', '').lower() in ('1', 'true', 'ndjson'):
+            if filters:
+                expenses = storage.query_expenses(user_id, start_date, end_date, filters, start_after=start_after)
+            else:
+                expenses = storage.iter_expenses(user_id, start_date, end_date, start_after)
+            
+            def generate():
+                try:
+                    for expense_data in expenses:
+                        yield encode_json(expense_data) + b'\n'
+                except Exception as e:
+                    logger.error(f"Error streaming expenses: {e}")
+                    yield encode_json({'error': 'Failed to retrieve expenses'}) + b'\n'
+            
+            return with_etag(Response(stream_with_context(generate()), mimetype='application/x-ndjson'), etag)
         
-        return jsonify({
-            'expenses': expense_list,
-            'month': month,
-            'total_count': len(expense_list)
-        })
+        # Paginated mode
+        page_size = request.args.get('page_size')
+        if page_size is not None or start_after:
+            try:
+                page_size = int(page_size or DEFAULT_PAGE_SIZE)
+            except ValueError:
+                page_size = 0
+            if not 1 <= page_size <= MAX_PAGE_SIZE:
+                return jsonify({'error': f'page_size must be between 1 and {MAX_PAGE_SIZE}'}), 400
+            
+            # Fetch one extra document to know whether another page exists
+            if filters:
+                page = storage.query_expenses(user_id, start_date, end_date, filters, page_size + 1, start_after)
+            else:
+                page = storage.page_expenses(user_id, start_date, end_date, page_size + 1, start_after)
+            next_cursor = encode_cursor(page[page_size - 1], sort) if len(page) > page_size else None
+            expense_list = page[:page_size]
+            
+            return with_etag(jsonify({
+                'expenses': expense_list,
+                'month': month,
+                'total_count': len(expense_list),
+                'page_size': page_size,
+                'next_cursor': next_cursor
+            }), etag)
+        
+        # Query storage for expenses in date range
+        if filters:
+            expenses = storage.query_expenses(user_id, start_date, end_date, filters)
+        else:
+            expenses = storage.list_expenses(user_id, start_date, end_date)
+        
+        return with_etag(jsonify(expenses_payload(month, expenses)), etag)
         
     except Exception as e:
         logger.error(f"Error getting expenses: {e}")
@@ -163,44 +368,17 @@ def add_expense(user_id):
     try:
         data = request.get_json()
         
-        # Validate required fields
-        required_fields = ['amount', 'category', 'date']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
+        # Validate and create expense document
+        expense_data, error = validate_expense(data)
+        if error:
+            return jsonify({'error': error}), 400
         
-        # Validate amount
-        try:
-            amount = float(data['amount'])
-            if amount <= 0:
-                return jsonify({'error': 'Amount must be positive'}), 400
-        except (ValueError, TypeError):
-            return jsonify({'error': 'Invalid amount format'}), 400
-        
-        # Parse and validate date
-        expense_date = parse_date(data['date'])
-        if not expense_date:
-            return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
-        
-        # Create expense document
-        expense_data = {
-            'amount': amount,
-            'category': data['category'].strip(),
-            'date': expense_date,
-            'note': data.get('note', '').strip(),
-            'created_at': datetime.now(),
-            'updated_at': datetime.now()
-        }
-        
-        # Add to Firestore
-        expenses_ref = db.collection('users').document(user_id).collection('expenses')
-        doc_ref = expenses_ref.add(expense_data)
+        # Add to storage
+        expense_id = storage.add_expense(user_id, expense_data)
+        result_cache.invalidate(user_id, [month_key(expense_data['date'])])
         
         # Return created expense with ID
-        expense_data['id'] = doc_ref[1].id
-        expense_data['date'] = expense_data['date'].isoformat()
-        expense_data['created_at'] = expense_data['created_at'].isoformat()
-        expense_data['updated_at'] = expense_data['updated_at'].isoformat()
+        expense_data['id'] = expense_id
         
         return jsonify({
             'message': 'Expense added successfully',
@@ -211,6 +389,39 @@ def add_expense(user_id):
         logger.error(f"Error adding expense: {e}")
         return jsonify({'error': 'Failed to add expense'}), 500
 
+@app.route('/api/users/<user_id>/expenses/import', methods=['POST'])
+@require_auth
+def import_expenses(user_id):
+    """Bulk import expenses from a CSV or NDJSON upload"""
+    try:
+        import_format = request.args.get('format') or IMPORT_MIMETYPES.get(request.mimetype)
+        if import_format not in ('csv', 'ndjson'):
+            return jsonify({'error': 'Unsupported import format. Use CSV or NDJSON'}), 400
+        
+        upload_key = request.headers.get('Idempotency-Key', '').strip()
+        report = new_import_report()
+        touched_months = set()
+        
+        for batch in iter_import_batches(user_id, request.stream, import_format, upload_key, report):
+            try:
+                written = storage.add_expenses(user_id, [(doc_id, data) for _, doc_id, data in batch])
+                record_import_batch(report, batch, written)
+                touched_months.update(month_key(data['date']) for _, _, data in batch)
+            except Exception as e:
+                # Keep going; a retry with the same keys fills in these rows
+                logger.error(f"Error writing import batch: {e}")
+                for row_number, _, _ in batch:
+                    record_import_error(report, row_number, 'Failed to save row')
+        
+        result_cache.invalidate(user_id, touched_months)
+        return jsonify(report)
+        
+    except UnicodeDecodeError:
+        return jsonify({'error': 'Upload must be UTF-8 encoded'}), 400
+    except Exception as e:
+        logger.error(f"Error importing expenses: {e}")
+        return jsonify({'error': 'Failed to import expenses'}), 500
+
 @app.route('/api/users/<user_id>/expenses/<expense_id>', methods=['PUT'])
 @require_auth
 def update_expense(user_id, expense_id):
@@ -218,53 +429,17 @@ def update_expense(user_id, expense_id):
     try:
         data = request.get_json()
         
-        # Get expense reference
-        expense_ref = db.collection('users').document(user_id).collection('expenses').document(expense_id)
-        expense_doc = expense_ref.get()
+        # Validate and prepare update data
+        update_data, error = validate_expense_update(data)
+        if error:
+            return jsonify({'error': error}), 400
         
-        if not expense_doc.exists:
+        # Update in storage; the merged document comes back with the write
+        result = storage.update_expense(user_id, expense_id, update_data)
+        if result is None:
             return jsonify({'error': 'Expense not found'}), 404
-        
-        # Prepare update data
-        update_data = {'updated_at': datetime.now()}
-        
-        # Update amount if provided
-        if 'amount' in data:
-            try:
-                amount = float(data['amount'])
-                if amount <= 0:
-                    return jsonify({'error': 'Amount must be positive'}), 400
-                update_data['amount'] = amount
-            except (ValueError, TypeError):
-                return jsonify({'error': 'Invalid amount format'}), 400
-        
-        # Update category if provided
-        if 'category' in data:
-            update_data['category'] = data['category'].strip()
-        
-        # Update date if provided
-        if 'date' in data:
-            expense_date = parse_date(data['date'])
-            if not expense_date:
-                return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
-            update_data['date'] = expense_date
-        
-        # Update note if provided
-        if 'note' in data:
-            update_data['note'] = data['note'].strip()
-        
-        # Update in Firestore
-        expense_ref.update(update_data)
-        
-        # Get updated document
-        updated_doc = expense_ref.get()
-        updated_data = updated_doc.to_dict()
-        updated_data['id'] = expense_id
-        
-        # Convert timestamps to ISO strings
-        for field in ['date', 'created_at', 'updated_at']:
-            if field in updated_data:
-                updated_data[field] = updated_data[field].isoformat()
+        existing, updated_data = result
+        result_cache.invalidate(user_id, [month_key(existing['date']), month_key(updated_data['date'])])
         
         return jsonify({
             'message': 'Expense updated successfully',
@@ -280,15 +455,11 @@ def update_expense(user_id, expense_id):
 def delete_expense(user_id, expense_id):
     """Delete expense"""
     try:
-        # Get expense reference
-        expense_ref = db.collection('users').document(user_id).collection('expenses').document(expense_id)
-        expense_doc = expense_ref.get()
-        
-        if not expense_doc.exists:
+        # Delete from storage (missing expenses are reported by the write itself)
+        existing = storage.delete_expense(user_id, expense_id)
+        if existing is None:
             return jsonify({'error': 'Expense not found'}), 404
-        
-        # Delete from Firestore
-        expense_ref.delete()
+        result_cache.invalidate(user_id, [month_key(existing['date'])])
         
         return jsonify({'message': 'Expense deleted successfully'})
         
@@ -304,27 +475,19 @@ def get_budgets(user_id):
     try:
         # Get month parameter (default to current month)
         month = request.args.get('month', get_current_month())
+        start_date, _ = get_month_range(month)
+        if not start_date:
+            return jsonify({'error': 'Invalid month format. Use YYYY-MM'}), 400
         
-        # Query Firestore for budgets
-        budgets_ref = db.collection('users').document(user_id).collection('budgets')
-        query = budgets_ref.where('month', '==', month)
-        budgets = query.stream()
+        etag = data_etag(user_id, [month])
+        cached_response = not_modified(etag)
+        if cached_response:
+            return cached_response
         
-        # Format response
-        budget_list = []
-        total_budget = 0
-        for budget in budgets:
-            budget_data = budget.to_dict()
-            budget_data['id'] = budget.id
-            budget_list.append(budget_data)
-            total_budget += budget_data.get('amount', 0)
+        # Query storage for budgets
+        budgets = storage.list_budgets(user_id, month)
         
-        return jsonify({
-            'budgets': budget_list,
-            'month': month,
-            'total_budget': total_budget,
-            'count': len(budget_list)
-        })
+        return with_etag(jsonify(budgets_payload(month, budgets)), etag)
         
     except Exception as e:
         logger.error(f"Error getting budgets: {e}")
@@ -337,69 +500,29 @@ def set_budget(user_id):
     try:
         data = request.get_json()
         
-        # Validate required fields
-        required_fields = ['amount', 'month']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
-        
-        # Validate amount
-        try:
-            amount = float(data['amount'])
-            if amount <= 0:
-                return jsonify({'error': 'Amount must be positive'}), 400
-        except (ValueError, TypeError):
-            return jsonify({'error': 'Invalid amount format'}), 400
-        
-        # Validate month format
-        month = data['month']
-        if not month or len(month.split('-')) != 2:
-            return jsonify({'error': 'Invalid month format. Use YYYY-MM'}), 400
-        
-        # Check if budget already exists for this month and category
-        budgets_ref = db.collection('users').document(user_id).collection('budgets')
-        query = budgets_ref.where('month', '==', month)
+        # Validate and create budget document
+        budget_data, error = validate_budget(data)
+        if error:
+            return jsonify({'error': error}), 400
+        month = budget_data['month']
         
-        # Add category filter if provided
-        category = data.get('category', '').strip()
-        if category:
-            query = query.where('category', '==', category)
-        else:
-            query = query.where('category', '==', '')
-        
-        existing_budgets = list(query.stream())
-        
-        # Create budget document
-        budget_data = {
-            'amount': amount,
-            'month': month,
-            'category': category,
-            'created_at': datetime.now(),
-            'updated_at': datetime.now()
-        }
-        
-        if existing_budgets:
-            # Update existing budget
-            budget_ref = existing_budgets[0].reference
-            budget_data['updated_at'] = datetime.now()
-            budget_ref.update(budget_data)
-            budget_id = existing_budgets[0].id
-            message = 'Budget updated successfully'
-        else:
-            # Create new budget
-            doc_ref = budgets_ref.add(budget_data)
-            budget_id = doc_ref[1].id
-            message = 'Budget created successfully'
+        # One upsert keyed by month and category (no lookup query, no duplicates)
+        budget_id, created = storage.upsert_budget(user_id, budget_data)
+        result_cache.invalidate(user_id, [month])
         
         # Return created/updated budget with ID
         budget_data['id'] = budget_id
-        budget_data['created_at'] = budget_data['created_at'].isoformat()
-        budget_data['updated_at'] = budget_data['updated_at'].isoformat()
+        if created:
+            message = 'Budget created successfully'
+        else:
+            # The stored created_at is left untouched on update
+            message = 'Budget updated successfully'
+            del budget_data['created_at']
         
         return jsonify({
             'message': message,
             'budget': budget_data
-        }), 201 if not existing_budgets else 200
+        }), 201 if created else 200
         
     except Exception as e:
         logger.error(f"Error setting budget: {e}")
@@ -410,15 +533,11 @@ def set_budget(user_id):
 def delete_budget(user_id, budget_id):
     """Delete budget"""
     try:
-        # Get budget reference
-        budget_ref = db.collection('users').document(user_id).collection('budgets').document(budget_id)
-        budget_doc = budget_ref.get()
-        
-        if not budget_doc.exists:
+        # Delete from storage (missing budgets are reported by the write itself)
+        month = storage.delete_budget(user_id, budget_id)
+        if month is None:
             return jsonify({'error': 'Budget not found'}), 404
-        
-        # Delete from Firestore
-        budget_ref.delete()
+        result_cache.invalidate(user_id, [month])
         
         return jsonify({'message': 'Budget deleted successfully'})
         
@@ -426,55 +545,146 @@ def delete_budget(user_id, budget_id):
         logger.error(f"Error deleting budget: {e}")
         return jsonify({'error': 'Failed to delete budget'}), 500
 
-# ANALYTICS ROUTES
-@app.route('/api/summary/<user_id>/<month>', methods=['GET'])
+# RECURRING EXPENSE ROUTES
+# Writes due occurrences of every user's rules in batches (see recurring)
+recurring_scheduler = RecurringScheduler(storage, on_written=result_cache.invalidate)
+metrics.add_collector(lambda: stats_gauges('recurring', 'Recurring expense scheduler', recurring_scheduler.stats()))
+
+@app.route('/api/users/<user_id>/recurring', methods=['GET'])
 @require_auth
-def get_summary(user_id, month):
-    """Get financial summary for specified month"""
+def get_recurring_rules(user_id):
+    """Get the user's recurring expense rules"""
     try:
-        start_date, end_date = get_month_range(month)
-        if not start_date or not end_date:
-            return jsonify({'error': 'Invalid month format. Use YYYY-MM'}), 400
+        rules = storage.list_recurring_rules(user_id)
+        rules.sort(key=lambda rule: rule['created_at'])
+        
+        return jsonify({'recurring': rules, 'count': len(rules)})
+        
+    except Exception as e:
+        logger.error(f"Error getting recurring expenses: {e}")
+        return jsonify({'error': 'Failed to retrieve recurring expenses'}), 500
+
+@app.route('/api/users/<user_id>/recurring', methods=['POST'])
+@require_auth
+def add_recurring_rule(user_id):
+    """
+    Create a recurring expense rule. Occurrences already due (start_date
+    today or in the past) are written right away; later ones by the scheduler.
+    """
+    try:
+        data = request.get_json()
+        
+        rule_data, error = validate_recurring_rule(data)
+        if error:
+            return jsonify({'error': error}), 400
         
-        # Get expenses for the month
-        expenses_ref = db.collection('users').document(user_id).collection('expenses')
-        expenses_query = expenses_ref.where('date', '>=', start_date).where('date', '<=', end_date)
-        expenses = list(expenses_query.stream())
+        rule = dict(rule_data, id=storage.add_recurring_rule(user_id, rule_data))
+        written, months = materialize_user(storage, user_id, [rule], today_utc())
+        result_cache.invalidate(user_id, months)
         
-        # Calculate total expenses
-        total_expenses = sum(expense.to_dict().get('amount', 0) for expense in expenses)
+        return jsonify({
+            'message': 'Recurring expense created successfully',
+            'recurring': rule,
+            'expenses_created': len(written)
+        }), 201
         
-        # Get budgets for the month
-        budgets_ref = db.collection('users').document(user_id).collection('budgets')
-        budgets_query = budgets_ref.where('month', '==', month)
-        budgets = list(budgets_query.stream())
+    except Exception as e:
+        logger.error(f"Error adding recurring expense: {e}")
+        return jsonify({'error': 'Failed to add recurring expense'}), 500
+
+@app.route('/api/users/<user_id>/recurring/<rule_id>', methods=['PUT'])
+@require_auth
+def update_recurring_rule(user_id, rule_id):
+    """Update a rule's amount, category, note or end_date (future occurrences only)"""
+    try:
+        data = request.get_json()
         
-        # Calculate total budget
-        total_budget = sum(budget.to_dict().get('amount', 0) for budget in budgets)
+        rule = storage.get_recurring_rule(user_id, rule_id)
+        if rule is None:
+            return jsonify({'error': 'Recurring expense not found'}), 404
         
-        # Calculate remaining budget and status
-        remaining_budget = total_budget - total_expenses
-        budget_usage_percent = (total_expenses / total_budget * 100) if total_budget > 0 else 0
+        update_data, error = validate_recurring_update(data, rule)
+        if error:
+            return jsonify({'error': error}), 400
         
-        # Determine budget status
-        if total_budget == 0:
-            budget_status = 'no_budget'
-        elif remaining_budget >= 0:
-            budget_status = 'under_budget'
-        else:
-            budget_status = 'over_budget'
+        rule = storage.update_recurring_rule(user_id, rule_id, update_data)
+        if rule is None:
+            return jsonify({'error': 'Recurring expense not found'}), 404
         
         return jsonify({
-            'month': month,
-            'total_expenses': round(total_expenses, 2),
-            'total_budget': round(total_budget, 2),
-            'remaining_budget': round(remaining_budget, 2),
-            'budget_usage_percent': round(budget_usage_percent, 2),
-            'budget_status': budget_status,
-            'expense_count': len(expenses),
-            'budget_count': len(budgets)
+            'message': 'Recurring expense updated successfully',
+            'recurring': rule
         })
         
+    except Exception as e:
+        logger.error(f"Error updating recurring expense: {e}")
+        return jsonify({'error': 'Failed to update recurring expense'}), 500
+
+@app.route('/api/users/<user_id>/recurring/<rule_id>', methods=['DELETE'])
+@require_auth
+def delete_recurring_rule(user_id, rule_id):
+    """Delete a rule; expenses it already created are kept"""
+    try:
+        if not storage.delete_recurring_rule(user_id, rule_id):
+            return jsonify({'error': 'Recurring expense not found'}), 404
+        
+        return jsonify({'message': 'Recurring expense deleted successfully'})
+        
+    except Exception as e:
+        logger.error(f"Error deleting recurring expense: {e}")
+        return jsonify({'error': 'Failed to delete recurring expense'}), 500
+
+# ANALYTICS ROUTES
+def load_rollup(user_id, month):
+    """Get a month's rollup, building it from raw expenses on first use"""
+    rollup = storage.get_rollup(user_id, month)
+    if rollup is None:
+        # Month never aggregated (e.g. expenses written before rollups existed).
+        # No data changes, so the version (and the ETag already computed) stays
+        rollup = storage.rebuild_rollup(user_id, month, bump_version=False)
+    return rollup
+
+def submit_query(query, *args):
+    """Run a storage query on the shared pool (in a copy of this context, so it is attributed to the request)"""
+    return query_executor.submit(contextvars.copy_context().run, query, *args)
+
+def load_month_analytics(user_id, month):
+    """Fetch a month's rollup and budgets concurrently"""
+    budgets_future = submit_query(storage.list_budgets, user_id, month, ANALYTICS_BUDGET_FIELDS)
+    rollup = load_rollup(user_id, month)
+    return rollup, budgets_future.result()
+
+def cached_analytics(user_id, endpoint, month, build, etag):
+    """
+    Return a cached analytics payload, computing it with build(month, rollup,
+    budgets) on a miss. Concurrent misses for the same month and data version
+    (etag) share one read of the rollup and budgets.
+    """
+    payload = result_cache.get(user_id, endpoint, month, etag)
+    if payload is None:
+        analytics = analytics_flight.do(user_id, ('month', month, etag), load_month_analytics, user_id, month)
+        payload = build(month, *analytics)
+        result_cache.set(user_id, endpoint, month, etag, payload)
+    return payload
+
+@app.route('/api/summary/<user_id>/<month>', methods=['GET'])
+@require_auth
+def get_summary(user_id, month):
+    """Get financial summary for specified month"""
+    try:
+        start_date, end_date = get_month_range(month)
+        if not start_date or not end_date:
+            return jsonify({'error': 'Invalid month format. Use YYYY-MM'}), 400
+        
+        etag = data_etag(user_id, [month])
+        cached_response = not_modified(etag)
+        if cached_response:
+            return cached_response
+        
+        return with_etag(jsonify(cached_analytics(user_id, 'summary', month, build_summary, etag)), etag)
+        
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         logger.error(f"Error getting summary: {e}")
         return jsonify({'error': 'Failed to generate summary'}), 500
@@ -488,89 +698,304 @@ def get_report(user_id, month):
         if not start_date or not end_date:
             return jsonify({'error': 'Invalid month format. Use YYYY-MM'}), 400
         
-        # Get expenses for the month
-        expenses_ref = db.collection('users').document(user_id).collection('expenses')
-        expenses_query = expenses_ref.where('date', '>=', start_date).where('date', '<=', end_date)
-        expenses = list(expenses_query.stream())
-        
-        # Get budgets for the month
-        budgets_ref = db.collection('users').document(user_id).collection('budgets')
-        budgets_query = budgets_ref.where('month', '==', month)
-        budgets = list(budgets_query.stream())
-        
-        # Create budget lookup
-        budget_lookup = {}
-        for budget in budgets:
-            budget_data = budget.to_dict()
-            category = budget_data.get('category', 'general')
-            budget_lookup[category] = budget_data.get('amount', 0)
-        
-        # Group expenses by category
-        category_expenses = {}
-        total_expenses = 0
-        
-        for expense in expenses:
-            expense_data = expense.to_dict()
-            category = expense_data.get('category', 'Other')
-            amount = expense_data.get('amount', 0)
-            
-            if category not in category_expenses:
-                category_expenses[category] = {
-                    'total_amount': 0,
-                    'count': 0,
-                    'budget': budget_lookup.get(category, 0),
-                    'over_budget': False
-                }
-            
-            category_expenses[category]['total_amount'] += amount
-            category_expenses[category]['count'] += 1
-            total_expenses += amount
-        
-        # Calculate percentages and over-budget status
-        top_category = None
-        top_amount = 0
-        over_budget_count = 0
-        
-        for category, data in category_expenses.items():
-            # Calculate percentage of total expenses
-            data['percentage'] = (data['total_amount'] / total_expenses * 100) if total_expenses > 0 else 0
-            
-            # Check if over budget
-            if data['budget'] > 0 and data['total_amount'] > data['budget']:
-                data['over_budget'] = True
-                over_budget_count += 1
-            
-            # Track top spending category
-            if data['total_amount'] > top_amount:
-                top_amount = data['total_amount']
-                top_category = category
-            
-            # Round amounts
-            data['total_amount'] = round(data['total_amount'], 2)
-            data['percentage'] = round(data['percentage'], 2)
+        etag = data_etag(user_id, [month])
+        cached_response = not_modified(etag)
+        if cached_response:
+            return cached_response
         
-        return jsonify({
-            'month': month,
-            'expenses_by_category': category_expenses,
-            'top_spending_category': {
-                'category': top_category,
-                'amount': round(top_amount, 2)
-            } if top_category else None,
-            'over_budget_categories_count': over_budget_count,
-            'total_expenses': round(total_expenses, 2),
-            'total_categories': len(category_expenses)
-        })
+        return with_etag(jsonify(cached_analytics(user_id, 'report', month, build_report, etag)), etag)
         
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         logger.error(f"Error generating report: {e}")
         return jsonify({'error': 'Failed to generate report'}), 500
 
+def load_trends(user_id, params):
+    """Spending series for parsed trend params (one date-range query)"""
+    start_date, end_date = params['start_date'], params['end_date']
+    expenses = storage.list_expense_columns(user_id, start_date, end_date)
+    
+    trends = build_trends(expenses, start_date, end_date, params['granularity'])
+    trends['start_month'] = params['start_month']
+    trends['end_month'] = params['end_month']
+    return trends
+
+@app.route('/api/trends/<user_id>', methods=['GET'])
+@require_auth
+def get_trends(user_id):
+    """Get spending series over a range of months (one date-range query)"""
+    try:
+        params, error = parse_trend_params(request.args, get_current_month())
+        if error:
+            return jsonify({'error': error}), 400
+        start_date, end_date = params['start_date'], params['end_date']
+        
+        etag = data_etag(user_id, month_keys(start_date, end_date))
+        cached_response = not_modified(etag)
+        if cached_response:
+            return cached_response
+        
+        # Identical requests for the same data version share one computation
+        key = ('trends', params['start_month'], params['end_month'], params['granularity'], etag)
+        trends = analytics_flight.do(user_id, key, load_trends, user_id, params)
+        return with_etag(jsonify(trends), etag)
+        
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        logger.error(f"Error getting trends: {e}")
+        return jsonify({'error': 'Failed to generate trends'}), 500
+
+# DASHBOARD ROUTE
+ANALYTICS_BUILDERS = {'summary': build_summary, 'report': build_report}
+
+def load_dashboard(user_id, month, start_date, end_date, sections, etag):
+    """
+    Build the requested dashboard sections. The month's expenses and budgets
+    are each read at most once (concurrently); summary and report come from
+    the result cache when possible, and on a miss share one read of the
+    rollup and budgets with concurrent requests for the same month and data
+    version (etag), as in cached_analytics.
+    """
+    dashboard = {'month': month}
+    missing = []
+    for endpoint in ('summary', 'report'):
+        if endpoint in sections:
+            payload = result_cache.get(user_id, endpoint, month, etag)
+            if payload is None:
+                missing.append(endpoint)
+            else:
+                dashboard[endpoint] = payload
+    
+    expenses_future = None
+    if 'expenses' in sections:
+        expenses_future = submit_query(storage.list_expenses, user_id, start_date, end_date)
+    budgets_future = None
+    if 'budgets' in sections:
+        budgets_future = submit_query(storage.list_budgets, user_id, month)
+    if missing:
+        analytics = analytics_flight.do(user_id, ('month', month, etag), load_month_analytics, user_id, month)
+        for endpoint in missing:
+            dashboard[endpoint] = ANALYTICS_BUILDERS[endpoint](month, *analytics)
+            result_cache.set(user_id, endpoint, month, etag, dashboard[endpoint])
+    
+    if budgets_future:
+        dashboard['budgets'] = budgets_payload(month, budgets_future.result())
+    if expenses_future:
+        dashboard['expenses'] = expenses_payload(month, expenses_future.result())
+    return dashboard
+
+@app.route('/api/users/<user_id>/dashboard', methods=['GET'])
+@require_auth
+def get_dashboard(user_id):
+    """
+    Expenses, budgets, summary and report for a month in one response
+    (include=expenses,budgets,summary,report selects a subset), with the
+    same payloads as the individual endpoints and one ETag for all of them
+    """
+    try:
+        month = request.args.get('month', get_current_month())
+        start_date, end_date = get_month_range(month)
+        if not start_date or not end_date:
+            return jsonify({'error': 'Invalid month format. Use YYYY-MM'}), 400
+        
+        sections, error = parse_dashboard_sections(request.args.get('include'))
+        if error:
+            return jsonify({'error': error}), 400
+        
+        etag = data_etag(user_id, [month])
+        cached_response = not_modified(etag)
+        if cached_response:
+            return cached_response
+        
+        return with_etag(jsonify(load_dashboard(user_id, month, start_date, end_date, sections, etag)), etag)
+        
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        logger.error(f"Error loading dashboard: {e}")
+        return jsonify({'error': 'Failed to load dashboard'}), 500
+
+# LIVE STATUS ROUTE
+def load_live_status(user_id, month):
+    """
+    Current live status of a month, read from storage: the result cache is
+    only invalidated after the write that triggered the refresh returns
+    """
+    return live_status(month, load_rollup(user_id, month), storage.list_budgets(user_id, month, ANALYTICS_BUDGET_FIELDS))
+
+# One storage listener and one refresh per change for all streams of a user's month
+live_hub = LiveStatusHub(storage, load_live_status, query_executor)
+metrics.add_collector(lambda: stats_gauges('live_status', 'Live status streams', live_hub.stats()))
+
+@app.route('/api/summary/<user_id>/<month>/events', methods=['GET'])
+@require_auth
+def stream_live_status(user_id, month):
+    """
+    Server-Sent Events for a month: a 'status' event, then a 'delta' (JSON
+    Merge Patch of the status) after every expense or budget change. The
+    stream ends when the ID token expires; the client reconnects with a new one.
+    """
+    try:
+        start_date, end_date = get_month_range(month)
+        if not start_date or not end_date:
+            return jsonify({'error': 'Invalid month format. Use YYYY-MM'}), 400
+        
+        expires_at = request.user.get('exp')
+        
+        def generate():
+            # Subscribed on the first read, so an unsent response leaves no subscriber behind
+            subscriber = live_hub.subscribe(user_id, month)
+            try:
+                yield SSE_RETRY
+                while not expires_at or time.time() < expires_at:
+                    try:
+                        yield subscriber.get(timeout=LIVE_HEARTBEAT)
+                    except queue.Empty:
+                        # Also how a closed connection is noticed
+                        yield SSE_HEARTBEAT
+            finally:
+                live_hub.unsubscribe(user_id, month, subscriber)
+        
+        response = Response(generate(), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        # Stop reverse proxies (nginx) from buffering the stream
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+        
+    except Exception as e:
+        logger.error(f"Error opening live status stream: {e}")
+        return jsonify({'error': 'Failed to open live status stream'}), 500
+
+# EXPORT ROUTE
+def iter_export_pages(user_id, params):
+    """Pages of the expenses or budgets to export, read as the response is sent"""
+    start_date, end_date = params['start_date'], params['end_date']
+    if params['dataset'] == 'expenses':
+        yield from iter_expense_pages(storage, user_id, start_date, end_date)
+        return
+    
+    # A user has a handful of budgets per month, so they are read in one query
+    budgets = budgets_in_range(storage.list_budgets(user_id, None), start_date, end_date)
+    for index in range(0, len(budgets), EXPORT_PAGE_SIZE):
+        yield budgets[index:index + EXPORT_PAGE_SIZE]
+
+@app.route('/api/users/<user_id>/export', methods=['GET'])
+@require_auth
+def export_data(user_id):
+    """
+    Stream a user's expenses or budgets (dataset) for the whole history or a
+    start/end date range as CSV or Parquet (format)
+    """
+    try:
+        params, error = parse_export_params(request.args)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        export = new_export(params['dataset'], params['format'])
+        
+        def generate():
+            try:
+                yield export.begin()
+                for page in iter_export_pages(user_id, params):
+                    chunk = export.write(page)
+                    if chunk:
+                        yield chunk
+                yield export.finish()
+            except Exception as e:
+                # Abort the transfer rather than end a truncated file cleanly
+                logger.error(f"Error streaming export: {e}")
+                raise
+        
+        response = Response(stream_with_context(generate()), mimetype=EXPORT_MIMETYPES[params['format']])
+        response.headers['Content-Disposition'] = f'attachment; filename="{export_filename(params)}"'
+        response.headers['Cache-Control'] = 'private, no-store'
+        return response
+        
+    except Exception as e:
+        logger.error(f"Error exporting data: {e}")
+        return jsonify({'error': 'Failed to export data'}), 500
+
+# MAINTENANCE COMMANDS
+@app.cli.command('rebuild-rollups')
+@click.option('--user', 'user_ids', multiple=True, help='User id to rebuild (default: all users)')
+@click.option('--month', help='Only rebuild this month (YYYY-MM)')
+def rebuild_rollups_command(user_ids, month):
+    """Recompute monthly rollups from raw expenses"""
+    if month and not all(get_month_range(month)):
+        raise click.BadParameter('Use YYYY-MM', param_hint='--month')
+    
+    for user_id in user_ids or storage.list_user_ids():
+        if month:
+            storage.rebuild_rollup(user_id, month)
+            months = [month]
+        else:
+            months = storage.rebuild_rollups(user_id)
+        click.echo(f"{user_id}: rebuilt {len(months)} month(s)")
+
+@app.cli.command('migrate-budget-ids')
+@click.option('--user', 'user_ids', multiple=True, help='User id to migrate (default: all users)')
+def migrate_budget_ids_command(user_ids):
+    """Move budgets to ids derived from month and category, dropping duplicates"""
+    for user_id in user_ids or storage.list_user_ids():
+        removed = storage.migrate_budget_ids(user_id)
+        click.echo(f"{user_id}: migrated {len(removed)} budget(s)")
+
+@app.cli.command('migrate-amounts')
+@click.option('--user', 'user_ids', multiple=True, help='User id to migrate (default: all users)')
+def migrate_amounts_command(user_ids):
+    """Store amounts as integer cents on documents written before, then rebuild the rollups"""
+    for user_id in user_ids or storage.list_user_ids():
+        updated = storage.migrate_amounts(user_id)
+        months = storage.rebuild_rollups(user_id)
+        click.echo(f"{user_id}: migrated {updated} document(s), rebuilt {len(months)} month(s)")
+
+@app.cli.command('rebuild-search-index')
+@click.option('--user', 'user_ids', multiple=True, help='User id to rebuild (default: all users)')
+def rebuild_search_index_command(user_ids):
+    """Recompute the expense note/category search index from raw expenses"""
+    for user_id in user_ids or storage.list_user_ids():
+        entries = storage.rebuild_search_index(user_id)
+        click.echo(f"{user_id}: rebuilt {entries} index entries")
+
+@app.cli.command('materialize-recurring')
+@click.option('--date', 'until', help='Materialize occurrences up to this day (YYYY-MM-DD, default: today)')
+def materialize_recurring_command(until):
+    """Write the due occurrences of every user's recurring expenses (e.g. from cron)"""
+    today = None
+    if until:
+        today = parse_date(until)
+        if not today:
+            raise click.BadParameter('Use YYYY-MM-DD', param_hint='--date')
+    
+    report = recurring_scheduler.run(today)
+    click.echo(f"{report['expenses']} expense(s) written for {report['users']} user(s), "
+               f"{report['failed']} failed, {report['deferred']} deferred to the next run")
+
+@app.cli.command('aggregate-stats')
+@click.option('--shards', default=STATS_SHARDS, show_default=True, help='User ranges to split a new run into')
+@click.option('--workers', default=STATS_WORKERS, show_default=True, help='Worker processes')
+@click.option('--restart', is_flag=True, help='Discard the checkpoints of an unfinished run')
+def aggregate_stats_command(shards, workers, restart):
+    """Compute fleet-wide monthly statistics into the stats collection"""
+    job = StatsJob(storage, STORAGE_BACKEND, shards, workers,
+                   on_shard=lambda shard, total: click.echo(f"shard {shard + 1}/{total} done"))
+    report = job.run(restart)
+    if report['failed']:
+        raise click.ClickException(
+            f"{report['failed']} of {report['shards']} shard(s) failed; run again to resume"
+        )
+    click.echo(f"{report['months']} month(s) written from {report['shards']} shard(s) "
+               f"({report['resumed']} resumed from checkpoints)")
+
 # Run the application
 if __name__ == '__main__':
     # Check if service account key exists
-    if not os.path.exists('serviceAccountKey.json'):
-        logger.error("serviceAccountKey.json not found. Please add your Firebase service account key.")
+    if STORAGE_BACKEND == 'firestore' and not os.path.exists(firebase.credentials_path):
+        logger.error(f"{firebase.credentials_path} not found. Please add your Firebase service account key.")
         exit(1)
     
+    warm_up()
     logger.info("Starting Finance Tracker Backend on http://localhost:5000")
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,946 @@
+"""
+Finance Tracker Backend - async ASGI app
+
+Serves the same routes, auth checks and JSON payloads as app.py, but on
+Quart with the async storage backends (firestore.AsyncClient for Firestore),
+so a request waiting on Firestore holds no worker thread. Run with an ASGI
+server, e.g.:
+
+    hypercorn asgi:app --bind 0.0.0.0:5000
+"""
+
+from quart import Quart, Response, g, request, jsonify
+from quart.json.provider import JSONProvider
+from quart.wrappers.response import DataBody
+from quart_cors import cors
+from datetime import datetime
+from functools import wraps
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from analytics import build_report, build_summary, build_trends, month_key
+from async_storage import create_async_storage
+from export import (
+    EXPORT_MIMETYPES, EXPORT_PAGE_SIZE, aiter_expense_pages, budgets_in_range, export_filename, new_export
+)
+from firebase_app import READINESS_TIMEOUT, Readiness, firebase
+from helpers import (
+    ANALYTICS_BUDGET_FIELDS, DEFAULT_PAGE_SIZE, IMPORT_MIMETYPES, MAX_PAGE_SIZE,
+    budgets_payload, decode_cursor, encode_cursor, expenses_payload, get_current_month, get_month_range,
+    iter_import_batches, month_keys, new_import_report, parse_dashboard_sections, parse_expense_filters,
+    parse_export_params, parse_trend_params, record_import_batch, record_import_error, validate_budget,
+    validate_expense, validate_expense_update, validate_recurring_rule, validate_recurring_update, versions_etag
+)
+from live_status import LIVE_HEARTBEAT, SSE_HEARTBEAT, SSE_RETRY, AsyncLiveStatusHub, live_status
+from metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE, InstrumentedAsyncStorage, InstrumentedStorage, create_metrics, stats_gauges
+)
+from responses import OrjsonProvider, compress, compressible, encode_json, negotiate_encoding
+from recurring import RecurringScheduler, materialize_user, today_utc
+from result_cache import create_result_cache
+from single_flight import AsyncSingleFlight, Overloaded
+from storage import create_storage
+from token_cache import TokenCache
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Initialize Quart app
+app = cors(Quart(__name__), allow_origin="http://localhost:3000")  # Allow frontend access
+
+class AppJSONProvider(OrjsonProvider, JSONProvider):
+    """orjson encoding for jsonify and request.get_json (datetimes as ISO 8601)"""
+
+app.json = AppJSONProvider(app)
+
+# Storage backend: firestore (default), memory or sqlite
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'firestore').lower()
+
+# The Firebase Admin SDK and Firestore AsyncClient are initialized on first
+# use, once per process (see firebase_app); warm_up() runs before serving
+
+# Request, auth and storage metrics served at /metrics
+metrics = create_metrics()
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+storage = InstrumentedAsyncStorage(create_async_storage(STORAGE_BACKEND), metrics)
+logger.info(f"Using async {storage.name} storage backend")
+
+# Cached summary/report payloads, valid for the data version they were computed for
+result_cache = create_result_cache()
+
+# Decoded ID tokens, reused until their 'exp' claim
+token_cache = TokenCache(max_size=int(os.environ.get('TOKEN_CACHE_SIZE', 1024)))
+metrics.add_collector(lambda: stats_gauges('token_cache', 'ID token cache', token_cache.stats()))
+metrics.add_collector(lambda: stats_gauges('result_cache', 'Analytics result cache', result_cache.stats()))
+
+# Identical analytics queries in flight are run once; each user gets a few
+# query slots and a bounded queue (see single_flight)
+analytics_flight = AsyncSingleFlight()
+metrics.add_collector(lambda: stats_gauges('analytics_flight', 'Analytics query coalescing', analytics_flight.stats()))
+
+# Result of the last readiness check, reported by /health
+readiness = Readiness()
+
+# Helper Functions
+async def check_readiness(force=False):
+    """
+    Check that Firebase is initialized and storage is reachable. The result
+    is reused for READINESS_TTL seconds unless force is set.
+    """
+    if force or readiness.stale():
+        try:
+            await asyncio.to_thread(firebase.app)
+            await asyncio.wait_for(storage.ping(), READINESS_TIMEOUT)
+            readiness.record()
+        except asyncio.TimeoutError:
+            logger.error("Readiness check failed: storage did not answer in time")
+            readiness.record(f"Storage did not answer within {READINESS_TIMEOUT:g} s")
+        except Exception as e:
+            logger.error(f"Readiness check failed: {e}")
+            readiness.record(e)
+    return readiness.ready
+
+@app.before_serving
+async def warm_up():
+    """Initialize Firebase and the storage connection in each worker before it takes requests"""
+    started = time.perf_counter()
+    ready = await check_readiness(force=True)
+    logger.info(f"Warm-up {'succeeded' if ready else 'failed'} in {(time.perf_counter() - started) * 1000:.0f} ms")
+    # Background materialization of recurring expenses, if RECURRING_INTERVAL is set
+    recurring_scheduler.start()
+
+async def cache_call(method, *args):
+    """Run a result cache operation; network backends (Redis) are moved off the event loop"""
+    if result_cache.backend.name == 'memory':
+        return method(*args)
+    return await asyncio.to_thread(method, *args)
+
+async def verify_firebase_token(token):
+    """
+    Verify Firebase ID token and return user info
+    """
+    started = time.perf_counter()
+    outcome = 'failed'
+    try:
+        # Remove 'Bearer ' prefix if present
+        if token.startswith('Bearer '):
+            token = token[7:]
+
+        # Reuse a previous verification of the same token
+        decoded_token = token_cache.get(token)
+        if decoded_token is not None:
+            outcome = 'cached'
+            return decoded_token
+
+        # Verification may fetch Google's public keys, so keep it off the event loop
+        decoded_token = await asyncio.to_thread(firebase.verify_id_token, token)
+        token_cache.put(token, decoded_token)
+        outcome = 'verified'
+        return decoded_token
+    except Exception as e:
+        logger.error(f"Token verification failed: {e}")
+        return None
+    finally:
+        metrics.record_auth(outcome, time.perf_counter() - started)
+
+def require_auth(f):
+    """
+    Decorator to require authentication for protected routes
+    """
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        # Get token from Authorization header
+        auth_header = request.headers.get('Authorization')
+        if not auth_header:
+            return jsonify({'error': 'Authorization header missing'}), 401
+
+        # Verify token
+        decoded_token = await verify_firebase_token(auth_header)
+        if not decoded_token:
+            return jsonify({'error': 'Invalid or expired token'}), 401
+
+        # Check if user_id in URL matches token
+        user_id = kwargs.get('user_id')
+        if user_id and user_id != decoded_token['uid']:
+            return jsonify({'error': 'Unauthorized access to user data'}), 403
+
+        # Add user info to request context
+        request.user = decoded_token
+        return await f(*args, **kwargs)
+
+    return decorated_function
+
+async def data_etag(user_id, months):
+    """Weak ETag for a response built from a user's data in the given months"""
+    return versions_etag(user_id, await storage.get_versions(user_id, months))
+
+def with_etag(response, etag):
+    """Attach an ETag and make clients revalidate before reusing the response"""
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def not_modified(etag):
+    """304 response if the client's If-None-Match already matches etag, else None"""
+    if request.if_none_match.contains_weak(etag):
+        return with_etag(Response('', status=304), etag)
+    return None
+
+def overloaded_response(error):
+    """429 asking the client to retry after error.retry_after seconds"""
+    response = jsonify({'error': 'Too many concurrent analytics requests, retry shortly'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+# Request Metrics
+@app.before_request
+async def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.request_timing = metrics.start_request()
+
+@app.after_request
+async def record_request_metrics(response):
+    # Label by route pattern, not path, so user ids do not create new series
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.finish_request(request.method, route, response.status_code, time.perf_counter() - g.request_started)
+    if g.request_timing is not None:
+        response.headers['Server-Timing'] = g.request_timing.header()
+    return response
+
+@app.teardown_request
+async def end_request_metrics(error=None):
+    metrics.end_request()
+
+# Response Compression
+@app.after_request
+async def compress_response(response):
+    """Compress large JSON/text bodies with the client's preferred encoding (br or gzip)"""
+    if not isinstance(response.response, DataBody) or 'Content-Encoding' in response.headers:
+        return response
+    if not compressible(response.mimetype, response.content_length):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding:
+        data = await response.get_data()
+        response.set_data(await asyncio.to_thread(compress, data, encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+# Error Handlers
+@app.errorhandler(404)
+async def not_found(error):
+    return jsonify({'error': 'Resource not found'}), 404
+
+@app.errorhandler(500)
+async def internal_error(error):
+    return jsonify({'error': 'Internal server error'}), 500
+
+# Health Check Route
+@app.route('/health', methods=['GET'])
+async def health_check():
+    """
+    Health check endpoint. 'ready' tells whether Firebase and storage are
+    reachable; with ?ready=1 the response is 503 while they are not.
+    """
+    ready = await check_readiness()
+    return jsonify({
+        'status': 'healthy',
+        'ready': ready,
+        'readiness_error': readiness.error,
+        'timestamp': datetime.now().isoformat(),
+        'service': 'Finance Tracker Backend',
+        'mode': 'asgi',
+        'firebase': firebase.status(),
+        'token_cache': token_cache.stats(),
+        'result_cache': result_cache.stats(),
+        'analytics_flight': analytics_flight.stats(),
+        'live_status': live_hub.stats(),
+        'recurring': recurring_scheduler.stats()
+    }), 503 if request.args.get('ready') and not ready else 200
+
+@app.route('/metrics', methods=['GET'])
+async def get_metrics():
+    """Prometheus metrics (requires 'Bearer <METRICS_TOKEN>' when METRICS_TOKEN is set)"""
+    if METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}":
+        return jsonify({'error': 'Invalid metrics token'}), 401
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+# EXPENSE ROUTES
+async def iter_filtered_expenses(user_id, start_date, end_date, filters, start_after):
+    """Filtered expenses as an async iterator, like storage.iter_expenses"""
+    for expense_data in await storage.query_expenses(user_id, start_date, end_date, filters, start_after=start_after):
+        yield expense_data
+
+@app.route('/api/users/<user_id>/expenses', methods=['GET'])
+@require_auth
+async def get_expenses(user_id):
+    """
+    Get all expenses for current month or specified month.
+    Supports cursor pagination (page_size, start_after), NDJSON streaming
+    (stream=1), filters (category, min_amount, max_amount, sort, q) and
+    If-None-Match, as in app.py.
+    """
+    try:
+        # Get month parameter (default to current month)
+        month = request.args.get('month', get_current_month())
+        start_date, end_date = get_month_range(month)
+
+        if not start_date or not end_date:
+            return jsonify({'error': 'Invalid month format. Use YYYY-MM'}), 400
+
+        filters, error = parse_expense_filters(request.args)
+        if error:
+            return jsonify({'error': error}), 400
+        sort = filters['sort'] if filters else 'date'
+
+        # Resume after the last expense of the previous page
+        start_after = None
+        cursor = request.args.get('start_after')
+        if cursor:
+            start_after = decode_cursor(cursor, sort)
+            if not start_after:
+                return jsonify({'error': 'Invalid start_after cursor'}), 400
+
+        # Skip the query entirely if the client's copy is current
+        etag = await data_etag(user_id, [month])
+        cached_response = not_modified(etag)
+        if cached_response:
+            return cached_response
+
+        # Streaming mode: one expense per line, sent as documents are read
+        if request.args.get('stream', '').lower() in ('1', 'true', 'ndjson'):
+            if filters:
+                expenses = iter_filtered_expenses(user_id, start_date, end_date, filters, start_after)
+            else:
+                expenses = storage.iter_expenses(user_id, start_date, end_date, start_after)
+
+            async def generate():
+                try:
+                    async for expense_data in expenses:
+                        yield encode_json(expense_data) + b'\n'
+                except Exception as e:
+                    logger.error(f"Error streaming expenses: {e}")
+                    yield encode_json({'error': 'Failed to retrieve expenses'}) + b'\n'
+
+            return with_etag(Response(generate(), mimetype='application/x-ndjson'), etag)
+
+        # Paginated mode
+        page_size = request.args.get('page_size')
+        if page_size is not None or start_after:
+            try:
+                page_size = int(page_size or DEFAULT_PAGE_SIZE)
+            except ValueError:
+                page_size = 0
+            if not 1 <= page_size <= MAX_PAGE_SIZE:
+                return jsonify({'error': f'page_size must be between 1 and {MAX_PAGE_SIZE}'}), 400
+
+            # Fetch one extra document to know whether another page exists
+            if filters:
+                page = await storage.query_expenses(user_id, start_date, end_date, filters, page_size + 1, start_after)
+            else:
+                page = await storage.page_expenses(user_id, start_date, end_date, page_size + 1, start_after)
+            next_cursor = encode_cursor(page[page_size - 1], sort) if len(page) > page_size else None
+            expense_list = page[:page_size]
+
+            return with_etag(jsonify({
+                'expenses': expense_list,
+                'month': month,
+                'total_count': len(expense_list),
+                'page_size': page_size,
+                'next_cursor': next_cursor
+            }), etag)
+
+        # Query storage for expenses in date range
+        if filters:
+            expenses = await storage.query_expenses(user_id, start_date, end_date, filters)
+        else:
+            expenses = await storage.list_expenses(user_id, start_date, end_date)
+
+        return with_etag(jsonify(expenses_payload(month, expenses)), etag)
+
+    except Exception as e:
+        logger.error(f"Error getting expenses: {e}")
+        return jsonify({'error': 'Failed to retrieve expenses'}), 500
+
+@app.route('/api/users/<user_id>/expenses', methods=['POST'])
+@require_auth
+async def add_expense(user_id):
+    """Add new expense"""
+    try:
+        data = await request.get_json()
+
+        # Validate and create expense document
+        expense_data, error = validate_expense(data)
+        if error:
+            return jsonify({'error': error}), 400
+
+        # Add to storage
+        expense_id = await storage.add_expense(user_id, expense_data)
+        await cache_call(result_cache.invalidate, user_id, [month_key(expense_data['date'])])
+
+        # Return created expense with ID
+        expense_data['id'] = expense_id
+
+        return jsonify({
+            'message': 'Expense added successfully',
+            'expense': expense_data
+        }), 201
+
+    except Exception as e:
+        logger.error(f"Error adding expense: {e}")
+        return jsonify({'error': 'Failed to add expense'}), 500
+
+@app.route('/api/users/<user_id>/expenses/import', methods=['POST'])
+@require_auth
+async def import_expenses(user_id):
+    """Bulk import expenses from a CSV or NDJSON upload"""
+    try:
+        import_format = request.args.get('format') or IMPORT_MIMETYPES.get(request.mimetype)
+        if import_format not in ('csv', 'ndjson'):
+            return jsonify({'error': 'Unsupported import format. Use CSV or NDJSON'}), 400
+
+        upload_key = request.headers.get('Idempotency-Key', '').strip()
+        report = new_import_report()
+        touched_months = set()
+
+        with tempfile.TemporaryFile() as upload:
+            # Spool the body as it arrives, then parse it off the event loop
+            async for chunk in request.body:
+                upload.write(chunk)
+            upload.seek(0)
+
+            batches = iter_import_batches(user_id, upload, import_format, upload_key, report)
+            while True:
+                batch = await asyncio.to_thread(next, batches, None)
+                if batch is None:
+                    break
+                try:
+                    written = await storage.add_expenses(user_id, [(doc_id, data) for _, doc_id, data in batch])
+                    record_import_batch(report, batch, written)
+                    touched_months.update(month_key(data['date']) for _, _, data in batch)
+                except Exception as e:
+                    # Keep going; a retry with the same keys fills in these rows
+                    logger.error(f"Error writing import batch: {e}")
+                    for row_number, _, _ in batch:
+                        record_import_error(report, row_number, 'Failed to save row')
+
+        await cache_call(result_cache.invalidate, user_id, touched_months)
+        return jsonify(report)
+
+    except UnicodeDecodeError:
+        return jsonify({'error': 'Upload must be UTF-8 encoded'}), 400
+    except Exception as e:
+        logger.error(f"Error importing expenses: {e}")
+        return jsonify({'error': 'Failed to import expenses'}), 500
+
+@app.route('/api/users/<user_id>/expenses/<expense_id>', methods=['PUT'])
+@require_auth
+async def update_expense(user_id, expense_id):
+    """Update existing expense"""
+    try:
+        data = await request.get_json()
+
+        # Validate and prepare update data
+        update_data, error = validate_expense_update(data)
+        if error:
+            return jsonify({'error': error}), 400
+
+        # Update in storage; the merged document comes back with the write
+        result = await storage.update_expense(user_id, expense_id, update_data)
+        if result is None:
+            return jsonify({'error': 'Expense not found'}), 404
+        existing, updated_data = result
+        await cache_call(result_cache.invalidate, user_id, [month_key(existing['date']), month_key(updated_data['date'])])
+
+        return jsonify({
+            'message': 'Expense updated successfully',
+            'expense': updated_data
+        })
+
+    except Exception as e:
+        logger.error(f"Error updating expense: {e}")
+        return jsonify({'error': 'Failed to update expense'}), 500
+
+@app.route('/api/users/<user_id>/expenses/<expense_id>', methods=['DELETE'])
+@require_auth
+async def delete_expense(user_id, expense_id):
+    """Delete expense"""
+    try:
+        existing = await storage.delete_expense(user_id, expense_id)
+        if existing is None:
+            return jsonify({'error': 'Expense not found'}), 404
+        await cache_call(result_cache.invalidate, user_id, [month_key(existing['date'])])
+
+        return jsonify({'message': 'Expense deleted successfully'})
+
+    except Exception as e:
+        logger.error(f"Error deleting expense: {e}")
+        return jsonify({'error': 'Failed to delete expense'}), 500
+
+# BUDGET ROUTES
+@app.route('/api/users/<user_id>/budgets', methods=['GET'])
+@require_auth
+async def get_budgets(user_id):
+    """Get budgets for current or specified month"""
+    try:
+        # Get month parameter (default to current month)
+        month = request.args.get('month', get_current_month())
+        start_date, _ = get_month_range(month)
+        if not start_date:
+            return jsonify({'error': 'Invalid month format. Use YYYY-MM'}), 400
+
+        etag = await data_etag(user_id, [month])
+        cached_response = not_modified(etag)
+        if cached_response:
+            return cached_response
+
+        budgets = await storage.list_budgets(user_id, month)
+
+        return with_etag(jsonify(budgets_payload(month, budgets)), etag)
+
+    except Exception as e:
+        logger.error(f"Error getting budgets: {e}")
+        return jsonify({'error': 'Failed to retrieve budgets'}), 500
+
+@app.route('/api/users/<user_id>/budgets', methods=['POST'])
+@require_auth
+async def set_budget(user_id):
+    """Set or update budget"""
+    try:
+        data = await request.get_json()
+
+        # Validate and create budget document
+        budget_data, error = validate_budget(data)
+        if error:
+            return jsonify({'error': error}), 400
+
+        # One upsert keyed by month and category
+        budget_id, created = await storage.upsert_budget(user_id, budget_data)
+        await cache_call(result_cache.invalidate, user_id, [budget_data['month']])
+
+        # Return created/updated budget with ID
+        budget_data['id'] = budget_id
+        if created:
+            message = 'Budget created successfully'
+        else:
+            # The stored created_at is left untouched on update
+            message = 'Budget updated successfully'
+            del budget_data['created_at']
+
+        return jsonify({
+            'message': message,
+            'budget': budget_data
+        }), 201 if created else 200
+
+    except Exception as e:
+        logger.error(f"Error setting budget: {e}")
+        return jsonify({'error': 'Failed to set budget'}), 500
+
+@app.route('/api/users/<user_id>/budgets/<budget_id>', methods=['DELETE'])
+@require_auth
+async def delete_budget(user_id, budget_id):
+    """Delete budget"""
+    try:
+        month = await storage.delete_budget(user_id, budget_id)
+        if month is None:
+            return jsonify({'error': 'Budget not found'}), 404
+        await cache_call(result_cache.invalidate, user_id, [month])
+
+        return jsonify({'message': 'Budget deleted successfully'})
+
+    except Exception as e:
+        logger.error(f"Error deleting budget: {e}")
+        return jsonify({'error': 'Failed to delete budget'}), 500
+
+# RECURRING EXPENSE ROUTES
+# Due occurrences are written by the same thread-based scheduler as in
+# app.py, on a synchronous storage: the one the memory and SQLite backends
+# wrap, or a Firestore (sync Client) storage
+recurring_storage = InstrumentedStorage(
+    getattr(storage.storage, 'storage', None) or create_storage(STORAGE_BACKEND), metrics
+)
+recurring_scheduler = RecurringScheduler(recurring_storage, on_written=result_cache.invalidate)
+metrics.add_collector(lambda: stats_gauges('recurring', 'Recurring expense scheduler', recurring_scheduler.stats()))
+
+@app.route('/api/users/<user_id>/recurring', methods=['GET'])
+@require_auth
+async def get_recurring_rules(user_id):
+    """Get the user's recurring expense rules"""
+    try:
+        rules = await storage.list_recurring_rules(user_id)
+        rules.sort(key=lambda rule: rule['created_at'])
+
+        return jsonify({'recurring': rules, 'count': len(rules)})
+
+    except Exception as e:
+        logger.error(f"Error getting recurring expenses: {e}")
+        return jsonify({'error': 'Failed to retrieve recurring expenses'}), 500
+
+@app.route('/api/users/<user_id>/recurring', methods=['POST'])
+@require_auth
+async def add_recurring_rule(user_id):
+    """
+    Create a recurring expense rule. Occurrences already due (start_date
+    today or in the past) are written right away; later ones by the scheduler.
+    """
+    try:
+        data = await request.get_json()
+
+        rule_data, error = validate_recurring_rule(data)
+        if error:
+            return jsonify({'error': error}), 400
+
+        rule = dict(rule_data, id=await storage.add_recurring_rule(user_id, rule_data))
+        written, months = await asyncio.to_thread(materialize_user, recurring_storage, user_id, [rule], today_utc())
+        await cache_call(result_cache.invalidate, user_id, months)
+
+        return jsonify({
+            'message': 'Recurring expense created successfully',
+            'recurring': rule,
+            'expenses_created': len(written)
+        }), 201
+
+    except Exception as e:
+        logger.error(f"Error adding recurring expense: {e}")
+        return jsonify({'error': 'Failed to add recurring expense'}), 500
+
+@app.route('/api/users/<user_id>/recurring/<rule_id>', methods=['PUT'])
+@require_auth
+async def update_recurring_rule(user_id, rule_id):
+    """Update a rule's amount, category, note or end_date (future occurrences only)"""
+    try:
+        data = await request.get_json()
+
+        rule = await storage.get_recurring_rule(user_id, rule_id)
+        if rule is None:
+            return jsonify({'error': 'Recurring expense not found'}), 404
+
+        update_data, error = validate_recurring_update(data, rule)
+        if error:
+            return jsonify({'error': error}), 400
+
+        rule = await storage.update_recurring_rule(user_id, rule_id, update_data)
+        if rule is None:
+            return jsonify({'error': 'Recurring expense not found'}), 404
+
+        return jsonify({
+            'message': 'Recurring expense updated successfully',
+            'recurring': rule
+        })
+
+    except Exception as e:
+        logger.error(f"Error updating recurring expense: {e}")
+        return jsonify({'error': 'Failed to update recurring expense'}), 500
+
+@app.route('/api/users/<user_id>/recurring/<rule_id>', methods=['DELETE'])
+@require_auth
+async def delete_recurring_rule(user_id, rule_id):
+    """Delete a rule; expenses it already created are kept"""
+    try:
+        if not await storage.delete_recurring_rule(user_id, rule_id):
+            return jsonify({'error': 'Recurring expense not found'}), 404
+
+        return jsonify({'message': 'Recurring expense deleted successfully'})
+
+    except Exception as e:
+        logger.error(f"Error deleting recurring expense: {e}")
+        return jsonify({'error': 'Failed to delete recurring expense'}), 500
+
+# ANALYTICS ROUTES
+async def load_rollup(user_id, month):
+    """Get a month's rollup, building it from raw expenses on first use"""
+    rollup = await storage.get_rollup(user_id, month)
+    if rollup is None:
+        rollup = await storage.rebuild_rollup(user_id, month, bump_version=False)
+    return rollup
+
+async def load_month_analytics(user_id, month):
+    """Fetch a month's rollup and budgets concurrently"""
+    return await asyncio.gather(
+        load_rollup(user_id, month),
+        storage.list_budgets(user_id, month, ANALYTICS_BUDGET_FIELDS)
+    )
+
+async def cached_analytics(user_id, endpoint, month, build, etag):
+    """
+    Return a cached analytics payload, computing it with build(month, rollup,
+    budgets) on a miss. Concurrent misses for the same month and data version
+    (etag) share one read of the rollup and budgets.
+    """
+    payload = await cache_call(result_cache.get, user_id, endpoint, month, etag)
+    if payload is None:
+        analytics = await analytics_flight.do(user_id, ('month', month, etag), load_month_analytics, user_id, month)
+        payload = build(month, *analytics)
+        await cache_call(result_cache.set, user_id, endpoint, month, etag, payload)
+    return payload
+
+@app.route('/api/summary/<user_id>/<month>', methods=['GET'])
+@require_auth
+async def get_summary(user_id, month):
+    """Get financial summary for specified month"""
+    try:
+        start_date, end_date = get_month_range(month)
+        if not start_date or not end_date:
+            return jsonify({'error': 'Invalid month format. Use YYYY-MM'}), 400
+
+        etag = await data_etag(user_id, [month])
+        cached_response = not_modified(etag)
+        if cached_response:
+            return cached_response
+
+        return with_etag(jsonify(await cached_analytics(user_id, 'summary', month, build_summary, etag)), etag)
+
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        logger.error(f"Error getting summary: {e}")
+        return jsonify({'error': 'Failed to generate summary'}), 500
+
+@app.route('/api/report/<user_id>/<month>', methods=['GET'])
+@require_auth
+async def get_report(user_id, month):
+    """Get detailed report for specified month"""
+    try:
+        start_date, end_date = get_month_range(month)
+        if not start_date or not end_date:
+            return jsonify({'error': 'Invalid month format. Use YYYY-MM'}), 400
+
+        etag = await data_etag(user_id, [month])
+        cached_response = not_modified(etag)
+        if cached_response:
+            return cached_response
+
+        return with_etag(jsonify(await cached_analytics(user_id, 'report', month, build_report, etag)), etag)
+
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        logger.error(f"Error generating report: {e}")
+        return jsonify({'error': 'Failed to generate report'}), 500
+
+async def load_trends(user_id, params):
+    """Spending series for parsed trend params (one date-range query)"""
+    start_date, end_date = params['start_date'], params['end_date']
+    expenses = await storage.list_expense_columns(user_id, start_date, end_date)
+
+    # Bucketing is CPU-bound; keep it off the event loop for long ranges
+    trends = await asyncio.to_thread(build_trends, expenses, start_date, end_date, params['granularity'])
+    trends['start_month'] = params['start_month']
+    trends['end_month'] = params['end_month']
+    return trends
+
+@app.route('/api/trends/<user_id>', methods=['GET'])
+@require_auth
+async def get_trends(user_id):
+    """Get spending series over a range of months (one date-range query)"""
+    try:
+        params, error = parse_trend_params(request.args, get_current_month())
+        if error:
+            return jsonify({'error': error}), 400
+        start_date, end_date = params['start_date'], params['end_date']
+
+        etag = await data_etag(user_id, month_keys(start_date, end_date))
+        cached_response = not_modified(etag)
+        if cached_response:
+            return cached_response
+
+        # Identical requests for the same data version share one computation
+        key = ('trends', params['start_month'], params['end_month'], params['granularity'], etag)
+        trends = await analytics_flight.do(user_id, key, load_trends, user_id, params)
+        return with_etag(jsonify(trends), etag)
+
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        logger.error(f"Error getting trends: {e}")
+        return jsonify({'error': 'Failed to generate trends'}), 500
+
+# DASHBOARD ROUTE
+ANALYTICS_BUILDERS = {'summary': build_summary, 'report': build_report}
+
+async def no_query():
+    return None
+
+async def load_dashboard(user_id, month, start_date, end_date, sections, etag):
+    """
+    Build the requested dashboard sections. The month's expenses and budgets
+    are each read at most once (concurrently); summary and report come from
+    the result cache when possible, and on a miss share one read of the
+    rollup and budgets with concurrent requests for the same month and data
+    version (etag), as in cached_analytics.
+    """
+    dashboard = {'month': month}
+    missing = []
+    for endpoint in ('summary', 'report'):
+        if endpoint in sections:
+            payload = await cache_call(result_cache.get, user_id, endpoint, month, etag)
+            if payload is None:
+                missing.append(endpoint)
+            else:
+                dashboard[endpoint] = payload
+
+    expenses, budgets, analytics = await asyncio.gather(
+        storage.list_expenses(user_id, start_date, end_date) if 'expenses' in sections else no_query(),
+        storage.list_budgets(user_id, month) if 'budgets' in sections else no_query(),
+        analytics_flight.do(user_id, ('month', month, etag), load_month_analytics, user_id, month)
+        if missing else no_query()
+    )
+
+    for endpoint in missing:
+        dashboard[endpoint] = ANALYTICS_BUILDERS[endpoint](month, *analytics)
+        await cache_call(result_cache.set, user_id, endpoint, month, etag, dashboard[endpoint])
+    if 'budgets' in sections:
+        dashboard['budgets'] = budgets_payload(month, budgets)
+    if 'expenses' in sections:
+        dashboard['expenses'] = expenses_payload(month, expenses)
+    return dashboard
+
+@app.route('/api/users/<user_id>/dashboard', methods=['GET'])
+@require_auth
+async def get_dashboard(user_id):
+    """Expenses, budgets, summary and report for a month in one response, as in app.py"""
+    try:
+        month = request.args.get('month', get_current_month())
+        start_date, end_date = get_month_range(month)
+        if not start_date or not end_date:
+            return jsonify({'error': 'Invalid month format. Use YYYY-MM'}), 400
+
+        sections, error = parse_dashboard_sections(request.args.get('include'))
+        if error:
+            return jsonify({'error': error}), 400
+
+        etag = await data_etag(user_id, [month])
+        cached_response = not_modified(etag)
+        if cached_response:
+            return cached_response
+
+        return with_etag(jsonify(await load_dashboard(user_id, month, start_date, end_date, sections, etag)), etag)
+
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        logger.error(f"Error loading dashboard: {e}")
+        return jsonify({'error': 'Failed to load dashboard'}), 500
+
+# LIVE STATUS ROUTE
+async def load_live_status(user_id, month):
+    """
+    Current live status of a month, read from storage: the result cache is
+    only invalidated after the write that triggered the refresh returns
+    """
+    rollup, budgets = await asyncio.gather(
+        load_rollup(user_id, month),
+        storage.list_budgets(user_id, month, ANALYTICS_BUDGET_FIELDS)
+    )
+    return live_status(month, rollup, budgets)
+
+# One storage listener and one refresh per change for all streams of a user's month
+live_hub = AsyncLiveStatusHub(storage, load_live_status)
+metrics.add_collector(lambda: stats_gauges('live_status', 'Live status streams', live_hub.stats()))
+
+@app.route('/api/summary/<user_id>/<month>/events', methods=['GET'])
+@require_auth
+async def stream_live_status(user_id, month):
+    """
+    Server-Sent Events for a month, as in app.py. A waiting stream holds no
+    thread, so this mode suits many open dashboards.
+    """
+    try:
+        start_date, end_date = get_month_range(month)
+        if not start_date or not end_date:
+            return jsonify({'error': 'Invalid month format. Use YYYY-MM'}), 400
+
+        expires_at = request.user.get('exp')
+
+        async def generate():
+            # Subscribed on the first read, so an unsent response leaves no subscriber behind
+            subscriber = await live_hub.subscribe(user_id, month)
+            try:
+                yield SSE_RETRY
+                while not expires_at or time.time() < expires_at:
+                    try:
+                        yield await asyncio.wait_for(subscriber.get(), LIVE_HEARTBEAT)
+                    except asyncio.TimeoutError:
+                        yield SSE_HEARTBEAT
+            finally:
+                live_hub.unsubscribe(user_id, month, subscriber)
+
+        response = Response(generate(), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        # Stop reverse proxies (nginx) from buffering the stream
+        response.headers['X-Accel-Buffering'] = 'no'
+        # Streams stay open far longer than RESPONSE_TIMEOUT
+        response.timeout = None
+        return response
+
+    except Exception as e:
+        logger.error(f"Error opening live status stream: {e}")
+        return jsonify({'error': 'Failed to open live status stream'}), 500
+
+# EXPORT ROUTE
+async def iter_export_pages(user_id, params):
+    """Pages of the expenses or budgets to export, read as the response is sent"""
+    start_date, end_date = params['start_date'], params['end_date']
+    if params['dataset'] == 'expenses':
+        async for page in aiter_expense_pages(storage, user_id, start_date, end_date):
+            yield page
+        return
+
+    # A user has a handful of budgets per month, so they are read in one query
+    budgets = budgets_in_range(await storage.list_budgets(user_id, None), start_date, end_date)
+    for index in range(0, len(budgets), EXPORT_PAGE_SIZE):
+        yield budgets[index:index + EXPORT_PAGE_SIZE]
+
+@app.route('/api/users/<user_id>/export', methods=['GET'])
+@require_auth
+async def export_data(user_id):
+    """
+    Stream a user's expenses or budgets as CSV or Parquet, as in app.py.
+    Pages are encoded in a worker thread so the event loop keeps serving.
+    """
+    try:
+        params, error = parse_export_params(request.args)
+        if error:
+            return jsonify({'error': error}), 400
+
+        export = new_export(params['dataset'], params['format'])
+
+        async def generate():
+            try:
+                yield export.begin()
+                async for page in iter_export_pages(user_id, params):
+                    chunk = await asyncio.to_thread(export.write, page)
+                    if chunk:
+                        yield chunk
+                yield await asyncio.to_thread(export.finish)
+            except Exception as e:
+                # Abort the transfer rather than end a truncated file cleanly
+                logger.error(f"Error streaming export: {e}")
+                raise
+
+        response = Response(generate(), mimetype=EXPORT_MIMETYPES[params['format']])
+        response.headers['Content-Disposition'] = f'attachment; filename="{export_filename(params)}"'
+        response.headers['Cache-Control'] = 'private, no-store'
+        # Long histories may take longer than RESPONSE_TIMEOUT to send
+        response.timeout = None
+        return response
+
+    except Exception as e:
+        logger.error(f"Error exporting data: {e}")
+        return jsonify({'error': 'Failed to export data'}), 500
+
+# Run the application
+if __name__ == '__main__':
+    import hypercorn.asyncio
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = ['0.0.0.0:5000']
+    logger.info("Starting Finance Tracker Backend (ASGI) on http://localhost:5000")
+    asyncio.run(hypercorn.asyncio.serve(app, config))
@@ -0,0 +1,439 @@
+"""
+Async storage backends for the ASGI app (asgi.py)
+
+Same operations, arguments and return values as storage.Storage, but every
+method is a coroutine. Firestore runs natively on firestore.AsyncClient, so
+a request waiting on Firestore holds no thread. The memory and SQLite
+backends have no async driver and are wrapped with asyncio.to_thread.
+"""
+
+from datetime import datetime
+import asyncio
+import os
+
+from analytics import expense_columns, month_range, summarize_expenses
+from expense_filters import merge_search_changes, search_index_changes
+from firebase_app import READINESS_TIMEOUT, firebase
+from storage import (
+    COLUMN_FIELDS, MAX_WRITE_ATTEMPTS, ROLLUP_FIELDS, FirestoreDocuments, budget_document_id, budget_id_month,
+    create_storage, expense_months, merge_rollup_deltas, rollup_deltas
+)
+
+
+class AsyncStorage:
+    """Awaitable counterpart of storage.Storage (see there for each method's contract)"""
+
+    name = 'base'
+
+    # Expenses
+    async def list_expenses(self, user_id, start_date, end_date, fields=None):
+        raise NotImplementedError
+
+    async def page_expenses(self, user_id, start_date, end_date, limit, start_after=None):
+        raise NotImplementedError
+
+    async def list_expense_columns(self, user_id, start_date, end_date):
+        return expense_columns(await self.list_expenses(user_id, start_date, end_date, COLUMN_FIELDS))
+
+    async def iter_expenses(self, user_id, start_date, end_date, start_after=None, chunk_size=500):
+        """Async generator of expenses ordered by (date, id), one page in memory at a time"""
+        while True:
+            page = await self.page_expenses(user_id, start_date, end_date, chunk_size, start_after)
+            # Take the cursor before callers get (and possibly modify) the documents
+            last = (page[-1]['date'], page[-1]['id']) if len(page) == chunk_size else None
+            for expense in page:
+                yield expense
+            if last is None:
+                return
+            start_after = last
+
+    async def query_expenses(self, user_id, start_date, end_date, filters, limit=None, start_after=None):
+        raise NotImplementedError
+
+    async def add_expense(self, user_id, data):
+        raise NotImplementedError
+
+    async def add_expenses(self, user_id, items):
+        raise NotImplementedError
+
+    async def update_expense(self, user_id, expense_id, data):
+        raise NotImplementedError
+
+    async def delete_expense(self, user_id, expense_id):
+        raise NotImplementedError
+
+    # Budgets
+    async def list_budgets(self, user_id, month, fields=None):
+        raise NotImplementedError
+
+    async def upsert_budget(self, user_id, data):
+        raise NotImplementedError
+
+    async def delete_budget(self, user_id, budget_id):
+        raise NotImplementedError
+
+    # Recurring expense rules (materialized by recurring.RecurringScheduler on a sync Storage)
+    async def list_recurring_rules(self, user_id):
+        raise NotImplementedError
+
+    async def get_recurring_rule(self, user_id, rule_id):
+        raise NotImplementedError
+
+    async def add_recurring_rule(self, user_id, data):
+        raise NotImplementedError
+
+    async def update_recurring_rule(self, user_id, rule_id, data):
+        raise NotImplementedError
+
+    async def delete_recurring_rule(self, user_id, rule_id):
+        raise NotImplementedError
+
+    # Rollups
+    async def get_rollup(self, user_id, month):
+        raise NotImplementedError
+
+    async def rebuild_rollup(self, user_id, month, bump_version=True):
+        raise NotImplementedError
+
+    # Data versions
+    async def get_versions(self, user_id, months):
+        raise NotImplementedError
+
+    def watch_versions(self, user_id, month, callback):
+        """A plain function, as it only registers a listener; callback runs on another thread"""
+        raise NotImplementedError
+
+    # Readiness
+    async def ping(self):
+        raise NotImplementedError
+
+
+class AsyncFirestoreStorage(FirestoreDocuments, AsyncStorage):
+    """Storage on firestore.AsyncClient, mirroring storage.FirestoreStorage write for write"""
+
+    name = 'firestore'
+
+    async def list_expenses(self, user_id, start_date, end_date, fields=None):
+        query = self._expense_range(user_id, start_date, end_date, fields)
+        return [self._to_dict(doc) async for doc in query.stream()]
+
+    async def page_expenses(self, user_id, start_date, end_date, limit, start_after=None):
+        query = self._ordered_expenses(user_id, start_date, end_date, start_after).limit(limit)
+        return [self._to_dict(doc) async for doc in query.stream()]
+
+    async def iter_expenses(self, user_id, start_date, end_date, start_after=None, chunk_size=500):
+        # Documents are yielded as they arrive from the query stream
+        async for doc in self._ordered_expenses(user_id, start_date, end_date, start_after).stream():
+            yield self._to_dict(doc)
+
+    async def query_expenses(self, user_id, start_date, end_date, filters, limit=None, start_after=None):
+        if filters.get('search_tokens'):
+            refs = self._search_refs(user_id, start_date, end_date, filters['search_tokens'])
+            ids = self._search_matches([snapshot async for snapshot in self.db.get_all(refs)])
+            collection = self._expenses(user_id)
+            expenses = []
+            if ids:
+                expenses = [
+                    self._to_dict(snapshot)
+                    async for snapshot in self.db.get_all([collection.document(expense_id) for expense_id in ids])
+                    if snapshot.exists
+                ]
+            return self._filter_matches(expenses, start_date, end_date, filters, limit, start_after)
+
+        query = self._filtered_expenses(user_id, start_date, end_date, filters, start_after)
+        if limit is not None:
+            query = query.limit(limit)
+        return [self._to_dict(doc) async for doc in query.stream()]
+
+    async def add_expense(self, user_id, data):
+        doc_ref = self._expenses(user_id).document()
+        batch = self.db.batch()
+        batch.create(doc_ref, data)
+        self._write_rollup_deltas(batch, user_id, rollup_deltas(None, data))
+        self._write_versions(batch, user_id, expense_months(data))
+        self._write_search_index(batch, user_id, search_index_changes(doc_ref.id, None, data))
+        await batch.commit()
+        return doc_ref.id
+
+    async def add_expenses(self, user_id, items):
+        written = []
+        for chunk in self._expense_chunks(items):
+            written.extend(await self._commit_expense_chunk(user_id, chunk))
+        return written
+
+    async def _commit_expense_chunk(self, user_id, chunk):
+        """Write one batch of new expenses with their rollup and version increments"""
+        collection = self._expenses(user_id)
+        keyed_refs = [collection.document(expense_id) for expense_id, _ in chunk if expense_id]
+        existing = set()
+        if keyed_refs:
+            existing = {snapshot.id async for snapshot in self.db.get_all(keyed_refs) if snapshot.exists}
+
+        batch = self.db.batch()
+        deltas = {}
+        search_changes = {}
+        written = []
+        for expense_id, data in chunk:
+            if expense_id in existing:
+                continue
+            doc_ref = collection.document(expense_id) if expense_id else collection.document()
+            batch.create(doc_ref, data)
+            merge_rollup_deltas(deltas, rollup_deltas(None, data))
+            merge_search_changes(search_changes, search_index_changes(doc_ref.id, None, data))
+            written.append(doc_ref.id)
+        if written:
+            self._write_rollup_deltas(batch, user_id, deltas)
+            self._write_versions(batch, user_id, deltas.keys())
+            self._write_search_index(batch, user_id, search_changes)
+            await batch.commit()
+        return written
+
+    @staticmethod
+    async def _commit_unless_changed(batch):
+        """Commit a last_update_time-guarded batch; False if the document changed since it was read"""
+        from google.api_core import exceptions as google_exceptions
+
+        try:
+            await batch.commit()
+            return True
+        except google_exceptions.FailedPrecondition:
+            return False
+
+    async def update_expense(self, user_id, expense_id, data):
+        doc_ref = self._expenses(user_id).document(expense_id)
+        for _ in range(MAX_WRITE_ATTEMPTS):
+            snapshot = await doc_ref.get()
+            if not snapshot.exists:
+                return None
+            old = self._to_dict(snapshot)
+            merged = dict(old, **data)
+            batch = self.db.batch()
+            batch.update(doc_ref, data, option=self.db.write_option(last_update_time=snapshot.update_time))
+            self._write_rollup_deltas(batch, user_id, rollup_deltas(old, merged))
+            self._write_versions(batch, user_id, expense_months(old, merged))
+            self._write_search_index(batch, user_id, search_index_changes(expense_id, old, merged))
+            if await self._commit_unless_changed(batch):
+                return old, merged
+        raise RuntimeError(f"Expense {expense_id} changed during {MAX_WRITE_ATTEMPTS} update attempts")
+
+    async def delete_expense(self, user_id, expense_id):
+        doc_ref = self._expenses(user_id).document(expense_id)
+        for _ in range(MAX_WRITE_ATTEMPTS):
+            snapshot = await doc_ref.get()
+            if not snapshot.exists:
+                return None
+            old = self._to_dict(snapshot)
+            batch = self.db.batch()
+            batch.delete(doc_ref, option=self.db.write_option(last_update_time=snapshot.update_time))
+            self._write_rollup_deltas(batch, user_id, rollup_deltas(old, None))
+            self._write_versions(batch, user_id, expense_months(old))
+            self._write_search_index(batch, user_id, search_index_changes(expense_id, old, None))
+            if await self._commit_unless_changed(batch):
+                return old
+        raise RuntimeError(f"Expense {expense_id} changed during {MAX_WRITE_ATTEMPTS} delete attempts")
+
+    async def list_budgets(self, user_id, month, fields=None):
+        return [self._to_dict(doc) async for doc in self._budget_query(user_id, month, fields).stream()]
+
+    async def upsert_budget(self, user_id, data):
+        from google.api_core import exceptions as google_exceptions
+
+        budget_id = budget_document_id(user_id, data['month'], data.get('category', ''))
+        doc_ref = self._budgets(user_id).document(budget_id)
+
+        batch = self.db.batch()
+        batch.create(doc_ref, data)
+        self._write_versions(batch, user_id, [data['month']])
+        try:
+            await batch.commit()
+            return budget_id, True
+        except google_exceptions.Conflict:
+            pass
+
+        batch = self.db.batch()
+        batch.set(doc_ref, {key: value for key, value in data.items() if key != 'created_at'}, merge=True)
+        self._write_versions(batch, user_id, [data['month']])
+        await batch.commit()
+        return budget_id, False
+
+    async def delete_budget(self, user_id, budget_id):
+        from google.api_core import exceptions as google_exceptions
+
+        doc_ref = self._budgets(user_id).document(budget_id)
+        month = budget_id_month(budget_id)
+        if month is None:
+            snapshot = await doc_ref.get()
+            if not snapshot.exists:
+                return None
+            month = snapshot.get('month')
+
+        batch = self.db.batch()
+        batch.delete(doc_ref, option=self.db.write_option(exists=True))
+        self._write_versions(batch, user_id, [month])
+        try:
+            await batch.commit()
+        except google_exceptions.NotFound:
+            return None
+        return month
+
+    async def list_recurring_rules(self, user_id):
+        return [self._to_dict(doc) async for doc in self._recurring(user_id).stream()]
+
+    async def get_recurring_rule(self, user_id, rule_id):
+        doc = await self._recurring(user_id).document(rule_id).get()
+        return self._to_dict(doc) if doc.exists else None
+
+    async def add_recurring_rule(self, user_id, data):
+        doc_ref = self._recurring(user_id).document()
+        await doc_ref.create(data)
+        return doc_ref.id
+
+    async def update_recurring_rule(self, user_id, rule_id, data):
+        from google.api_core import exceptions as google_exceptions
+
+        doc_ref = self._recurring(user_id).document(rule_id)
+        snapshot = await doc_ref.get()
+        if not snapshot.exists:
+            return None
+        try:
+            await doc_ref.update(data)
+        except google_exceptions.NotFound:
+            return None
+        return dict(self._to_dict(snapshot), **data)
+
+    async def delete_recurring_rule(self, user_id, rule_id):
+        from google.api_core import exceptions as google_exceptions
+
+        try:
+            await self._recurring(user_id).document(rule_id).delete(option=self.db.write_option(exists=True))
+        except google_exceptions.NotFound:
+            return False
+        return True
+
+    async def get_rollup(self, user_id, month):
+        return self._stored_rollup(await self._rollups(user_id).document(month).get())
+
+    async def rebuild_rollup(self, user_id, month, bump_version=True):
+        from google.cloud import firestore
+
+        start_date, end_date = month_range(month)
+        rollup_ref = self._rollups(user_id).document(month)
+        query = self._expense_range(user_id, start_date, end_date, ROLLUP_FIELDS)
+
+        @firestore.async_transactional
+        async def run(transaction):
+            await rollup_ref.get(transaction=transaction)
+            expenses = [doc.to_dict() async for doc in await transaction.get(query)]
+            rollup = summarize_expenses(month, expenses)
+            rollup['updated_at'] = datetime.now()
+            transaction.set(rollup_ref, dict(rollup, complete=True))
+            if bump_version:
+                self._write_versions(transaction, user_id, [month])
+            return rollup
+
+        return await run(self.db.transaction())
+
+    async def get_versions(self, user_id, months):
+        versions = {month: 0 for month in months}
+        refs = [self._versions(user_id).document(month) for month in versions]
+        async for snapshot in self.db.get_all(refs):
+            if snapshot.exists:
+                versions[snapshot.id] = snapshot.get('version') or 0
+        return versions
+
+    def watch_versions(self, user_id, month, callback):
+        # AsyncClient has no listeners; the sync client's watch runs on its own thread
+        return self._watch_version(firebase.firestore_client(), user_id, month, callback)
+
+    async def ping(self):
+        await self._ping_ref().get(retry=None, timeout=READINESS_TIMEOUT)
+
+
+class ThreadedAsyncStorage(AsyncStorage):
+    """
+    Runs a synchronous Storage (memory or SQLite) in the default thread pool.
+    Those backends answer from local memory or disk, so the pool is only
+    briefly occupied per call.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.name = storage.name
+
+    def _call(self, method, *args):
+        return asyncio.to_thread(getattr(self.storage, method), *args)
+
+    async def list_expenses(self, user_id, start_date, end_date, fields=None):
+        return await self._call('list_expenses', user_id, start_date, end_date, fields)
+
+    async def page_expenses(self, user_id, start_date, end_date, limit, start_after=None):
+        return await self._call('page_expenses', user_id, start_date, end_date, limit, start_after)
+
+    async def list_expense_columns(self, user_id, start_date, end_date):
+        return await self._call('list_expense_columns', user_id, start_date, end_date)
+
+    async def query_expenses(self, user_id, start_date, end_date, filters, limit=None, start_after=None):
+        return await self._call('query_expenses', user_id, start_date, end_date, filters, limit, start_after)
+
+    async def add_expense(self, user_id, data):
+        return await self._call('add_expense', user_id, data)
+
+    async def add_expenses(self, user_id, items):
+        return await self._call('add_expenses', user_id, items)
+
+    async def update_expense(self, user_id, expense_id, data):
+        return await self._call('update_expense', user_id, expense_id, data)
+
+    async def delete_expense(self, user_id, expense_id):
+        return await self._call('delete_expense', user_id, expense_id)
+
+    async def list_budgets(self, user_id, month, fields=None):
+        return await self._call('list_budgets', user_id, month, fields)
+
+    async def upsert_budget(self, user_id, data):
+        return await self._call('upsert_budget', user_id, data)
+
+    async def delete_budget(self, user_id, budget_id):
+        return await self._call('delete_budget', user_id, budget_id)
+
+    async def list_recurring_rules(self, user_id):
+        return await self._call('list_recurring_rules', user_id)
+
+    async def get_recurring_rule(self, user_id, rule_id):
+        return await self._call('get_recurring_rule', user_id, rule_id)
+
+    async def add_recurring_rule(self, user_id, data):
+        return await self._call('add_recurring_rule', user_id, data)
+
+    async def update_recurring_rule(self, user_id, rule_id, data):
+        return await self._call('update_recurring_rule', user_id, rule_id, data)
+
+    async def delete_recurring_rule(self, user_id, rule_id):
+        return await self._call('delete_recurring_rule', user_id, rule_id)
+
+    async def get_rollup(self, user_id, month):
+        return await self._call('get_rollup', user_id, month)
+
+    async def rebuild_rollup(self, user_id, month, bump_version=True):
+        return await self._call('rebuild_rollup', user_id, month, bump_version)
+
+    async def get_versions(self, user_id, months):
+        return await self._call('get_versions', user_id, months)
+
+    def watch_versions(self, user_id, month, callback):
+        return self.storage.watch_versions(user_id, month, callback)
+
+    async def ping(self):
+        return await self._call('ping')
+
+
+def create_async_storage(backend=None):
+    """
+    Create the async storage backend selected by STORAGE_BACKEND
+    (firestore, memory or sqlite), configured as in storage.create_storage.
+    """
+    backend = (backend or os.environ.get('STORAGE_BACKEND', 'firestore')).lower()
+
+    if backend == 'firestore':
+        return AsyncFirestoreStorage(firebase.firestore_async_client)
+    return ThreadedAsyncStorage(create_storage(backend))
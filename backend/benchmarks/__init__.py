@@ -0,0 +1,12 @@
+"""
+Benchmark suite for the Finance Tracker backend
+
+Run from the backend directory:
+
+    python -m benchmarks.micro            # aggregation, serialization, helpers
+    python -m benchmarks.load             # concurrent HTTP load on every route
+    python -m benchmarks.compare OLD NEW  # diff two result files
+
+Both runners seed deterministic data into a local storage backend (memory
+by default) so results are reproducible and comparable between commits.
+"""
@@ -0,0 +1,255 @@
+"""
+Seed data, read accounting, statistics and result files shared by the
+benchmark runners
+"""
+
+from datetime import datetime, timedelta
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+
+from analytics import month_keys
+from money import to_cents
+
+# Seeded users and how many expenses each holds
+PROFILES = {
+    'small': 100,
+    'medium': 10000,
+    'large': 100000
+}
+
+CATEGORIES = (
+    'Food & Dining', 'Transportation', 'Shopping', 'Entertainment', 'Utilities',
+    'Healthcare', 'Education', 'Travel', 'Other'
+)
+
+# Seeded expenses span SEED_MONTHS months ending with BENCH_MONTH
+BENCH_MONTH = '2024-12'
+SEED_MONTHS = 12
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def parse_profiles(value):
+    """Parse a comma-separated list of profile names"""
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in PROFILES]
+    if unknown:
+        raise ValueError(f"Unknown profile(s): {', '.join(unknown)} (choose from {', '.join(PROFILES)})")
+    return names
+
+
+def seed_months(end_month=BENCH_MONTH, count=SEED_MONTHS):
+    """Return the count months (YYYY-MM) up to and including end_month"""
+    year, month = map(int, end_month.split('-'))
+    index = year * 12 + month - 1
+    return [f"{i // 12:04d}-{i % 12 + 1:02d}" for i in range(index - count + 1, index + 1)]
+
+
+def generate_expenses(count, seed=0, end_month=BENCH_MONTH, months=SEED_MONTHS):
+    """
+    Return count expense documents spread evenly over the months ending with
+    end_month. The same arguments always produce the same documents.
+    """
+    rng = random.Random(seed)
+    month_starts = [datetime.strptime(month, '%Y-%m') for month in seed_months(end_month, months)]
+    created_at = datetime(2025, 1, 1)
+    expenses = []
+    for index in range(count):
+        start = month_starts[index % len(month_starts)]
+        amount = round(rng.uniform(1, 250), 2)
+        expenses.append({
+            'amount': amount,
+            'amount_cents': to_cents(amount),
+            'category': rng.choice(CATEGORIES),
+            'note': f"Seeded expense {index}",
+            'date': start + timedelta(days=rng.randrange(28), seconds=rng.randrange(86400)),
+            'created_at': created_at,
+            'updated_at': created_at
+        })
+    return expenses
+
+
+def generate_budgets(end_month=BENCH_MONTH, months=SEED_MONTHS):
+    """Return one budget per category for each seeded month"""
+    created_at = datetime(2025, 1, 1)
+    return [
+        {
+            'category': category, 'amount': 500.0, 'amount_cents': 50000, 'month': month,
+            'created_at': created_at, 'updated_at': created_at
+        }
+        for month in seed_months(end_month, months)
+        for category in CATEGORIES
+    ]
+
+
+def seed_user(storage, user_id, count, seed=0):
+    """Write a user's seeded expenses (under fixed ids) and budgets through the storage API"""
+    expenses = generate_expenses(count, seed)
+    for start in range(0, len(expenses), 500):
+        chunk = expenses[start:start + 500]
+        storage.add_expenses(user_id, [
+            (f"seed-{start + offset:06d}", data) for offset, data in enumerate(chunk)
+        ])
+    for budget in generate_budgets():
+        storage.upsert_budget(user_id, budget)
+
+
+class ReadCountingStorage:
+    """
+    Storage wrapper that counts document reads the way Firestore bills them:
+    one per document returned, one for a query that matches nothing, and one
+    per document a write has to look up first.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.name = storage.name
+        self._lock = threading.Lock()
+        self.reads = 0
+
+    def __getattr__(self, name):
+        # Methods without reads of their own (e.g. add_expense) pass through
+        return getattr(self.storage, name)
+
+    def _count(self, reads):
+        with self._lock:
+            self.reads += reads
+
+    def reset(self):
+        """Zero the counter and return the reads counted so far"""
+        with self._lock:
+            reads, self.reads = self.reads, 0
+            return reads
+
+    def _query(self, documents):
+        self._count(max(1, len(documents)))
+        return documents
+
+    def list_expenses(self, *args, **kwargs):
+        return self._query(self.storage.list_expenses(*args, **kwargs))
+
+    def page_expenses(self, *args, **kwargs):
+        return self._query(self.storage.page_expenses(*args, **kwargs))
+
+    def list_expense_columns(self, *args, **kwargs):
+        return self._query(self.storage.list_expense_columns(*args, **kwargs))
+
+    def iter_expenses(self, *args, **kwargs):
+        reads = 0
+        for expense in self.storage.iter_expenses(*args, **kwargs):
+            reads += 1
+            yield expense
+        self._count(max(1, reads))
+
+    def query_expenses(self, user_id, start_date, end_date, filters, *args, **kwargs):
+        # A search first reads one index document per word and month
+        if filters.get('search_tokens'):
+            self._count(len(filters['search_tokens']) * len(month_keys(start_date, end_date)))
+        return self._query(self.storage.query_expenses(user_id, start_date, end_date, filters, *args, **kwargs))
+
+    def list_budgets(self, *args, **kwargs):
+        return self._query(self.storage.list_budgets(*args, **kwargs))
+
+    def get_expense(self, *args, **kwargs):
+        self._count(1)
+        return self.storage.get_expense(*args, **kwargs)
+
+    def get_budget(self, *args, **kwargs):
+        self._count(1)
+        return self.storage.get_budget(*args, **kwargs)
+
+    def get_rollup(self, *args, **kwargs):
+        self._count(1)
+        return self.storage.get_rollup(*args, **kwargs)
+
+    def get_versions(self, user_id, months):
+        months = list(months)
+        self._count(len(months))
+        return self.storage.get_versions(user_id, months)
+
+    def add_expenses(self, user_id, items):
+        # Existing-id lookup for keyed rows
+        self._count(sum(1 for expense_id, _ in items if expense_id))
+        return self.storage.add_expenses(user_id, items)
+
+    def update_expense(self, *args, **kwargs):
+        self._count(1)
+        return self.storage.update_expense(*args, **kwargs)
+
+    def delete_expense(self, *args, **kwargs):
+        self._count(1)
+        return self.storage.delete_expense(*args, **kwargs)
+
+    def rebuild_rollup(self, user_id, month, bump_version=True):
+        rollup = self.storage.rebuild_rollup(user_id, month, bump_version)
+        self._count(1 + max(1, rollup.get('count', 0)))
+        return rollup
+
+
+def percentile(sorted_samples, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_samples:
+        return 0.0
+    rank = max(0, min(len(sorted_samples), math.ceil(fraction * len(sorted_samples))) - 1)
+    return sorted_samples[rank]
+
+
+def latency_stats(samples, scale=1000.0):
+    """p50/p95/p99/mean/max of samples in seconds, scaled (default: milliseconds)"""
+    ordered = sorted(samples)
+    mean = sum(ordered) / len(ordered) if ordered else 0.0
+    return {
+        'p50': round(percentile(ordered, 0.50) * scale, 4),
+        'p95': round(percentile(ordered, 0.95) * scale, 4),
+        'p99': round(percentile(ordered, 0.99) * scale, 4),
+        'mean': round(mean * scale, 4),
+        'max': round(ordered[-1] * scale, 4) if ordered else 0.0
+    }
+
+
+def git_revision():
+    """Current commit (with a -dirty suffix for uncommitted changes), or None outside git"""
+    try:
+        revision = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return f"{revision}-dirty" if dirty else revision
+    except Exception:
+        return None
+
+
+def environment():
+    """Machine and interpreter details stored with every result file"""
+    return {
+        'revision': git_revision(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'argv': sys.argv[1:]
+    }
+
+
+def write_results(kind, config, results, output=None):
+    """
+    Save a result file as JSON and return its path. The default name is
+    results/<kind>-<revision>.json, so runs on different commits sit side by
+    side for benchmarks.compare.
+    """
+    meta = environment()
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{kind}-{meta['revision'] or 'local'}.json")
+    with open(output, 'w') as f:
+        json.dump({'kind': kind, 'meta': meta, 'config': config, 'results': results}, f, indent=2)
+        f.write('\n')
+    return output
@@ -0,0 +1,89 @@
+"""
+Compare two benchmark result files (e.g. the parent commit and a change)
+
+    python -m benchmarks.compare results/load-abc1234.json results/load-def5678.json
+                                 [--metrics p50,p95] [--threshold 10]
+
+Rows are matched by case and profile/size. A latency metric that grows by
+more than --threshold percent, or any growth in Firestore reads per request,
+is reported as a regression and makes the command exit with status 1.
+"""
+
+import argparse
+import json
+import sys
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def row_key(row):
+    scale = row.get('profile') or row.get('size')
+    return f"{row['name']}[{scale}]" if scale else row['name']
+
+
+def percent_change(old, new):
+    if not old:
+        return None
+    return (new - old) / old * 100
+
+
+def compare(old, new, metrics, threshold):
+    """Return (table lines, regression descriptions)"""
+    old_rows = {row_key(row): row for row in old['results']}
+    lines = []
+    regressions = []
+    for row in new['results']:
+        key = row_key(row)
+        previous = old_rows.get(key)
+        if previous is None:
+            lines.append(f"{key:<36} (new)")
+            continue
+
+        cells = []
+        for metric in metrics:
+            before, after = previous['latency'][metric], row['latency'][metric]
+            change = percent_change(before, after)
+            cells.append(f"{metric} {before:>11,.2f} -> {after:>11,.2f} {row['unit']} "
+                         f"({'n/a' if change is None else f'{change:+.1f}%'})")
+            if change is not None and change > threshold:
+                regressions.append(f"{key} {metric} {change:+.1f}%")
+
+        if 'reads_per_request' in row:
+            before, after = previous.get('reads_per_request', 0), row['reads_per_request']
+            cells.append(f"reads {before:g} -> {after:g}")
+            if after > before:
+                regressions.append(f"{key} reads per request {before:g} -> {after:g}")
+
+        lines.append(f"{key:<36} " + '   '.join(cells))
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('old', help='Baseline result file')
+    parser.add_argument('new', help='Result file to check')
+    parser.add_argument('--metrics', default='p50,p95', help='Latency percentiles to compare')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Allowed slowdown in percent')
+    args = parser.parse_args()
+
+    old, new = load_results(args.old), load_results(args.new)
+    if old['kind'] != new['kind']:
+        parser.error(f"Cannot compare {old['kind']} results with {new['kind']} results")
+
+    print(f"{old['kind']}: {old['meta'].get('revision')} -> {new['meta'].get('revision')}")
+    lines, regressions = compare(old, new, [metric.strip() for metric in args.metrics.split(',')], args.threshold)
+    print('\n'.join(lines))
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:g}%:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print('\nNo regressions')
+
+
+if __name__ == '__main__':
+    main()
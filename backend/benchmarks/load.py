@@ -0,0 +1,338 @@
+"""
+Concurrent load driver for every API route
+
+Starts the Flask app in-process on a threaded HTTP server, seeds one user per
+profile (100, 10k and 100k expenses by default) and sends --requests requests
+per route from --concurrency keep-alive connections. For each route and
+profile it reports p50/p95/p99 latency, throughput and the Firestore document
+reads the route costs per request (counted at the storage layer the way
+Firestore bills them, so the figure holds for the emulator-free backends too).
+
+    python -m benchmarks.load [--profiles small,medium,large] [--requests 200]
+                              [--concurrency 8] [--backend memory|sqlite]
+                              [--routes NAME] [--output FILE]
+
+Authentication is exercised through the token cache: each seeded user gets a
+token primed in app.token_cache, so require_auth runs its normal code path
+without calling Firebase.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import argparse
+import http.client
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks.common import (
+    BENCH_MONTH, PROFILES, generate_expenses, latency_stats, parse_profiles, write_results
+)
+
+OK_STATUSES = {200, 201, 304}
+
+# Rows per request in the import scenario
+IMPORT_ROWS = 100
+
+
+class Scenario:
+    """One route under load: how to build the i-th request and any data it consumes"""
+
+    def __init__(self, name, route, build, prepare=None):
+        self.name = name
+        self.route = route
+        self.build = build        # (ctx, i) -> (method, path, body, headers)
+        self.prepare = prepare    # ctx, count -> None; runs before the phase
+
+
+def json_body(data):
+    return json.dumps(data).encode('utf-8'), {'Content-Type': 'application/json'}
+
+
+def get(path, headers=None):
+    return lambda ctx, i: ('GET', path.format(user=ctx['user_id'], month=BENCH_MONTH), None, headers or {})
+
+
+def add_expense_request(ctx, i):
+    body, headers = json_body({
+        'amount': 10 + i % 90, 'category': 'Shopping', 'date': f"{BENCH_MONTH}-{i % 28 + 1:02d}",
+        'note': f"Load test {i}"
+    })
+    return 'POST', f"/api/users/{ctx['user_id']}/expenses", body, headers
+
+
+def update_expense_request(ctx, i):
+    expense_id = f"seed-{i % ctx['expense_count']:06d}"
+    body, headers = json_body({'amount': 5 + i % 50, 'note': f"Updated {i}"})
+    return 'PUT', f"/api/users/{ctx['user_id']}/expenses/{expense_id}", body, headers
+
+
+def prepare_delete_pool(ctx, count):
+    expenses = generate_expenses(count, seed=1)
+    ctx['storage'].add_expenses(ctx['user_id'], [
+        (f"delete-{i:06d}", data) for i, data in enumerate(expenses)
+    ])
+
+
+def delete_expense_request(ctx, i):
+    return 'DELETE', f"/api/users/{ctx['user_id']}/expenses/delete-{i:06d}", None, {}
+
+
+def import_request(ctx, i):
+    lines = [
+        json.dumps({'amount': 1 + row % 99, 'category': 'Travel', 'date': f"{BENCH_MONTH}-{row % 28 + 1:02d}"})
+        for row in range(IMPORT_ROWS)
+    ]
+    headers = {'Content-Type': 'application/x-ndjson', 'Idempotency-Key': f"load-{ctx['run_id']}-{i}"}
+    return 'POST', f"/api/users/{ctx['user_id']}/expenses/import", '\n'.join(lines).encode('utf-8'), headers
+
+
+def set_budget_request(ctx, i):
+    body, headers = json_body({'category': 'Shopping', 'amount': 400 + i % 200, 'month': BENCH_MONTH})
+    return 'POST', f"/api/users/{ctx['user_id']}/budgets", body, headers
+
+
+def prepare_budget_pool(ctx, count):
+    ctx['budget_pool'] = [
+        ctx['storage'].upsert_budget(ctx['user_id'], {
+            'category': f"Pool {i}", 'amount': 10.0, 'month': BENCH_MONTH,
+            'created_at': ctx['now'], 'updated_at': ctx['now']
+        })[0]
+        for i in range(count)
+    ]
+
+
+def delete_budget_request(ctx, i):
+    return 'DELETE', f"/api/users/{ctx['user_id']}/budgets/{ctx['budget_pool'][i]}", None, {}
+
+
+def prepare_etag(ctx, count):
+    status, headers = ctx['fetch']('GET', f"/api/summary/{ctx['user_id']}/{BENCH_MONTH}")
+    ctx['summary_etag'] = headers.get('ETag', '')
+
+
+def revalidate_summary_request(ctx, i):
+    headers = {'If-None-Match': ctx['summary_etag']}
+    return 'GET', f"/api/summary/{ctx['user_id']}/{BENCH_MONTH}", None, headers
+
+
+def cold_summary_request(ctx, i):
+    # Drop the cached payload so concurrent requests miss together and are coalesced
+    ctx['result_cache'].invalidate(ctx['user_id'], [BENCH_MONTH])
+    return 'GET', f"/api/summary/{ctx['user_id']}/{BENCH_MONTH}", None, {}
+
+
+# Reads first: the write scenarios change the month they would measure
+SCENARIOS = [
+    Scenario('health', 'GET /health', get('/health')),
+    Scenario('expenses_month', 'GET /api/users/<user_id>/expenses', get('/api/users/{user}/expenses?month={month}')),
+    Scenario('expenses_page', 'GET /api/users/<user_id>/expenses?page_size=100',
+             get('/api/users/{user}/expenses?month={month}&page_size=100')),
+    Scenario('expenses_stream', 'GET /api/users/<user_id>/expenses?stream=1',
+             get('/api/users/{user}/expenses?month={month}&stream=1')),
+    Scenario('expenses_filtered', 'GET /api/users/<user_id>/expenses?category=...&sort=-amount&page_size=100',
+             get('/api/users/{user}/expenses?month={month}&category=Travel&min_amount=20&sort=-amount&page_size=100')),
+    Scenario('expenses_search', 'GET /api/users/<user_id>/expenses?q=...',
+             get('/api/users/{user}/expenses?month={month}&q=travel')),
+    Scenario('budgets', 'GET /api/users/<user_id>/budgets', get('/api/users/{user}/budgets?month={month}')),
+    Scenario('summary', 'GET /api/summary/<user_id>/<month>', get('/api/summary/{user}/{month}')),
+    Scenario('summary_304', 'GET /api/summary/<user_id>/<month> (If-None-Match)',
+             revalidate_summary_request, prepare_etag),
+    Scenario('summary_cold', 'GET /api/summary/<user_id>/<month> (result cache cleared)', cold_summary_request),
+    Scenario('report', 'GET /api/report/<user_id>/<month>', get('/api/report/{user}/{month}')),
+    Scenario('dashboard', 'GET /api/users/<user_id>/dashboard', get('/api/users/{user}/dashboard?month={month}')),
+    Scenario('dashboard_summary', 'GET /api/users/<user_id>/dashboard?include=summary,report',
+             get('/api/users/{user}/dashboard?month={month}&include=summary,report')),
+    Scenario('trends', 'GET /api/trends/<user_id>', get('/api/trends/{user}?end={month}')),
+    Scenario('trends_daily', 'GET /api/trends/<user_id>?granularity=day',
+             get('/api/trends/{user}?end={month}&granularity=day')),
+    Scenario('export_csv', 'GET /api/users/<user_id>/export (one month, CSV)',
+             get('/api/users/{user}/export?start={month}-01&end={month}-31')),
+    Scenario('export_budgets', 'GET /api/users/<user_id>/export?dataset=budgets',
+             get('/api/users/{user}/export?dataset=budgets')),
+    Scenario('add_expense', 'POST /api/users/<user_id>/expenses', add_expense_request),
+    Scenario('update_expense', 'PUT /api/users/<user_id>/expenses/<expense_id>', update_expense_request),
+    Scenario('delete_expense', 'DELETE /api/users/<user_id>/expenses/<expense_id>',
+             delete_expense_request, prepare_delete_pool),
+    Scenario('import_expenses', f'POST /api/users/<user_id>/expenses/import ({IMPORT_ROWS} rows)', import_request),
+    Scenario('set_budget', 'POST /api/users/<user_id>/budgets', set_budget_request),
+    Scenario('delete_budget', 'DELETE /api/users/<user_id>/budgets/<budget_id>',
+             delete_budget_request, prepare_budget_pool),
+]
+
+
+class Server:
+    """The Flask app on a threaded HTTP/1.1 server in a background thread"""
+
+    def __init__(self, app):
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class KeepAliveHandler(WSGIRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self.httpd = make_server('127.0.0.1', 0, app, threaded=True, request_handler=KeepAliveHandler)
+        self.port = self.httpd.server_port
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+
+
+def send(connection, method, path, body, headers):
+    """Send one request and read the whole response; returns (status, headers)"""
+    connection.request(method, path, body=body, headers=headers)
+    response = connection.getresponse()
+    response.read()
+    return response.status, dict(response.getheaders())
+
+
+def run_phase(port, ctx, scenario, start, count, concurrency):
+    """Send requests start..start+count-1 of a scenario; returns per-request latencies and statuses"""
+    indexes = iter(range(start, start + count))
+    lock = threading.Lock()
+    latencies = []
+    statuses = {}
+
+    def worker():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        local_latencies = []
+        local_statuses = {}
+        try:
+            while True:
+                with lock:
+                    i = next(indexes, None)
+                if i is None:
+                    break
+                method, path, body, headers = scenario.build(ctx, i)
+                headers = dict(headers, Authorization=ctx['authorization'])
+                started = time.perf_counter()
+                try:
+                    status, _ = send(connection, method, path, body, headers)
+                except (http.client.HTTPException, OSError):
+                    connection.close()
+                    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+                    status = 'connection_error'
+                local_latencies.append(time.perf_counter() - started)
+                local_statuses[status] = local_statuses.get(status, 0) + 1
+        finally:
+            connection.close()
+        with lock:
+            latencies.extend(local_latencies)
+            for status, seen in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + seen
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return latencies, statuses
+
+
+def run_scenario(port, ctx, counter, scenario, requests, concurrency, warmup):
+    """Warm up, then measure one scenario; returns its result row"""
+    if scenario.prepare:
+        scenario.prepare(ctx, warmup + requests)
+    run_phase(port, ctx, scenario, 0, warmup, concurrency)
+
+    counter.reset()
+    started = time.perf_counter()
+    latencies, statuses = run_phase(port, ctx, scenario, warmup, requests, concurrency)
+    elapsed = time.perf_counter() - started
+    reads = counter.reset()
+
+    errors = sum(seen for status, seen in statuses.items() if status not in OK_STATUSES)
+    return {
+        'name': scenario.name,
+        'route': scenario.route,
+        'profile': ctx['profile'],
+        'expenses': ctx['expense_count'],
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': errors,
+        'status_codes': {str(status): seen for status, seen in sorted(statuses.items(), key=str)},
+        'throughput_rps': round(requests / elapsed, 2) if elapsed else None,
+        'reads_per_request': round(reads / requests, 2) if requests else 0,
+        'unit': 'ms',
+        'latency': latency_stats(latencies)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profiles', default=','.join(PROFILES), help='Seeded users to test (small, medium, large)')
+    parser.add_argument('--requests', type=int, default=200, help='Measured requests per route and profile')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent client connections')
+    parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests sent first to each route')
+    parser.add_argument('--backend', default='memory', choices=('memory', 'sqlite'), help='Storage backend')
+    parser.add_argument('--routes', help='Only run scenarios whose name contains this text')
+    parser.add_argument('--output', help='Result file (default: benchmarks/results/load-<revision>.json)')
+    args = parser.parse_args()
+    profiles = parse_profiles(args.profiles)
+
+    # The app picks its backend at import time
+    os.environ['STORAGE_BACKEND'] = args.backend
+    if args.backend == 'sqlite':
+        os.environ['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='finance-bench-'), 'bench.db')
+    import app as app_module
+    from benchmarks.common import ReadCountingStorage, seed_user
+    logging.getLogger('app').setLevel(logging.WARNING)
+
+    storage = app_module.storage
+    counter = ReadCountingStorage(storage)
+    app_module.storage = counter
+
+    scenarios = [scenario for scenario in SCENARIOS if not args.routes or args.routes in scenario.name]
+    run_id = int(time.time())
+    results = []
+    with Server(app_module.app) as server:
+        connection = http.client.HTTPConnection('127.0.0.1', server.port, timeout=120)
+        for profile in profiles:
+            user_id = f"bench-{profile}"
+            token = f"bench-token-{profile}-{run_id}"
+            app_module.token_cache.put(token, {'uid': user_id, 'exp': time.time() + 86400})
+
+            print(f"Seeding {user_id} with {PROFILES[profile]:,} expenses...")
+            seed_user(storage, user_id, PROFILES[profile])
+            ctx = {
+                'profile': profile,
+                'user_id': user_id,
+                'expense_count': PROFILES[profile],
+                'authorization': f"Bearer {token}",
+                'storage': storage,
+                'result_cache': app_module.result_cache,
+                'run_id': run_id,
+                'now': datetime.now(),
+                'fetch': lambda method, path: send(connection, method, path, None, {'Authorization': ctx['authorization']})
+            }
+            for scenario in scenarios:
+                row = run_scenario(server.port, ctx, counter, scenario, args.requests, args.concurrency, args.warmup)
+                results.append(row)
+                latency = row['latency']
+                print(f"  {scenario.name:<18} p50 {latency['p50']:>9.2f} ms  p95 {latency['p95']:>9.2f} ms  "
+                      f"p99 {latency['p99']:>9.2f} ms  {row['throughput_rps']:>8.1f} req/s  "
+                      f"{row['reads_per_request']:>9.1f} reads/req  errors {row['errors']}")
+        connection.close()
+
+    config = {
+        'profiles': {profile: PROFILES[profile] for profile in profiles},
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'warmup': args.warmup,
+        'backend': args.backend,
+        'routes': args.routes,
+        'month': BENCH_MONTH
+    }
+    print(f"Results written to {write_results('load', config, results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Micro-benchmarks of the aggregation, serialization and request helpers
+
+Each case is timed in batches sized so one sample takes at least a few
+milliseconds; the per-call time of every sample is kept and reported as
+p50/p95/p99 in microseconds.
+
+    python -m benchmarks.micro [--sizes 100,10000,100000] [--min-time 1.0]
+                               [--filter NAME] [--output FILE]
+"""
+
+import argparse
+import io
+import os
+import time
+
+from flask.json.provider import DefaultJSONProvider
+
+# Import the app against the in-memory backend; only its token verification
+# is used here, plus the app object for the stdlib JSON baseline
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+
+from app import app, token_cache, verify_firebase_token  # noqa: E402
+from analytics import build_report, build_summary, build_trends, month_range, summarize_expenses  # noqa: E402
+from helpers import (  # noqa: E402
+    decode_cursor, encode_cursor, expenses_payload, iter_import_batches, new_import_report,
+    validate_expense, versions_etag
+)
+from responses import SUPPORTED_ENCODINGS, compress, encode_json  # noqa: E402
+from storage import merge_rollup_deltas, rollup_deltas  # noqa: E402
+
+from benchmarks.common import (  # noqa: E402
+    BENCH_MONTH, generate_budgets, generate_expenses, latency_stats, seed_months, write_results
+)
+
+MIN_SAMPLE_SECONDS = 0.002
+MIN_ROUNDS = 5
+MAX_ROUNDS = 1000
+
+
+def time_case(func, min_time):
+    """
+    Call func repeatedly for about min_time seconds.
+    Returns (per-call samples in seconds, calls per sample).
+    """
+    func()  # warm-up
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SAMPLE_SECONDS or number >= 100000:
+            break
+        number *= 10
+
+    samples = [elapsed / number]
+    deadline = time.perf_counter() + min_time
+    while len(samples) < MIN_ROUNDS or (time.perf_counter() < deadline and len(samples) < MAX_ROUNDS):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+    return samples, number
+
+
+def sized_cases(size):
+    """Cases whose cost grows with the number of expenses"""
+    expenses = generate_expenses(size)
+    trend_start = month_range(seed_months()[0])[0]
+    trend_end = month_range(BENCH_MONTH)[1]
+    csv_upload = 'amount,category,date,note\n' + ''.join(
+        f"{expense['amount']},{expense['category']},{expense['date'].date().isoformat()},{expense['note']}\n"
+        for expense in expenses
+    )
+    csv_upload = csv_upload.encode('utf-8')
+
+    def rollup_import_deltas():
+        deltas = {}
+        for expense in expenses:
+            merge_rollup_deltas(deltas, rollup_deltas(None, expense))
+        return deltas
+
+    listed = [dict(expense, id='x') for expense in expenses]
+    stdlib_json = DefaultJSONProvider(app)
+    body = encode_json(expenses_payload(BENCH_MONTH, listed))
+
+    def serialize_expenses_stdlib():
+        # The previous path: dates converted field by field, then the json module
+        formatted = []
+        for expense in listed:
+            expense = dict(expense)
+            for field in ('date', 'created_at', 'updated_at'):
+                expense[field] = expense[field].isoformat()
+            formatted.append(expense)
+        return stdlib_json.dumps(expenses_payload(BENCH_MONTH, formatted)).encode('utf-8')
+
+    def serialize_expenses():
+        return encode_json(expenses_payload(BENCH_MONTH, listed))
+
+    def parse_import():
+        report = new_import_report()
+        for _ in iter_import_batches('bench-user', io.BytesIO(csv_upload), 'csv', 'bench', report):
+            pass
+        return report
+
+    cases = {
+        'summarize_expenses': lambda: summarize_expenses(BENCH_MONTH, expenses),
+        'rollup_deltas': rollup_import_deltas,
+        'build_trends': lambda: build_trends(expenses, trend_start, trend_end, 'month'),
+        'build_trends_daily': lambda: build_trends(expenses, trend_start, trend_end, 'day'),
+        'serialize_expenses_stdlib': serialize_expenses_stdlib,
+        'serialize_expenses': serialize_expenses,
+        'compress_gzip': lambda: compress(body, 'gzip'),
+        'import_parse_validate': parse_import
+    }
+    if 'br' in SUPPORTED_ENCODINGS:
+        cases['compress_br'] = lambda: compress(body, 'br')
+    return cases
+
+
+def fixed_cases():
+    """Per-request helpers whose cost does not depend on data volume"""
+    rollup = summarize_expenses(BENCH_MONTH, generate_expenses(1000))
+    budgets = [budget for budget in generate_budgets() if budget['month'] == BENCH_MONTH]
+    expense = dict(generate_expenses(1)[0], id='seed-000000')
+    cursor = encode_cursor(expense)
+    versions = {month: 7 for month in seed_months()}
+    payload = {'amount': '12.50', 'category': 'Food & Dining', 'date': '2024-12-05', 'note': 'Lunch'}
+    token = 'Bearer benchmark-token'
+    token_cache.put(token[7:], {'uid': 'bench-user', 'exp': time.time() + 86400})
+
+    return {
+        'build_summary': lambda: build_summary(BENCH_MONTH, rollup, budgets),
+        'build_report': lambda: build_report(BENCH_MONTH, rollup, budgets),
+        'verify_token_cached': lambda: verify_firebase_token(token),
+        'encode_cursor': lambda: encode_cursor(expense),
+        'decode_cursor': lambda: decode_cursor(cursor),
+        'versions_etag': lambda: versions_etag('bench-user', versions),
+        'validate_expense': lambda: validate_expense(payload)
+    }
+
+
+def run(sizes, min_time, name_filter=None):
+    """Run every case and return the result rows"""
+    results = []
+    groups = [(None, fixed_cases)] + [(size, lambda size=size: sized_cases(size)) for size in sizes]
+    for size, build in groups:
+        for name, func in build().items():
+            if name_filter and name_filter not in name:
+                continue
+            samples, number = time_case(func, min_time)
+            stats = latency_stats(samples, scale=1e6)
+            results.append({
+                'name': name,
+                'size': size,
+                'unit': 'us',
+                'rounds': len(samples),
+                'calls_per_round': number,
+                'ops_per_sec': round(1e6 / stats['mean'], 2) if stats['mean'] else None,
+                'latency': stats
+            })
+            label = f"{name}[{size}]" if size else name
+            print(f"{label:<36} p50 {stats['p50']:>14,.2f} us   p99 {stats['p99']:>14,.2f} us")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='100,10000,100000', help='Expense counts for the sized cases')
+    parser.add_argument('--min-time', type=float, default=1.0, help='Seconds spent timing each case')
+    parser.add_argument('--filter', help='Only run cases whose name contains this text')
+    parser.add_argument('--output', help='Result file (default: benchmarks/results/micro-<revision>.json)')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    results = run(sizes, args.min_time, args.filter)
+    config = {'sizes': sizes, 'min_time': args.min_time, 'filter': args.filter}
+    print(f"Results written to {write_results('micro', config, results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
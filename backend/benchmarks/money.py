@@ -0,0 +1,161 @@
+"""
+Memory and CPU of the aggregation paths: expense dicts vs ExpenseColumns
+
+Seeds one user with --count expenses in a single month (BENCH_MONTH) and
+runs the month's aggregations two ways:
+
+    dicts    storage.list_expenses (one dict per expense, every field), float
+             sums as summarize_expenses did before amounts were kept in cents
+    columns  storage.list_expense_columns (ExpenseColumns) and the
+             integer-cent summarize_expenses / build_trends
+
+For each step it reports p50/p95/p99 in milliseconds, and with tracemalloc
+the memory the loaded expenses hold and the peak allocated while loading and
+summarizing. The float totals are compared with the exact cent totals
+(drift, in cents).
+
+    python -m benchmarks.money [--count 100000] [--backend memory|sqlite]
+                               [--repeat 10] [--output FILE]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from analytics import build_trends, month_range, rollup_category, summarize_expenses
+from storage import MemoryStorage, SQLiteStorage
+
+from benchmarks.common import BENCH_MONTH, generate_expenses, latency_stats, write_results
+
+USER_ID = 'bench-money'
+
+
+def summarize_floats(month, expenses):
+    """The float rollup summarize_expenses built before amounts were kept in cents (the baseline)"""
+    rollup = {'month': month, 'total': 0, 'count': 0, 'categories': {}}
+    categories = rollup['categories']
+    for expense in expenses:
+        amount = expense.get('amount', 0)
+        entry = categories.setdefault(rollup_category(expense.get('category')), {'total': 0, 'count': 0})
+        entry['total'] += amount
+        entry['count'] += 1
+        rollup['total'] += amount
+        rollup['count'] += 1
+    return rollup
+
+
+def seed_month(storage, count):
+    """Write count expenses dated in BENCH_MONTH"""
+    expenses = generate_expenses(count, months=1)
+    for start in range(0, len(expenses), 500):
+        storage.add_expenses(USER_ID, [
+            (f"seed-{start + offset:06d}", data) for offset, data in enumerate(expenses[start:start + 500])
+        ])
+
+
+def time_step(func, repeat):
+    """Latency stats (milliseconds) of repeat calls of func after a warm-up call"""
+    func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return latency_stats(samples)
+
+
+def measure_memory(load, aggregate):
+    """
+    Bytes held by load()'s result and the peak allocated while loading it
+    and aggregating it, as traced by tracemalloc
+    """
+    tracemalloc.start()
+    try:
+        loaded = load()
+        retained = tracemalloc.get_traced_memory()[0]
+        aggregate(loaded)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'retained_bytes': retained, 'peak_bytes': peak}
+
+
+def drift(float_rollup, cents_rollup):
+    """Differences in cents between the float and the exact totals"""
+    errors = [abs(float_rollup['total'] * 100 - cents_rollup['total_cents'])]
+    errors.extend(
+        abs(entry['total'] * 100 - cents_rollup['categories'][category]['total_cents'])
+        for category, entry in float_rollup['categories'].items()
+    )
+    rounded_off = sum(
+        1 for category, entry in float_rollup['categories'].items()
+        if round(round(entry['total'], 2) * 100) != cents_rollup['categories'][category]['total_cents']
+    )
+    return {'max_cents': max(errors), 'rounded_totals_off': rounded_off}
+
+
+def run(storage, count, repeat):
+    """Seed the month and run both paths. Returns (result rows, float drift)"""
+    seed_month(storage, count)
+    start_date, end_date = month_range(BENCH_MONTH)
+
+    def load_dicts():
+        return storage.list_expenses(USER_ID, start_date, end_date)
+
+    def load_columns():
+        return storage.list_expense_columns(USER_ID, start_date, end_date)
+
+    expenses = load_dicts()
+    columns = load_columns()
+    paths = {
+        'dicts': {
+            'load': load_dicts,
+            'summarize': lambda: summarize_floats(BENCH_MONTH, expenses),
+            'trends_daily': lambda: build_trends(expenses, start_date, end_date, 'day'),
+            'memory': lambda: measure_memory(load_dicts, lambda loaded: summarize_floats(BENCH_MONTH, loaded))
+        },
+        'columns': {
+            'load': load_columns,
+            'summarize': lambda: summarize_expenses(BENCH_MONTH, columns),
+            'trends_daily': lambda: build_trends(columns, start_date, end_date, 'day'),
+            'memory': lambda: measure_memory(load_columns, lambda loaded: summarize_expenses(BENCH_MONTH, loaded))
+        }
+    }
+
+    results = []
+    for path, steps in paths.items():
+        memory = steps.pop('memory')()
+        print(f"{path:<8} held {memory['retained_bytes'] / 2 ** 20:>9,.2f} MiB   "
+              f"peak {memory['peak_bytes'] / 2 ** 20:>9,.2f} MiB")
+        for step, func in steps.items():
+            stats = time_step(func, repeat)
+            results.append({'name': f"{step}_{path}", 'size': count, 'unit': 'ms', 'latency': stats, **memory})
+            print(f"{path:<8} {step:<14} p50 {stats['p50']:>10,.2f} ms   p99 {stats['p99']:>10,.2f} ms")
+
+    float_drift = drift(summarize_floats(BENCH_MONTH, expenses), summarize_expenses(BENCH_MONTH, columns))
+    print(f"float drift: {float_drift['max_cents']:.6f} cents at most, "
+          f"{float_drift['rounded_totals_off']} rounded category total(s) off")
+    return results, float_drift
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=100000, help='Expenses in the month')
+    parser.add_argument('--backend', default='memory', choices=('memory', 'sqlite'), help='Storage backend')
+    parser.add_argument('--repeat', type=int, default=10, help='Timed runs of each step')
+    parser.add_argument('--output', help='Result file (default: benchmarks/results/money-<revision>.json)')
+    args = parser.parse_args()
+
+    if args.backend == 'sqlite':
+        storage = SQLiteStorage(os.path.join(tempfile.mkdtemp(prefix='finance-bench-'), 'bench.db'))
+    else:
+        storage = MemoryStorage()
+    results, float_drift = run(storage, args.count, args.repeat)
+    config = {'count': args.count, 'backend': args.backend, 'repeat': args.repeat, 'drift': float_drift}
+    print(f"Results written to {write_results('money', config, results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
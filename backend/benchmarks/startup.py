@@ -0,0 +1,76 @@
+"""
+Import-time cost of the app modules
+
+Each sample imports a module in a fresh interpreter and times the import
+alone (interpreter start-up is excluded), so the figure is what a worker,
+test run or tool pays before it can serve or do anything else. Modules that
+cannot be imported here (asgi without Quart installed) are skipped.
+
+    python -m benchmarks.startup [--modules app,asgi,storage] [--repeat 20]
+                                 [--backend memory|sqlite|firestore] [--output FILE]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+from benchmarks.common import latency_stats, write_results
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TIMED_IMPORT = (
+    "import time\n"
+    "started = time.perf_counter()\n"
+    "import {module}\n"
+    "print(time.perf_counter() - started)\n"
+)
+
+
+def time_import(module, backend):
+    """Seconds to import module in a new interpreter, or None if it fails"""
+    env = dict(os.environ, STORAGE_BACKEND=backend)
+    completed = subprocess.run(
+        [sys.executable, '-c', TIMED_IMPORT.format(module=module)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        return None
+    return float(completed.stdout.strip().splitlines()[-1])
+
+
+def run(modules, repeat, backend):
+    """Time every module and return the result rows"""
+    results = []
+    for module in modules:
+        samples = []
+        for _ in range(repeat):
+            seconds = time_import(module, backend)
+            if seconds is None:
+                break
+            samples.append(seconds)
+        if not samples:
+            print(f"{module:<36} skipped (import failed)")
+            continue
+        stats = latency_stats(samples)
+        results.append({'name': f"import_{module}", 'unit': 'ms', 'rounds': len(samples), 'latency': stats})
+        print(f"import_{module:<29} p50 {stats['p50']:>10,.1f} ms   p95 {stats['p95']:>10,.1f} ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modules', default='app,asgi,storage', help='Modules to import')
+    parser.add_argument('--repeat', type=int, default=20, help='Fresh interpreters per module')
+    parser.add_argument('--backend', default='memory', help='STORAGE_BACKEND for the imported app')
+    parser.add_argument('--output', help='Result file (default: benchmarks/results/startup-<revision>.json)')
+    args = parser.parse_args()
+
+    modules = [module.strip() for module in args.modules.split(',') if module.strip()]
+    results = run(modules, args.repeat, args.backend)
+    config = {'modules': modules, 'repeat': args.repeat, 'backend': args.backend}
+    print(f"Results written to {write_results('startup', config, results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
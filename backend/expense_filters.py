@@ -0,0 +1,114 @@
+"""
+Filtering, sorting and note search for expense listings
+
+The storage backends answer query_expenses(user_id, start_date, end_date,
+filters, ...) where filters is the dict built by helpers.parse_expense_filters:
+
+    {'categories': ('Food', 'Travel'), 'min_amount': 5.0, 'max_amount': None,
+     'sort': '-amount', 'search_tokens': ('lunch',)}
+
+Category, amount and sort are pushed down into the backend query (Firestore
+composite indexes, SQLite indexes). Search goes through a per-user inverted
+index from each word of an expense's note and category to the ids of the
+expenses containing it, sharded by month so one index entry stays small:
+
+    (YYYY-MM, token) -> {expense_id, ...}
+
+The backends update it in the same batch or transaction as the expense write,
+using search_index_changes. A search reads one index entry per word and
+month, then only the matching expenses.
+"""
+
+import re
+
+from analytics import month_key
+
+# Sort orders: the fields compared (the expense id breaks ties), and whether
+# the order is descending
+EXPENSE_SORTS = ('date', '-date', 'amount', '-amount')
+SORT_FIELDS = {'date': ('date',), 'amount': ('amount', 'date')}
+
+# Firestore's limit on values in an 'in' filter
+MAX_FILTER_CATEGORIES = 30
+
+# Words shorter than this are not indexed, and at most MAX_EXPENSE_TOKENS
+# words of an expense are
+TOKEN_PATTERN = re.compile(r'\w+')
+MIN_TOKEN_LENGTH = 2
+MAX_EXPENSE_TOKENS = 32
+MAX_SEARCH_TOKENS = 8
+
+
+def tokenize(text):
+    """Distinct lowercase words of a text, in order of appearance"""
+    words = TOKEN_PATTERN.findall((text or '').casefold())
+    return list(dict.fromkeys(word for word in words if len(word) >= MIN_TOKEN_LENGTH))
+
+
+def expense_tokens(expense):
+    """Indexed words of an expense: its category, then its note"""
+    tokens = tokenize(expense.get('category'))
+    tokens += [token for token in tokenize(expense.get('note')) if token not in tokens]
+    return tokens[:MAX_EXPENSE_TOKENS]
+
+
+def index_entries(expense):
+    """(month, token) index entries an expense belongs to"""
+    month = month_key(expense['date'])
+    return {(month, token) for token in expense_tokens(expense)}
+
+
+def search_index_changes(expense_id, old, new):
+    """
+    Index changes caused by an expense going from old to new (None for a
+    create or delete) as {(month, token): {expense_id: present}}
+    """
+    before = index_entries(old) if old else set()
+    after = index_entries(new) if new else set()
+    changes = {entry: {expense_id: False} for entry in before - after}
+    changes.update({entry: {expense_id: True} for entry in after - before})
+    return changes
+
+
+def merge_search_changes(target, changes):
+    """Accumulate search_index_changes results (e.g. over a batch of expenses)"""
+    for entry, ids in changes.items():
+        target.setdefault(entry, {}).update(ids)
+    return target
+
+
+def sort_order(sort):
+    """(fields, descending) of a sort order"""
+    return SORT_FIELDS[sort.lstrip('-')], sort.startswith('-')
+
+
+def sort_key(expense, sort):
+    """Position of an expense in a sort order; also the start_after cursor of the next page"""
+    fields, _ = sort_order(sort)
+    return tuple(expense[field] for field in fields) + (expense['id'],)
+
+
+def matches_filters(expense, filters):
+    """Whether an expense passes the category and amount filters"""
+    categories = filters.get('categories')
+    if categories and expense.get('category') not in categories:
+        return False
+    amount = expense.get('amount', 0)
+    if filters.get('min_amount') is not None and amount < filters['min_amount']:
+        return False
+    if filters.get('max_amount') is not None and amount > filters['max_amount']:
+        return False
+    return True
+
+
+def sort_page(expenses, sort, limit=None, start_after=None):
+    """Sort expenses, skip those up to the start_after key and keep at most limit"""
+    _, descending = sort_order(sort)
+    ordered = sorted(expenses, key=lambda expense: sort_key(expense, sort), reverse=descending)
+    if start_after:
+        start_after = tuple(start_after)
+        ordered = [
+            expense for expense in ordered
+            if (sort_key(expense, sort) < start_after if descending else sort_key(expense, sort) > start_after)
+        ]
+    return ordered[:limit] if limit is not None else ordered
@@ -0,0 +1,206 @@
+"""
+Full-history export of a user's expenses or budgets as CSV or Parquet
+
+Expenses are read in cursor pages of EXPORT_PAGE_SIZE ordered by (date, id),
+so each storage query is short and bounded however long the history is.
+Every page is encoded and handed to the response before the next one is
+read: CSV as rows, Parquet as row groups of EXPORT_ROW_GROUP_SIZE rows. The
+server holds at most one page (CSV) or one row group (Parquet) of a user's
+data at a time.
+
+Expense CSVs use the import columns (amount, category, date, note), so an
+export can be imported again. Parquet needs the optional pyarrow package
+(pip install pyarrow); without it only CSV is offered.
+"""
+
+import csv
+import importlib.util
+import io
+
+from analytics import month_key
+
+EXPORT_PAGE_SIZE = 500
+EXPORT_ROW_GROUP_SIZE = 10000
+
+EXPORT_DATASETS = ('expenses', 'budgets')
+# pyarrow is optional and slow to import, so it is only loaded for a Parquet export
+EXPORT_FORMATS = ('csv', 'parquet') if importlib.util.find_spec('pyarrow') else ('csv',)
+
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+# Column order of each dataset
+EXPORT_COLUMNS = {
+    'expenses': ('id', 'date', 'amount', 'category', 'note', 'created_at', 'updated_at'),
+    'budgets': ('id', 'month', 'category', 'amount', 'created_at', 'updated_at')
+}
+
+
+def iter_expense_pages(storage, user_id, start_date, end_date, page_size=EXPORT_PAGE_SIZE):
+    """Yield a date range's expenses in pages ordered by (date, id), one cursor query per page"""
+    start_after = None
+    while True:
+        page = storage.page_expenses(user_id, start_date, end_date, page_size, start_after)
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        start_after = (page[-1]['date'], page[-1]['id'])
+
+
+async def aiter_expense_pages(storage, user_id, start_date, end_date, page_size=EXPORT_PAGE_SIZE):
+    """Async counterpart of iter_expense_pages for the async storage backends"""
+    start_after = None
+    while True:
+        page = await storage.page_expenses(user_id, start_date, end_date, page_size, start_after)
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        start_after = (page[-1]['date'], page[-1]['id'])
+
+
+def budgets_in_range(budgets, start_date, end_date):
+    """A user's budgets for the months of the date range, ordered by month and category"""
+    first, last = month_key(start_date), month_key(end_date)
+    return sorted(
+        (budget for budget in budgets if first <= budget.get('month', '') <= last),
+        key=lambda budget: (budget['month'], budget.get('category', ''))
+    )
+
+
+def export_values(dataset, document):
+    """A document's values in EXPORT_COLUMNS order"""
+    if dataset == 'expenses':
+        return (
+            document['id'], document['date'].date(), document['amount'], document.get('category', ''),
+            document.get('note', ''), document.get('created_at'), document.get('updated_at')
+        )
+    return (
+        document['id'], document['month'], document.get('category', ''), document['amount'],
+        document.get('created_at'), document.get('updated_at')
+    )
+
+
+def export_filename(params):
+    """Download name, e.g. expenses_all.csv or expenses_2024-01-01_2024-06-30.parquet"""
+    if params['full_history']:
+        span = 'all'
+    else:
+        span = f"{params['start_date']:%Y-%m-%d}_{params['end_date']:%Y-%m-%d}"
+    return f"{params['dataset']}_{span}.{params['format']}"
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    # dates as YYYY-MM-DD (the import format), timestamps as ISO 8601
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+class CsvExport:
+    """Encodes documents as CSV rows, page by page"""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def _encode(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerows(rows)
+        return buffer.getvalue().encode('utf-8')
+
+    def begin(self):
+        return self._encode([EXPORT_COLUMNS[self.dataset]])
+
+    def write(self, documents):
+        return self._encode(
+            [_csv_value(value) for value in export_values(self.dataset, document)] for document in documents
+        )
+
+    def finish(self):
+        return b''
+
+
+class _ChunkSink:
+    """Write-only file that keeps what pyarrow wrote until it is drained"""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ParquetExport:
+    """Encodes documents as Parquet, one row group per EXPORT_ROW_GROUP_SIZE rows"""
+
+    def __init__(self, dataset, row_group_size=EXPORT_ROW_GROUP_SIZE):
+        import pyarrow
+
+        self.dataset = dataset
+        self.row_group_size = row_group_size
+        timestamp = pyarrow.timestamp('us')
+        types = {
+            'id': pyarrow.string(), 'date': pyarrow.date32(), 'month': pyarrow.string(),
+            'amount': pyarrow.float64(), 'category': pyarrow.string(), 'note': pyarrow.string(),
+            'created_at': timestamp, 'updated_at': timestamp
+        }
+        self.schema = pyarrow.schema([(column, types[column]) for column in EXPORT_COLUMNS[dataset]])
+        self._sink = _ChunkSink()
+        self._writer = None
+        self._rows = []
+
+    def _flush_rows(self):
+        import pyarrow
+
+        columns = list(zip(*self._rows))
+        table = pyarrow.Table.from_arrays(
+            [pyarrow.array(values, type=field.type) for values, field in zip(columns, self.schema)],
+            schema=self.schema
+        )
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        self._rows = []
+
+    def begin(self):
+        import pyarrow.parquet
+
+        self._writer = pyarrow.parquet.ParquetWriter(self._sink, self.schema, compression='snappy')
+        return self._sink.drain()
+
+    def write(self, documents):
+        for document in documents:
+            self._rows.append(export_values(self.dataset, document))
+            if len(self._rows) >= self.row_group_size:
+                self._flush_rows()
+        return self._sink.drain()
+
+    def finish(self):
+        if self._rows:
+            self._flush_rows()
+        self._writer.close()
+        return self._sink.drain()
+
+
+def new_export(dataset, export_format):
+    """Encoder with begin(), write(documents) and finish(), each returning bytes to send"""
+    if export_format == 'parquet':
+        return ParquetExport(dataset)
+    return CsvExport(dataset)
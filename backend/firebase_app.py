@@ -0,0 +1,157 @@
+"""
+Lazy, per-process Firebase Admin app and Firestore clients
+
+Nothing is initialized at import time, so importing app.py or asgi.py (for
+tests, tooling or a pre-fork server's master process) neither reads the
+service account key nor opens a gRPC channel. The Firebase app is created on
+first use - token verification, the first Firestore call or warm_up() - and
+the Firestore clients are created per process: a worker forked from a
+process that already had them drops the inherited app and clients and builds
+its own, since gRPC channels must not be shared across fork().
+
+The service account key is read from FIREBASE_CREDENTIALS (default
+serviceAccountKey.json).
+"""
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CREDENTIALS_PATH = os.environ.get('FIREBASE_CREDENTIALS', 'serviceAccountKey.json')
+
+# How long a readiness result is reused before the backend is checked again,
+# and how long a check may wait for the backend to answer
+READINESS_TTL = float(os.environ.get('READINESS_TTL', 10))
+READINESS_TIMEOUT = float(os.environ.get('READINESS_TIMEOUT', 5))
+
+
+class Firebase:
+    """The Firebase Admin app and Firestore clients of the current process"""
+
+    def __init__(self, credentials_path=CREDENTIALS_PATH):
+        self.credentials_path = credentials_path
+        self._lock = threading.Lock()
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._app = None
+        self._clients = {}
+        self.error = None
+        self.init_seconds = None
+
+    def _after_fork(self):
+        # Another thread may have held the parent's lock at fork time
+        self._lock = threading.Lock()
+        self._reset()
+
+    def app(self):
+        """The firebase_admin App, initialized on first call"""
+        if self._app is None:
+            with self._lock:
+                if self._app is None:
+                    self._initialize()
+        return self._app
+
+    def _initialize(self):
+        import firebase_admin
+        from firebase_admin import credentials
+
+        started = time.perf_counter()
+        try:
+            try:
+                # Registered by the parent process before fork()
+                firebase_admin.delete_app(firebase_admin.get_app())
+            except ValueError:
+                pass
+            self._app = firebase_admin.initialize_app(credentials.Certificate(self.credentials_path))
+        except Exception as e:
+            self.error = str(e)
+            logger.error(f"Failed to initialize Firebase: {e}")
+            raise
+        self.error = None
+        self.init_seconds = time.perf_counter() - started
+        logger.info(f"Firebase initialized in {self.init_seconds * 1000:.0f} ms (pid {self._pid})")
+
+    def firestore_client(self):
+        """google.cloud.firestore.Client of this process"""
+        return self._client('sync')
+
+    def firestore_async_client(self):
+        """google.cloud.firestore.AsyncClient of this process"""
+        return self._client('async')
+
+    def _client(self, kind):
+        client = self._clients.get(kind)
+        if client is None:
+            app = self.app()
+            with self._lock:
+                client = self._clients.get(kind)
+                if client is None:
+                    from google.cloud import firestore
+
+                    if not app.project_id:
+                        raise ValueError('Project ID is required to access Firestore')
+                    client_class = firestore.AsyncClient if kind == 'async' else firestore.Client
+                    client = client_class(credentials=app.credential.get_credential(), project=app.project_id)
+                    self._clients[kind] = client
+        return client
+
+    def verify_id_token(self, token):
+        """Verify a Firebase ID token and return its decoded claims"""
+        from firebase_admin import auth
+
+        return auth.verify_id_token(token, app=self.app())
+
+    def status(self):
+        """Initialization state for /health"""
+        return {
+            'initialized': self._app is not None,
+            'init_ms': round(self.init_seconds * 1000, 1) if self.init_seconds is not None else None,
+            'firestore_clients': sorted(self._clients),
+            'pid': self._pid,
+            'error': self.error
+        }
+
+
+class Readiness:
+    """
+    Last result of a readiness check (Firebase initialized and storage
+    reachable), reused for READINESS_TTL seconds so frequent probes do not
+    each cost a Firestore read.
+    """
+
+    def __init__(self, ttl=READINESS_TTL):
+        self.ttl = ttl
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            # A forked worker checks its own connections
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self.ready = False
+        self.error = None
+        self.checked_at = None
+        # A check still waiting on the backend, so a hung connection is not pinged again
+        self.pending = None
+
+    def stale(self):
+        return self.checked_at is None or time.monotonic() - self.checked_at >= self.ttl
+
+    def record(self, error=None):
+        self.ready = error is None
+        self.error = str(error) if error is not None else None
+        self.checked_at = time.monotonic()
+        return self.ready
+
+    def state(self):
+        return {'ready': self.ready, 'error': self.error}
+
+
+# The process-wide instance used by both apps and the storage backends
+firebase = Firebase()
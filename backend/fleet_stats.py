@@ -0,0 +1,229 @@
+"""
+Fleet-wide statistics across all users (an offline job)
+
+Per month, over every user: total spend and expense count, spend by
+category, monthly active users (users with at least one expense), users
+with a budget and users over it (expenses above the month's total budget,
+as budget_status in /api/summary).
+
+The users are split into shards: user id ranges with about as many expenses
+each (storage.expense_partitions; on Firestore a partition query of the
+expenses collection group). A shard reads its users' expenses and budgets
+with one collection-group scan each and reduces them to per-month partial
+aggregates. A user's data always falls in a single shard, so per-user
+figures are final within it and partials merge by addition. Shards run in a
+pool of STATS_WORKERS processes, each with its own storage connection.
+
+Progress is checkpointed in the stats collection: the run (its id and shard
+bounds) in stats/_job and each finished shard's partial in
+stats/_job_<shard>. A run that stops part way is resumed by the next one,
+which only scans the shards without a checkpoint. The results are written to
+stats/<YYYY-MM> and the checkpoints are deleted.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import logging
+import multiprocessing
+import os
+import uuid
+
+from analytics import month_key, rollup_category
+from money import amount_cents, from_cents
+from storage import create_storage
+
+logger = logging.getLogger(__name__)
+
+STATS_SHARDS = int(os.environ.get('STATS_SHARDS', 16))
+STATS_WORKERS = int(os.environ.get('STATS_WORKERS', os.cpu_count() or 1))
+
+JOB_ID = '_job'
+
+# Expense fields the aggregates are computed from
+SCAN_FIELDS = ('amount', 'amount_cents', 'category', 'date')
+
+
+def checkpoint_id(shard):
+    """Stats document holding a finished shard's partial aggregate"""
+    return f"{JOB_ID}_{shard:04d}"
+
+
+def shard_ranges(bounds):
+    """[first_user, end_user) ranges from the user ids shards start at"""
+    starts = [None] + list(bounds)
+    return list(zip(starts, list(bounds) + [None]))
+
+
+def new_month_stats():
+    return {
+        'total_cents': 0, 'count': 0, 'categories': {},
+        'active_users': 0, 'budgeted_users': 0, 'over_budget_users': 0
+    }
+
+
+def aggregate_shard(storage, first_user, end_user):
+    """Partial aggregates {month: stats} of the users in [first_user, end_user)"""
+    months = {}
+    spend = {}  # (user_id, month) -> total cents
+    for user_id, expense in storage.scan_expenses(first_user, end_user, SCAN_FIELDS):
+        month = month_key(expense['date'])
+        cents = amount_cents(expense)
+        stats = months.get(month) or months.setdefault(month, new_month_stats())
+        entry = stats['categories'].setdefault(rollup_category(expense.get('category')), [0, 0])
+        entry[0] += cents
+        entry[1] += 1
+        stats['total_cents'] += cents
+        stats['count'] += 1
+        spend[user_id, month] = spend.get((user_id, month), 0) + cents
+
+    budgets = {}  # (user_id, month) -> total budget cents
+    for user_id, budget in storage.scan_budgets(first_user, end_user):
+        key = (user_id, budget['month'])
+        budgets[key] = budgets.get(key, 0) + amount_cents(budget)
+
+    for _, month in spend:
+        months[month]['active_users'] += 1
+    for (user_id, month), budget in budgets.items():
+        if budget <= 0:
+            continue
+        stats = months.setdefault(month, new_month_stats())
+        stats['budgeted_users'] += 1
+        if spend.get((user_id, month), 0) > budget:
+            stats['over_budget_users'] += 1
+    return months
+
+
+def merge_partials(partials):
+    """Add shard partials into one {month: stats}"""
+    merged = {}
+    for partial in partials:
+        for month, stats in partial.items():
+            target = merged.setdefault(month, new_month_stats())
+            for field in ('total_cents', 'count', 'active_users', 'budgeted_users', 'over_budget_users'):
+                target[field] += stats[field]
+            for category, (cents, count) in stats['categories'].items():
+                entry = target['categories'].setdefault(category, [0, 0])
+                entry[0] += cents
+                entry[1] += count
+    return merged
+
+
+def stats_document(month, stats):
+    """The stats/<YYYY-MM> document of a month"""
+    return {
+        'month': month,
+        'total_spend': from_cents(stats['total_cents']),
+        'expense_count': stats['count'],
+        'spend_by_category': {
+            category: {'total': from_cents(cents), 'count': count}
+            for category, (cents, count) in sorted(stats['categories'].items())
+        },
+        'active_users': stats['active_users'],
+        'budgeted_users': stats['budgeted_users'],
+        'over_budget_users': stats['over_budget_users']
+    }
+
+
+# Storage of a pool worker process, opened by _init_worker
+_worker_storage = None
+
+
+def _init_worker(backend):
+    global _worker_storage
+    _worker_storage = create_storage(backend)
+
+
+def _run_shard(first_user, end_user):
+    return aggregate_shard(_worker_storage, first_user, end_user)
+
+
+class StatsJob:
+    """
+    One run of the fleet statistics job. storage is used for the
+    checkpoints and results; the pool workers open backend themselves.
+    on_shard(shard, shards) is called after each shard is checkpointed.
+    """
+
+    def __init__(self, storage, backend, shards=STATS_SHARDS, workers=STATS_WORKERS, on_shard=None):
+        self.storage = storage
+        self.backend = backend
+        self.shards = shards
+        self.workers = workers
+        self.on_shard = on_shard
+
+    def _load_job(self, restart):
+        job = None if restart else self.storage.get_stats(JOB_ID)
+        if job is not None:
+            logger.info(f"Resuming stats run {job['run_id']}")
+            return job
+        job = {'run_id': uuid.uuid4().hex, 'bounds': self.storage.expense_partitions(self.shards)}
+        self.storage.set_stats(JOB_ID, job)
+        return job
+
+    def _checkpointed(self, job, shard_count):
+        partials = {}
+        for shard in range(shard_count):
+            checkpoint = self.storage.get_stats(checkpoint_id(shard))
+            # Checkpoints of an earlier run that was restarted are ignored
+            if checkpoint is not None and checkpoint['run_id'] == job['run_id']:
+                partials[shard] = checkpoint['months']
+        return partials
+
+    def _scan(self, ranges, pending):
+        """Yield (shard, partial or None if it failed) as shards finish"""
+        # A MemoryStorage is not shared with other processes
+        if self.workers <= 1 or self.backend == 'memory':
+            for shard in pending:
+                try:
+                    yield shard, aggregate_shard(self.storage, *ranges[shard])
+                except Exception as e:
+                    logger.error(f"Error aggregating stats shard {shard}: {e}")
+                    yield shard, None
+            return
+
+        # spawn: gRPC channels and SQLite connections must not cross fork()
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(pending)), mp_context=context,
+                                 initializer=_init_worker, initargs=(self.backend,)) as pool:
+            futures = {pool.submit(_run_shard, *ranges[shard]): shard for shard in pending}
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result()
+                except Exception as e:
+                    logger.error(f"Error aggregating stats shard {futures[future]}: {e}")
+                    yield futures[future], None
+
+    def run(self, restart=False):
+        """
+        Compute and store the statistics, resuming an unfinished run unless
+        restart. Returns {'shards', 'resumed', 'failed', 'months'}; with
+        failed shards nothing is written and the next run retries them.
+        """
+        job = self._load_job(restart)
+        ranges = shard_ranges(job['bounds'])
+        partials = self._checkpointed(job, len(ranges))
+        report = {'shards': len(ranges), 'resumed': len(partials), 'failed': 0, 'months': 0}
+
+        pending = [shard for shard in range(len(ranges)) if shard not in partials]
+        if pending:
+            for shard, partial in self._scan(ranges, pending):
+                if partial is None:
+                    report['failed'] += 1
+                    continue
+                self.storage.set_stats(checkpoint_id(shard), {'run_id': job['run_id'], 'months': partial})
+                partials[shard] = partial
+                if self.on_shard:
+                    self.on_shard(shard, len(ranges))
+        if report['failed']:
+            return report
+
+        merged = merge_partials(partials.values())
+        for month, stats in sorted(merged.items()):
+            self.storage.set_stats(month, stats_document(month, stats))
+        report['months'] = len(merged)
+
+        # The job document goes last, so a run stopped here is finished by the next
+        for shard in range(len(ranges)):
+            self.storage.delete_stats(checkpoint_id(shard))
+        self.storage.delete_stats(JOB_ID)
+        logger.info(f"Fleet stats: {report['months']} month(s) from {report['shards']} shard(s)")
+        return report
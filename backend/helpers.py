@@ -0,0 +1,567 @@
+"""
+Request parsing, validation and response helpers shared by the Flask app
+(app.py) and the async ASGI app (asgi.py)
+
+Nothing here touches storage or the web framework, so both apps accept and
+return exactly the same payloads.
+"""
+
+from datetime import datetime, timezone
+import base64
+import csv
+import hashlib
+import io
+import json
+import math
+
+from analytics import TREND_GRANULARITIES, month_key, month_keys, month_range
+from expense_filters import EXPENSE_SORTS, MAX_FILTER_CATEGORIES, MAX_SEARCH_TOKENS, sort_order, tokenize
+from export import EXPORT_DATASETS, EXPORT_FORMATS
+from money import amount_cents, from_cents, money_fields, to_cents
+from recurring import RECURRING_FREQUENCIES, naive_utc, today_utc
+from storage import EARLIEST_DATE, LATEST_DATE
+
+# Expense listing page sizes
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# Budget fields the analytics handlers read (field mask for the query)
+ANALYTICS_BUDGET_FIELDS = ('amount', 'amount_cents', 'category')
+
+# Longest range /api/trends will scan in one request
+MAX_TREND_MONTHS = 60
+
+# Rows written per storage batch during imports (Firestore's batch limit)
+IMPORT_BATCH_SIZE = 500
+# Largest upload accepted by the import endpoint, and row errors reported back
+MAX_IMPORT_ROWS = 100000
+MAX_IMPORT_ERRORS = 1000
+
+# Payloads the dashboard endpoint can return (all by default)
+DASHBOARD_SECTIONS = ('expenses', 'budgets', 'summary', 'report')
+
+IMPORT_MIMETYPES = {
+    'text/csv': 'csv',
+    'application/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'application/x-jsonlines': 'ndjson'
+}
+
+
+def get_current_month():
+    """Get current month in YYYY-MM format"""
+    return datetime.now().strftime('%Y-%m')
+
+
+def parse_date(date_string):
+    """Parse date string to datetime object"""
+    try:
+        return datetime.strptime(date_string, '%Y-%m-%d')
+    except ValueError:
+        return None
+
+
+def validate_amount(value):
+    """
+    Parse a positive amount into integer cents (rounded half up, so 0.004
+    is not positive). Returns (cents, error message)
+    """
+    try:
+        cents = to_cents(value)
+    except ValueError:
+        return None, 'Invalid amount format'
+    if cents <= 0:
+        return None, 'Amount must be positive'
+    return cents, None
+
+
+def validate_expense(data):
+    """
+    Validate a new expense payload and build the document to store.
+    Returns (expense_data, error message)
+    """
+    # Validate required fields
+    required_fields = ['amount', 'category', 'date']
+    for field in required_fields:
+        if field not in data:
+            return None, f'Missing required field: {field}'
+
+    # Validate amount
+    cents, error = validate_amount(data['amount'])
+    if error:
+        return None, error
+
+    # Parse and validate date
+    expense_date = parse_date(data['date']) if isinstance(data['date'], str) else None
+    if not expense_date:
+        return None, 'Invalid date format. Use YYYY-MM-DD'
+
+    category = data['category']
+    note = data.get('note') or ''
+    if not isinstance(category, str) or not isinstance(note, str):
+        return None, 'Category and note must be text'
+
+    now = datetime.now()
+    return {
+        **money_fields(cents),
+        'category': category.strip(),
+        'date': expense_date,
+        'note': note.strip(),
+        'created_at': now,
+        'updated_at': now
+    }, None
+
+
+def validate_expense_update(data):
+    """
+    Validate a partial expense update and build the fields to write.
+    Returns (update_data, error message)
+    """
+    update_data = {'updated_at': datetime.now()}
+
+    # Update amount if provided
+    if 'amount' in data:
+        cents, error = validate_amount(data['amount'])
+        if error:
+            return None, error
+        update_data.update(money_fields(cents))
+
+    # Update category if provided
+    if 'category' in data:
+        if not isinstance(data['category'], str):
+            return None, 'Category and note must be text'
+        update_data['category'] = data['category'].strip()
+
+    # Update date if provided
+    if 'date' in data:
+        expense_date = parse_date(data['date']) if isinstance(data['date'], str) else None
+        if not expense_date:
+            return None, 'Invalid date format. Use YYYY-MM-DD'
+        update_data['date'] = expense_date
+
+    # Update note if provided (null clears it, as on create)
+    if 'note' in data:
+        note = data['note'] or ''
+        if not isinstance(note, str):
+            return None, 'Category and note must be text'
+        update_data['note'] = note.strip()
+
+    return update_data, None
+
+
+def validate_budget(data):
+    """
+    Validate a budget payload and build the document to store.
+    Returns (budget_data, error message)
+    """
+    # Validate required fields
+    required_fields = ['amount', 'month']
+    for field in required_fields:
+        if field not in data:
+            return None, f'Missing required field: {field}'
+
+    # Validate amount
+    cents, error = validate_amount(data['amount'])
+    if error:
+        return None, error
+
+    # Validate month format (stored as YYYY-MM, which the budget id is keyed on)
+    month = data['month']
+    start_date, _ = get_month_range(month) if isinstance(month, str) else (None, None)
+    if not start_date:
+        return None, 'Invalid month format. Use YYYY-MM'
+
+    category = data.get('category') or ''
+    if not isinstance(category, str):
+        return None, 'Category must be text'
+
+    now = datetime.now()
+    return {
+        **money_fields(cents),
+        'month': month_key(start_date),
+        'category': category.strip(),
+        'created_at': now,
+        'updated_at': now
+    }, None
+
+
+def validate_recurring_rule(data):
+    """
+    Validate a new recurring expense rule and build the document to store.
+    start_date defaults to today; end_date is optional.
+    Returns (rule_data, error message)
+    """
+    for field in ('amount', 'category', 'frequency'):
+        if field not in data:
+            return None, f'Missing required field: {field}'
+
+    cents, error = validate_amount(data['amount'])
+    if error:
+        return None, error
+
+    category = data['category']
+    note = data.get('note') or ''
+    if not isinstance(category, str) or not isinstance(note, str) or not category.strip():
+        return None, 'Category and note must be text'
+
+    if data['frequency'] not in RECURRING_FREQUENCIES:
+        return None, f"Invalid frequency. Use one of: {', '.join(RECURRING_FREQUENCIES)}"
+
+    start_date = today_utc()
+    if data.get('start_date'):
+        start_date = parse_date(data['start_date']) if isinstance(data['start_date'], str) else None
+        if not start_date:
+            return None, 'Invalid start_date format. Use YYYY-MM-DD'
+
+    end_date, error = parse_end_date(data.get('end_date'), start_date)
+    if error:
+        return None, error
+
+    now = datetime.now()
+    return {
+        **money_fields(cents),
+        'category': category.strip(),
+        'note': note.strip(),
+        'frequency': data['frequency'],
+        'start_date': start_date,
+        'end_date': end_date,
+        'next_date': start_date,
+        'created_at': now,
+        'updated_at': now
+    }, None
+
+
+def validate_recurring_update(data, rule):
+    """
+    Validate a partial update of a rule (amount, category, note, end_date;
+    null end_date removes it). The schedule itself cannot change: create a
+    new rule instead. Returns (update_data, error message)
+    """
+    update_data = {'updated_at': datetime.now()}
+
+    if 'amount' in data:
+        cents, error = validate_amount(data['amount'])
+        if error:
+            return None, error
+        update_data.update(money_fields(cents))
+
+    for field in ('category', 'note'):
+        if field in data:
+            if not isinstance(data[field], str):
+                return None, 'Category and note must be text'
+            update_data[field] = data[field].strip()
+    if update_data.get('category') == '':
+        return None, 'Category and note must be text'
+
+    if 'end_date' in data:
+        end_date, error = parse_end_date(data['end_date'], rule['start_date'])
+        if error:
+            return None, error
+        update_data['end_date'] = end_date
+
+    return update_data, None
+
+
+def parse_end_date(value, start_date):
+    """Parse a rule's optional end_date. Returns (end_date or None, error message)"""
+    if not value:
+        return None, None
+    end_date = parse_date(value) if isinstance(value, str) else None
+    if not end_date:
+        return None, 'Invalid end_date format. Use YYYY-MM-DD'
+    if end_date < naive_utc(start_date):
+        return None, 'end_date must not be before start_date'
+    return end_date, None
+
+
+def expenses_payload(month, expenses):
+    """Body of the unpaginated expense list for a month"""
+    return {
+        'expenses': expenses,
+        'month': month,
+        'total_count': len(expenses)
+    }
+
+
+def budgets_payload(month, budgets):
+    """Body of the budget list for a month"""
+    return {
+        'budgets': budgets,
+        'month': month,
+        'total_budget': from_cents(sum(amount_cents(budget_data) for budget_data in budgets)),
+        'count': len(budgets)
+    }
+
+
+def parse_dashboard_sections(value):
+    """
+    Parse the dashboard's include parameter (comma-separated section names).
+    Returns (sections, error message); all sections when value is empty.
+    """
+    if not value:
+        return DASHBOARD_SECTIONS, None
+    sections = tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in sections if name not in DASHBOARD_SECTIONS]
+    if unknown or not sections:
+        return None, f"Invalid include. Use any of: {', '.join(DASHBOARD_SECTIONS)}"
+    return sections, None
+
+
+def encode_cursor(expense_data, sort='date'):
+    """
+    Opaque pagination cursor pointing just after an expense in a sort order
+    (by date, then id; amount sorts lead with the amount)
+    """
+    fields, _ = sort_order(sort)
+    values = [expense_data['date'].isoformat(), expense_data['id']]
+    if 'amount' in fields:
+        values.insert(0, expense_data['amount'])
+    raw = json.dumps(values).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort='date'):
+    """
+    Decode a pagination cursor into (date, id), or (amount, date, id) for
+    amount sorts; None if it is malformed or made for another sort
+    """
+    fields, _ = sort_order(sort)
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if 'amount' in fields:
+            amount, date_string, expense_id = values
+            amount = float(amount)
+        else:
+            date_string, expense_id = values
+        cursor_date = datetime.fromisoformat(date_string)
+    except (ValueError, TypeError):
+        return None
+    # Stored dates are naive UTC
+    if cursor_date.tzinfo:
+        cursor_date = cursor_date.astimezone(timezone.utc).replace(tzinfo=None)
+    if 'amount' in fields:
+        return amount, cursor_date, str(expense_id)
+    return cursor_date, str(expense_id)
+
+
+def parse_expense_filters(args):
+    """
+    Validate the expense listing's filter parameters: category (repeated or
+    comma-separated), min_amount, max_amount, sort and q (note search).
+    Returns (filters, error message); filters is None when none was given,
+    so the plain date-ordered listing is used.
+    """
+    if not any(args.get(name) for name in ('category', 'min_amount', 'max_amount', 'sort', 'q')):
+        return None, None
+
+    categories = tuple(dict.fromkeys(
+        category.strip() for value in args.getlist('category') for category in value.split(',') if category.strip()
+    ))
+    if len(categories) > MAX_FILTER_CATEGORIES:
+        return None, f'Too many categories. Maximum is {MAX_FILTER_CATEGORIES}'
+
+    amounts = {}
+    for name in ('min_amount', 'max_amount'):
+        amounts[name] = None
+        if args.get(name):
+            try:
+                amounts[name] = float(args[name])
+            except ValueError:
+                return None, f'Invalid {name}. Must be a number'
+            if not math.isfinite(amounts[name]):
+                return None, f'Invalid {name}. Must be a number'
+    if amounts['min_amount'] is not None and amounts['max_amount'] is not None \
+            and amounts['min_amount'] > amounts['max_amount']:
+        return None, 'min_amount must not be greater than max_amount'
+
+    sort = args.get('sort') or 'date'
+    if sort not in EXPENSE_SORTS:
+        return None, f"Invalid sort. Use one of: {', '.join(EXPENSE_SORTS)}"
+
+    search_tokens = ()
+    if args.get('q'):
+        search_tokens = tuple(tokenize(args['q']))
+        if not search_tokens:
+            return None, 'Search must contain a word of at least two characters'
+        if len(search_tokens) > MAX_SEARCH_TOKENS:
+            return None, f'Too many search words. Maximum is {MAX_SEARCH_TOKENS}'
+
+    return {
+        'categories': categories,
+        'min_amount': amounts['min_amount'],
+        'max_amount': amounts['max_amount'],
+        'sort': sort,
+        'search_tokens': search_tokens
+    }, None
+
+
+def get_month_range(month_str):
+    """Get start and end dates for a given month (YYYY-MM)"""
+    try:
+        return month_range(month_str)
+    except ValueError:
+        return None, None
+
+
+def parse_trend_params(args, current_month):
+    """
+    Validate /api/trends query parameters (start, end, granularity).
+    Returns ({start_month, end_month, start_date, end_date, granularity}, error message)
+    """
+    end_month = args.get('end', current_month)
+    end_start, end_date = get_month_range(end_month)
+    if not end_date:
+        return None, 'Invalid end month format. Use YYYY-MM'
+
+    # Default to the 12 months ending at end_month
+    first_index = end_start.year * 12 + end_start.month - 12
+    start_month = args.get('start', f"{first_index // 12:04d}-{first_index % 12 + 1:02d}")
+    start_date, _ = get_month_range(start_month)
+    if not start_date:
+        return None, 'Invalid start month format. Use YYYY-MM'
+    if start_date > end_date:
+        return None, 'Start month must not be after end month'
+
+    if len(month_keys(start_date, end_date)) > MAX_TREND_MONTHS:
+        return None, f'Range too long. Maximum is {MAX_TREND_MONTHS} months'
+
+    granularity = args.get('granularity', 'month')
+    if granularity not in TREND_GRANULARITIES:
+        return None, f"Invalid granularity. Use one of: {', '.join(TREND_GRANULARITIES)}"
+
+    return {
+        'start_month': start_month,
+        'end_month': end_month,
+        'start_date': start_date,
+        'end_date': end_date,
+        'granularity': granularity
+    }, None
+
+
+def parse_export_params(args):
+    """
+    Validate export query parameters (dataset, format, start, end). start and
+    end are optional YYYY-MM-DD days; without them the whole history is exported.
+    Returns ({dataset, format, start_date, end_date, full_history}, error message)
+    """
+    dataset = args.get('dataset', 'expenses')
+    if dataset not in EXPORT_DATASETS:
+        return None, f"Invalid dataset. Use one of: {', '.join(EXPORT_DATASETS)}"
+
+    export_format = args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return None, f"Invalid format. Use one of: {', '.join(EXPORT_FORMATS)}"
+
+    start_date, end_date = EARLIEST_DATE, LATEST_DATE
+    if args.get('start'):
+        start_date = parse_date(args['start'])
+        if not start_date:
+            return None, 'Invalid start date format. Use YYYY-MM-DD'
+    if args.get('end'):
+        end_date = parse_date(args['end'])
+        if not end_date:
+            return None, 'Invalid end date format. Use YYYY-MM-DD'
+        end_date = end_date.replace(hour=23, minute=59, second=59)
+    if start_date > end_date:
+        return None, 'Start date must not be after end date'
+
+    return {
+        'dataset': dataset,
+        'format': export_format,
+        'start_date': start_date,
+        'end_date': end_date,
+        'full_history': not args.get('start') and not args.get('end')
+    }, None
+
+
+def versions_etag(user_id, versions):
+    """ETag value for a response built from a user's data at the given {month: version}"""
+    tokens = ','.join(f"{month}:{versions[month]}" for month in sorted(versions))
+    return hashlib.sha1(f"{user_id}|{tokens}".encode('utf-8')).hexdigest()[:16]
+
+
+def iter_import_rows(stream, import_format):
+    """
+    Parse a CSV or NDJSON upload as a stream.
+    Yields (row number, row dict, parse error) one row at a time.
+    """
+    text = io.TextIOWrapper(io.BufferedReader(stream), encoding='utf-8-sig', newline='')
+    if import_format == 'csv':
+        for row_number, row in enumerate(csv.DictReader(text), start=1):
+            yield row_number, row, None
+        return
+
+    row_number = 0
+    for line in text:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield row_number, None, 'Invalid JSON'
+            continue
+        if not isinstance(row, dict):
+            yield row_number, None, 'Each line must be a JSON object'
+            continue
+        yield row_number, row, None
+
+
+def import_document_id(user_id, key):
+    """Deterministic expense id for an idempotency key, so retried rows are skipped"""
+    return 'imp' + hashlib.sha256(f"{user_id}:{key}".encode('utf-8')).hexdigest()[:32]
+
+
+def new_import_report():
+    """Counters returned by the import endpoint"""
+    return {'total_rows': 0, 'imported': 0, 'skipped': 0, 'failed': 0, 'errors': []}
+
+
+def record_import_error(report, row_number, message):
+    """Count a failed row, keeping the first MAX_IMPORT_ERRORS messages"""
+    report['failed'] += 1
+    if len(report['errors']) < MAX_IMPORT_ERRORS:
+        report['errors'].append({'row': row_number, 'error': message})
+
+
+def iter_import_batches(user_id, stream, import_format, upload_key, report):
+    """
+    Validate an upload row by row and yield batches of up to
+    IMPORT_BATCH_SIZE (row number, document id or None, expense) to write.
+    Rows are keyed by the upload's Idempotency-Key and their row number, or
+    by their own idempotency_key field. Invalid rows are recorded in report.
+    """
+    pending = []
+    for row_number, row, error in iter_import_rows(stream, import_format):
+        if row_number > MAX_IMPORT_ROWS:
+            record_import_error(report, row_number, f'Import limit of {MAX_IMPORT_ROWS} rows exceeded')
+            break
+        report['total_rows'] += 1
+
+        expense_data = None
+        if not error:
+            expense_data, error = validate_expense(row)
+        if error:
+            record_import_error(report, row_number, error)
+            continue
+
+        key = str(row.get('idempotency_key') or '').strip()
+        if not key and upload_key:
+            key = f"{upload_key}:{row_number}"
+        pending.append((row_number, import_document_id(user_id, key) if key else None, expense_data))
+
+        if len(pending) >= IMPORT_BATCH_SIZE:
+            yield pending
+            pending = []
+
+    if pending:
+        yield pending
+
+
+def record_import_batch(report, batch, written):
+    """Count a stored batch; rows not written already existed"""
+    report['imported'] += len(written)
+    report['skipped'] += len(batch) - len(written)
@@ -0,0 +1,311 @@
+"""
+Live budget status for a user's month, pushed over Server-Sent Events
+
+Instead of polling /api/summary, a client keeps one event stream open per
+month. The stream starts with a 'status' event holding the month's totals,
+per-category totals and budget_status; after every expense or budget write
+to the month a 'delta' event carries only what changed, as a JSON Merge
+Patch (RFC 7386) of the status: changed fields with their new value,
+categories that dropped to nothing as null. A client that falls behind
+receives a fresh 'status' event instead of the deltas it missed.
+
+All of a user's connections to a month share one channel: one storage
+listener (a Firestore on_snapshot listener on the month's version document,
+or the in-process notification of the memory and SQLite backends) and one
+rollup and budget read per change, whatever the number of connections. The
+listener is removed when the last connection for the month closes.
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+
+from analytics import build_summary, rollup_cents
+from money import from_cents
+from responses import encode_json
+
+logger = logging.getLogger(__name__)
+
+# Seconds between keep-alive comments on an idle stream, and events buffered
+# per connection before a slow client is resynchronized
+LIVE_HEARTBEAT = float(os.environ.get('LIVE_HEARTBEAT', 15))
+LIVE_QUEUE_SIZE = int(os.environ.get('LIVE_QUEUE_SIZE', 32))
+
+# Summary fields carried in the status, next to 'categories'
+STATUS_FIELDS = (
+    'total_expenses', 'total_budget', 'remaining_budget', 'budget_usage_percent', 'budget_status',
+    'expense_count', 'budget_count'
+)
+
+# Reconnection delay for EventSource clients, then keep-alive comment
+SSE_RETRY = b'retry: 5000\n\n'
+SSE_HEARTBEAT = b': keep-alive\n\n'
+
+
+def live_status(month, rollup, budgets):
+    """Status of a month: summary totals, budget_status and per-category totals"""
+    summary = build_summary(month, rollup, budgets)
+    status = {field: summary[field] for field in STATUS_FIELDS}
+    status['month'] = month
+    status['categories'] = {
+        category: from_cents(rollup_cents(totals))
+        for category, totals in rollup.get('categories', {}).items()
+        if totals.get('count', 0) > 0
+    }
+    return status
+
+
+def status_delta(old, new):
+    """JSON Merge Patch turning status old into new, or None if nothing changed"""
+    delta = {field: value for field, value in new.items() if field != 'categories' and old.get(field) != value}
+    old_categories, new_categories = old['categories'], new['categories']
+    categories = {
+        category: total for category, total in new_categories.items() if old_categories.get(category) != total
+    }
+    categories.update({category: None for category in old_categories if category not in new_categories})
+    if categories:
+        delta['categories'] = categories
+    return delta or None
+
+
+def sse_event(event, data):
+    """Encode one Server-Sent Event with a JSON payload"""
+    return b'event: ' + event.encode('ascii') + b'\ndata: ' + encode_json(data) + b'\n\n'
+
+
+class _Channel:
+    """Subscribers of one user's month and the status last sent to them"""
+
+    def __init__(self, user_id, month):
+        self.user_id = user_id
+        self.month = month
+        self.subscribers = set()
+        self.status = None
+        self.unwatch = None
+        self.refreshing = False
+        self.dirty = False
+
+
+class LiveStatusHub:
+    """
+    Channels for the Flask app. Subscribers are queue.Queue objects of
+    encoded events; refreshes run on executor.
+    """
+
+    def __init__(self, storage, load, executor, queue_size=LIVE_QUEUE_SIZE):
+        self.storage = storage
+        self.load = load  # (user_id, month) -> status
+        self.executor = executor
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._channels = {}  # (user_id, month) -> _Channel
+        self.refreshes = 0
+        self.resyncs = 0
+
+    def subscribe(self, user_id, month):
+        """A queue that receives the month's status, then its deltas"""
+        key = (user_id, month)
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            channel = self._channels.get(key)
+            created = channel is None
+            if created:
+                channel = self._channels[key] = _Channel(user_id, month)
+            elif channel.status is not None:
+                subscriber.put_nowait(sse_event('status', channel.status))
+            channel.subscribers.add(subscriber)
+        if created:
+            # Registered outside the hub lock: in-process backends notify under their own lock
+            unwatch = self.storage.watch_versions(user_id, month, lambda: self._changed(key))
+            with self._lock:
+                closed = self._channels.get(key) is not channel
+                channel.unwatch = None if closed else unwatch
+            if closed:
+                unwatch()
+            self._changed(key)
+        return subscriber
+
+    def unsubscribe(self, user_id, month, subscriber):
+        """Drop a subscriber; the last one for a month removes the listener"""
+        key = (user_id, month)
+        unwatch = None
+        with self._lock:
+            channel = self._channels.get(key)
+            if channel is None:
+                return
+            channel.subscribers.discard(subscriber)
+            if not channel.subscribers:
+                del self._channels[key]
+                unwatch = channel.unwatch
+        if unwatch:
+            unwatch()
+
+    def _changed(self, key):
+        # Called by the storage listener: at most one refresh per channel runs,
+        # and changes arriving meanwhile are folded into one more
+        with self._lock:
+            channel = self._channels.get(key)
+            if channel is None:
+                return
+            if channel.refreshing:
+                channel.dirty = True
+                return
+            channel.refreshing = True
+        self.executor.submit(self._refresh, channel)
+
+    def _refresh(self, channel):
+        while True:
+            try:
+                status = self.load(channel.user_id, channel.month)
+            except Exception as e:
+                logger.error(f"Error refreshing live status: {e}")
+                status = None
+            with self._lock:
+                self.refreshes += 1
+                if status is not None:
+                    self._publish(channel, status)
+                if not channel.dirty or self._channels.get((channel.user_id, channel.month)) is not channel:
+                    channel.refreshing = False
+                    return
+                channel.dirty = False
+
+    def _publish(self, channel, status):
+        # The caller holds the lock
+        if channel.status is None:
+            event = sse_event('status', status)
+        else:
+            delta = status_delta(channel.status, status)
+            event = sse_event('delta', delta) if delta else None
+        channel.status = status
+        if event is None:
+            return
+        for subscriber in channel.subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # Too far behind for deltas: replace the backlog with the current status
+                self.resyncs += 1
+                while not subscriber.empty():
+                    subscriber.get_nowait()
+                subscriber.put_nowait(sse_event('status', status))
+
+    def stats(self):
+        """Return channel and subscriber counts"""
+        with self._lock:
+            return {
+                'channels': len(self._channels),
+                'subscribers': sum(len(channel.subscribers) for channel in self._channels.values()),
+                'refreshes': self.refreshes,
+                'resyncs': self.resyncs
+            }
+
+
+class AsyncLiveStatusHub:
+    """
+    Channels for the ASGI app. Subscribers are asyncio.Queue objects;
+    listener callbacks arrive on other threads and are moved to the event
+    loop, where load (a coroutine function) runs.
+    """
+
+    def __init__(self, storage, load, queue_size=LIVE_QUEUE_SIZE):
+        self.storage = storage
+        self.load = load  # async (user_id, month) -> status
+        self.queue_size = queue_size
+        self._loop = None
+        self._channels = {}  # (user_id, month) -> _Channel
+        self.refreshes = 0
+        self.resyncs = 0
+
+    async def subscribe(self, user_id, month):
+        """A queue that receives the month's status, then its deltas"""
+        self._loop = asyncio.get_running_loop()
+        key = (user_id, month)
+        subscriber = asyncio.Queue(maxsize=self.queue_size)
+        channel = self._channels.get(key)
+        created = channel is None
+        if created:
+            channel = self._channels[key] = _Channel(user_id, month)
+        elif channel.status is not None:
+            subscriber.put_nowait(sse_event('status', channel.status))
+        channel.subscribers.add(subscriber)
+        if created:
+            # Starting a Firestore listener blocks while it opens its stream
+            unwatch = await asyncio.to_thread(self.storage.watch_versions, user_id, month, self._notify(key))
+            if self._channels.get(key) is channel:
+                channel.unwatch = unwatch
+            else:
+                await asyncio.to_thread(unwatch)
+            self._changed(key)
+        return subscriber
+
+    def unsubscribe(self, user_id, month, subscriber):
+        """Drop a subscriber; the last one for a month removes the listener"""
+        key = (user_id, month)
+        channel = self._channels.get(key)
+        if channel is None:
+            return
+        channel.subscribers.discard(subscriber)
+        if not channel.subscribers:
+            del self._channels[key]
+            if channel.unwatch:
+                self._loop.run_in_executor(None, channel.unwatch)
+
+    def _notify(self, key):
+        def callback():
+            self._loop.call_soon_threadsafe(self._changed, key)
+        return callback
+
+    def _changed(self, key):
+        channel = self._channels.get(key)
+        if channel is None:
+            return
+        if channel.refreshing:
+            channel.dirty = True
+            return
+        channel.refreshing = True
+        asyncio.ensure_future(self._refresh(channel))
+
+    async def _refresh(self, channel):
+        while True:
+            try:
+                status = await self.load(channel.user_id, channel.month)
+            except Exception as e:
+                logger.error(f"Error refreshing live status: {e}")
+                status = None
+            self.refreshes += 1
+            if status is not None:
+                self._publish(channel, status)
+            if not channel.dirty or self._channels.get((channel.user_id, channel.month)) is not channel:
+                channel.refreshing = False
+                return
+            channel.dirty = False
+
+    def _publish(self, channel, status):
+        if channel.status is None:
+            event = sse_event('status', status)
+        else:
+            delta = status_delta(channel.status, status)
+            event = sse_event('delta', delta) if delta else None
+        channel.status = status
+        if event is None:
+            return
+        for subscriber in channel.subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except asyncio.QueueFull:
+                # Too far behind for deltas: replace the backlog with the current status
+                self.resyncs += 1
+                while not subscriber.empty():
+                    subscriber.get_nowait()
+                subscriber.put_nowait(sse_event('status', status))
+
+    def stats(self):
+        """Return channel and subscriber counts"""
+        return {
+            'channels': len(self._channels),
+            'subscribers': sum(len(channel.subscribers) for channel in self._channels.values()),
+            'refreshes': self.refreshes,
+            'resyncs': self.resyncs
+        }
@@ -0,0 +1,394 @@
+"""
+Request, auth and storage metrics in Prometheus text format
+
+The apps record, per process:
+
+- per-route request latency histograms, status codes and in-flight requests
+- token verification time, split by outcome (cached, verified, failed)
+- storage call counts, durations, errors and documents read, per backend
+  and operation (every Firestore read and write goes through the storage
+  layer, so this covers the Firestore client)
+
+and serve them at /metrics. A sampled fraction of requests
+(SERVER_TIMING_SAMPLE_RATE) also get a Server-Timing header breaking the
+request down into auth, storage and total time.
+
+Metrics are kept in the process that served the request; with several
+workers each one is scraped separately (or summed by the scraper).
+"""
+
+import contextvars
+import os
+import random
+import threading
+import time
+
+# Histogram buckets in seconds
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STORAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+AUTH_BUCKETS = (0.0001, 0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named metric family with a fixed set of label names"""
+
+    type = 'untyped'
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}  # label values -> sample state
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(items))
+        return lines
+
+    def _render_samples(self, items):
+        return [
+            f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+            for labels, value in items
+        ]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help_text, label_names=(), buckets=REQUEST_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, *labels, value):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, sum, count
+                state = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def _render_samples(self, items):
+        lines = []
+        inf = 'le="+Inf"'
+        for labels, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, inf)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+class RequestTiming:
+    """Time spent per component during one sampled request (for Server-Timing)"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans = {}  # name -> [seconds, calls]
+
+    def add(self, name, seconds):
+        with self._lock:
+            span = self.spans.setdefault(name, [0.0, 0])
+            span[0] += seconds
+            span[1] += 1
+
+    def header(self):
+        """Server-Timing header value; storage time is summed over calls that may overlap"""
+        parts = []
+        with self._lock:
+            for name, (seconds, calls) in sorted(self.spans.items()):
+                parts.append(f'{name};dur={seconds * 1000:.2f};desc="{calls} call(s)"')
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.2f}")
+        return ', '.join(parts)
+
+
+# The sampled request's timing, if any; thread pools and asyncio tasks see it
+# through a copied context
+_current_timing = contextvars.ContextVar('request_timing', default=None)
+
+
+class Metrics:
+    """The metric families recorded by the apps"""
+
+    def __init__(self, sample_rate=0.0):
+        self.sample_rate = sample_rate
+        self.requests = Counter(
+            'http_requests_total', 'HTTP requests by route and status code', ('method', 'route', 'status'))
+        self.request_duration = Histogram(
+            'http_request_duration_seconds', 'Time to produce a response, by route', ('method', 'route'))
+        self.in_flight = Gauge('http_requests_in_flight', 'Requests currently being handled')
+        self.auth_duration = Histogram(
+            'auth_token_verification_duration_seconds', 'Time spent verifying ID tokens, by outcome',
+            ('outcome',), AUTH_BUCKETS)
+        self.storage_duration = Histogram(
+            'storage_call_duration_seconds', 'Storage (Firestore) call latency by operation',
+            ('backend', 'operation'), STORAGE_BUCKETS)
+        self.storage_errors = Counter(
+            'storage_call_errors_total', 'Storage calls that raised, by operation', ('backend', 'operation'))
+        self.storage_documents = Counter(
+            'storage_documents_read_total', 'Documents returned by storage calls, by operation',
+            ('backend', 'operation'))
+        self.in_flight.set(value=0)
+        self._collectors = []
+
+    def add_collector(self, collect):
+        """Register a callable returning extra metric lines (e.g. cache stats) at scrape time"""
+        self._collectors.append(collect)
+
+    # Requests
+    def start_request(self):
+        """Mark a request as in flight; returns its RequestTiming when sampled, else None"""
+        self.in_flight.inc()
+        timing = RequestTiming() if self.sample_rate and random.random() < self.sample_rate else None
+        _current_timing.set(timing)
+        return timing
+
+    def finish_request(self, method, route, status, seconds):
+        """Record a response"""
+        self.requests.inc(method, route, str(status))
+        self.request_duration.observe(method, route, value=seconds)
+
+    def end_request(self):
+        """Mark a request as no longer in flight (called on teardown, also after errors)"""
+        self.in_flight.dec()
+        _current_timing.set(None)
+
+    # Auth
+    def record_auth(self, outcome, seconds):
+        self.auth_duration.observe(outcome, value=seconds)
+        timing = _current_timing.get()
+        if timing is not None:
+            timing.add('auth', seconds)
+
+    # Storage
+    def record_storage(self, backend, operation, seconds, documents=0, failed=False):
+        self.storage_duration.observe(backend, operation, value=seconds)
+        if failed:
+            self.storage_errors.inc(backend, operation)
+        if documents:
+            self.storage_documents.inc(backend, operation, amount=documents)
+        timing = _current_timing.get()
+        if timing is not None:
+            timing.add('storage', seconds)
+
+    def render(self):
+        """Prometheus text exposition of every metric"""
+        lines = []
+        for metric in (self.requests, self.request_duration, self.in_flight, self.auth_duration,
+                       self.storage_duration, self.storage_errors, self.storage_documents):
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            lines.extend(collect())
+        return '\n'.join(lines) + '\n'
+
+
+def stats_gauges(prefix, help_text, stats):
+    """Render the numeric fields of a cache stats() dict as gauges"""
+    lines = []
+    for field, value in sorted(stats.items()):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        name = f"{prefix}_{field}"
+        lines.extend([f"# HELP {name} {help_text} ({field})", f"# TYPE {name} gauge", f"{name} {value}"])
+    return lines
+
+
+# Documents a storage operation returned, from its result
+def _count_list(result):
+    return len(result)
+
+
+def _count_one(result):
+    return 1 if result is not None else 0
+
+
+def _count_rollup(result):
+    return result.get('count', 0) if result else 0
+
+
+DOCUMENT_COUNTS = {
+    'list_expenses': _count_list,
+    'list_expense_columns': _count_list,
+    'page_expenses': _count_list,
+    'query_expenses': _count_list,
+    'list_budgets': _count_list,
+    'list_recurring_rules': _count_list,
+    'list_due_recurring_rules': _count_list,
+    'get_expense': _count_one,
+    'get_budget': _count_one,
+    'get_recurring_rule': _count_one,
+    'get_rollup': _count_one,
+    'get_stats': _count_one,
+    'get_versions': _count_list,
+    'update_expense': _count_one,
+    'delete_expense': _count_one,
+    'rebuild_rollup': _count_rollup
+}
+
+
+# Listener registrations, not storage calls
+UNTIMED_OPERATIONS = ('watch_versions',)
+
+# Operations returning a generator, timed while they produce documents
+GENERATOR_OPERATIONS = ('iter_expenses', 'scan_expenses', 'scan_budgets')
+
+
+class InstrumentedStorage:
+    """Storage wrapper recording the duration, errors and documents of every call"""
+
+    def __init__(self, storage, metrics):
+        self.storage = storage
+        self.metrics = metrics
+        self.name = storage.name
+
+    def __getattr__(self, operation):
+        method = getattr(self.storage, operation)
+        if not callable(method) or operation.startswith('_') or operation in UNTIMED_OPERATIONS:
+            return method
+        wrapper = self._wrap_generator(operation, method) if operation in GENERATOR_OPERATIONS \
+            else self._wrap(operation, method)
+        # Cache the wrapper so __getattr__ runs once per operation
+        setattr(self, operation, wrapper)
+        return wrapper
+
+    def _wrap(self, operation, method):
+        count = DOCUMENT_COUNTS.get(operation)
+
+        def call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            except Exception:
+                self.metrics.record_storage(self.name, operation, time.perf_counter() - started, failed=True)
+                raise
+            documents = count(result) if count else 0
+            self.metrics.record_storage(self.name, operation, time.perf_counter() - started, documents)
+            return result
+        return call
+
+    def _wrap_generator(self, operation, method):
+        def call(*args, **kwargs):
+            # Only time spent producing documents is counted, not the consumer's
+            elapsed = 0.0
+            documents = 0
+            failed = False
+            iterator = iter(method(*args, **kwargs))
+            try:
+                while True:
+                    started = time.perf_counter()
+                    try:
+                        document = next(iterator)
+                    except StopIteration:
+                        elapsed += time.perf_counter() - started
+                        break
+                    elapsed += time.perf_counter() - started
+                    documents += 1
+                    yield document
+            except Exception:
+                failed = True
+                raise
+            finally:
+                self.metrics.record_storage(self.name, operation, elapsed, documents, failed)
+        return call
+
+
+class InstrumentedAsyncStorage(InstrumentedStorage):
+    """InstrumentedStorage for the async backends (coroutines and async generators)"""
+
+    def _wrap(self, operation, method):
+        count = DOCUMENT_COUNTS.get(operation)
+
+        async def call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = await method(*args, **kwargs)
+            except Exception:
+                self.metrics.record_storage(self.name, operation, time.perf_counter() - started, failed=True)
+                raise
+            documents = count(result) if count else 0
+            self.metrics.record_storage(self.name, operation, time.perf_counter() - started, documents)
+            return result
+        return call
+
+    def _wrap_generator(self, operation, method):
+        async def call(*args, **kwargs):
+            elapsed = 0.0
+            documents = 0
+            failed = False
+            iterator = method(*args, **kwargs).__aiter__()
+            try:
+                while True:
+                    started = time.perf_counter()
+                    try:
+                        document = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        elapsed += time.perf_counter() - started
+                        break
+                    elapsed += time.perf_counter() - started
+                    documents += 1
+                    yield document
+            except Exception:
+                failed = True
+                raise
+            finally:
+                self.metrics.record_storage(self.name, operation, elapsed, documents, failed)
+        return call
+
+
+def create_metrics():
+    """Create the metrics registry; SERVER_TIMING_SAMPLE_RATE (0-1, default 0) enables Server-Timing"""
+    return Metrics(sample_rate=min(1.0, max(0.0, float(os.environ.get('SERVER_TIMING_SAMPLE_RATE', 0)))))
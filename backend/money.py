@@ -0,0 +1,118 @@
+"""
+Money as integer minor units (cents) and compact records for aggregation
+
+Amounts are parsed once, at the API boundary, into integer cents with
+decimal rounding (to_cents) and stored as amount_cents on expenses, budgets
+and recurring rules. Rollups keep total_cents. Sums of integers are exact,
+so totals no longer drift with the number of expenses and need no rounding
+before they are returned. The float amount is still stored next to it:
+it is what the amount filters, amount sort and exports read.
+
+Documents written before amounts were kept in cents only have the float
+amount; amount_cents() converts those on read, and the migrate-amounts
+command stores amount_cents on them.
+
+The aggregation paths (rollup rebuilds, trends) read expenses into
+ExpenseColumns instead of one dict per expense: parallel arrays of amounts,
+category codes and dates, with each category name stored once.
+"""
+
+from array import array
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+CENT = Decimal('0.01')
+
+# Largest amount the int64 fields of Firestore, SQLite and ExpenseColumns hold
+MAX_CENTS = 2 ** 63 - 1
+
+
+def to_cents(value):
+    """
+    Convert an amount (number or numeric string) to integer cents, rounding
+    half up. Floats are converted from their shortest repr, so 0.1 + 0.2
+    becomes 30. Raises ValueError for non-numeric or non-finite values.
+    """
+    try:
+        if isinstance(value, bool):
+            raise InvalidOperation
+        cents = int(Decimal(str(value)).quantize(CENT, rounding=ROUND_HALF_UP).scaleb(2))
+    except (InvalidOperation, ValueError, OverflowError):
+        raise ValueError(f"Invalid amount: {value!r}")
+    if abs(cents) > MAX_CENTS:
+        raise ValueError(f"Amount out of range: {value!r}")
+    return cents
+
+
+def from_cents(cents):
+    """Amount in currency units for responses (the float nearest to cents / 100)"""
+    return cents / 100
+
+
+def amount_cents(document):
+    """A document's amount in cents, converting the float amount of documents stored before amount_cents"""
+    cents = document.get('amount_cents')
+    if cents is not None:
+        return cents
+    return to_cents(document.get('amount') or 0)
+
+
+def money_fields(cents):
+    """The amount fields stored for an amount of cents"""
+    return {'amount': from_cents(cents), 'amount_cents': cents}
+
+
+class BudgetRecord:
+    """The fields of a budget the analytics read"""
+
+    __slots__ = ('month', 'category', 'amount_cents')
+
+    def __init__(self, month, category, amount_cents):
+        self.month = month
+        self.category = category
+        self.amount_cents = amount_cents
+
+    @classmethod
+    def from_document(cls, document):
+        return cls(document.get('month'), document.get('category', 'general'), amount_cents(document))
+
+
+class ExpenseColumns:
+    """
+    Expenses stored column-wise: amount_cents (int64), category_codes
+    (uint32 indexes into categories) and ordinals (date.toordinal() of each
+    expense's date). About 16 bytes per expense instead of a dict and its
+    values; the arrays can be handed to NumPy without copying.
+    """
+
+    __slots__ = ('amount_cents', 'category_codes', 'ordinals', 'categories', '_codes')
+
+    def __init__(self):
+        self.amount_cents = array('q')
+        self.category_codes = array('I')
+        self.ordinals = array('i')
+        self.categories = []
+        self._codes = {}
+
+    def __len__(self):
+        return len(self.amount_cents)
+
+    def append(self, cents, category, ordinal):
+        code = self._codes.get(category)
+        if code is None:
+            code = self._codes[category] = len(self.categories)
+            self.categories.append(category)
+        self.amount_cents.append(cents)
+        self.category_codes.append(code)
+        self.ordinals.append(ordinal)
+
+    def total_cents(self):
+        return sum(self.amount_cents)
+
+    def category_totals(self):
+        """{category: (total cents, count)}"""
+        totals = [0] * len(self.categories)
+        counts = [0] * len(self.categories)
+        for code, cents in zip(self.category_codes, self.amount_cents):
+            totals[code] += cents
+            counts[code] += 1
+        return {category: (totals[code], counts[code]) for code, category in enumerate(self.categories)}
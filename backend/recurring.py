@@ -0,0 +1,243 @@
+"""
+Recurring expenses: rules and the scheduler that materializes them
+
+A rule (amount, category, note, frequency, start_date, optional end_date)
+is stored per user with the date of its next occurrence not yet written
+(next_date; None once the rule has ended). Monthly and yearly rules fall on
+start_date's day, or on the last day of shorter months.
+
+The scheduler reads every rule whose next_date has come, in one
+collection-group query, groups the rules by user and materializes each
+user's due occurrences with one storage.add_expenses call. Those are written
+in Firestore batches of up to 500 documents that also carry the rollup,
+version and search index updates of the expenses, so no per-expense request
+path is involved. Afterwards it advances each rule's next_date and drops the
+user's cached analytics for the months written.
+
+Occurrences are stored under ids derived from the rule and the date
+(recurring_expense_id), and add_expenses skips ids that already exist: a run
+that stopped between writing the expenses and advancing the rules is caught
+up by the next run without duplicates. A rule that missed several periods
+(scheduler down, start_date in the past) gets all of them, at most
+MAX_CATCH_UP per run.
+
+Users are processed on RECURRING_WORKERS threads. Users not started within
+RECURRING_RUN_TIMEOUT seconds are left for the next run, so a month-boundary
+run takes bounded time. Several instances can split the users with
+RECURRING_SHARDS and a distinct RECURRING_SHARD each.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import calendar
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from analytics import month_key
+from money import amount_cents, money_fields
+
+logger = logging.getLogger(__name__)
+
+RECURRING_FREQUENCIES = ('weekly', 'monthly', 'yearly')
+
+# Seconds between runs of the in-process scheduler (0 disables it; use the
+# materialize-recurring command from cron instead)
+RECURRING_INTERVAL = float(os.environ.get('RECURRING_INTERVAL', 0))
+RECURRING_WORKERS = int(os.environ.get('RECURRING_WORKERS', 4))
+RECURRING_RUN_TIMEOUT = float(os.environ.get('RECURRING_RUN_TIMEOUT', 300))
+# This instance handles the users whose shard (see user_shard) is RECURRING_SHARD
+RECURRING_SHARDS = int(os.environ.get('RECURRING_SHARDS', 1))
+RECURRING_SHARD = int(os.environ.get('RECURRING_SHARD', 0))
+
+# Occurrences written per rule and run
+MAX_CATCH_UP = 400
+
+
+def naive_utc(value):
+    """Datetimes are compared as naive UTC; Firestore returns them timezone-aware"""
+    if isinstance(value, datetime) and value.tzinfo:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def today_utc():
+    """Midnight of the current UTC day"""
+    return datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+
+
+def add_months(date, months, day):
+    """date moved by months, on day (or the month's last day if it is shorter)"""
+    index = date.year * 12 + date.month - 1 + months
+    year, month = divmod(index, 12)
+    month += 1
+    return date.replace(year=year, month=month, day=min(day, calendar.monthrange(year, month)[1]))
+
+
+def next_occurrence(rule, date):
+    """The occurrence of a rule following the one on date"""
+    start_date = naive_utc(rule['start_date'])
+    if rule['frequency'] == 'weekly':
+        return date + timedelta(weeks=1)
+    return add_months(date, 12 if rule['frequency'] == 'yearly' else 1, start_date.day)
+
+
+def due_occurrences(rule, today, limit=MAX_CATCH_UP):
+    """
+    Dates of a rule's occurrences up to today, at most limit, and the
+    rule's next_date afterwards (None once it is past end_date)
+    """
+    date = naive_utc(rule.get('next_date'))
+    end_date = naive_utc(rule.get('end_date'))
+    dates = []
+    while date is not None and date <= today and len(dates) < limit:
+        if end_date is not None and date > end_date:
+            date = None
+            break
+        dates.append(date)
+        date = next_occurrence(rule, date)
+    if date is not None and end_date is not None and date > end_date:
+        date = None
+    return dates, date
+
+
+def recurring_expense_id(rule_id, date):
+    """Id of a rule's occurrence on date, which makes materializing it idempotent"""
+    return f"{rule_id}_{date:%Y%m%d}"
+
+
+def occurrence_expense(rule, date, now):
+    """Expense document of one occurrence"""
+    return {
+        **money_fields(amount_cents(rule)),
+        'category': rule['category'],
+        'date': date,
+        'note': rule.get('note') or '',
+        'created_at': now,
+        'updated_at': now
+    }
+
+
+def user_shard(user_id, shards):
+    """Stable shard of a user among shards"""
+    return int(hashlib.sha1(user_id.encode('utf-8')).hexdigest()[:8], 16) % shards
+
+
+def materialize_user(storage, user_id, rules, today):
+    """
+    Write the due occurrences of a user's rules and advance the rules (the
+    given rule dicts too). Returns (expenses written, months touched).
+    """
+    now = datetime.now()
+    items = []
+    advances = {}
+    for rule in rules:
+        dates, next_date = due_occurrences(rule, today)
+        items.extend((recurring_expense_id(rule['id'], date), occurrence_expense(rule, date, now)) for date in dates)
+        advances[rule['id']] = next_date
+
+    written = storage.add_expenses(user_id, items) if items else []
+    # Only after the expenses are stored: a failure in between is repaired by the next run
+    for rule in rules:
+        rule['next_date'] = advances[rule['id']]
+        storage.update_recurring_rule(user_id, rule['id'], {'next_date': rule['next_date'], 'updated_at': now})
+    return written, {month_key(data['date']) for _, data in items}
+
+
+class RecurringScheduler:
+    """
+    Materializes due recurring expenses for all users of this instance's
+    shard, on demand (run) or every interval seconds on a background thread
+    (start). on_written(user_id, months) is called after a user's expenses
+    are stored, e.g. to invalidate cached analytics.
+    """
+
+    def __init__(self, storage, on_written=None, workers=RECURRING_WORKERS, run_timeout=RECURRING_RUN_TIMEOUT,
+                 shards=RECURRING_SHARDS, shard=RECURRING_SHARD):
+        self.storage = storage
+        self.on_written = on_written
+        self.workers = workers
+        self.run_timeout = run_timeout
+        self.shards = shards
+        self.shard = shard
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.runs = 0
+        self.expenses = 0
+        self.failures = 0
+
+    def due_rules(self, today):
+        """This shard's due rules, grouped by user"""
+        by_user = {}
+        for user_id, rule in self.storage.list_due_recurring_rules(today):
+            if user_shard(user_id, self.shards) == self.shard:
+                by_user.setdefault(user_id, []).append(rule)
+        return by_user
+
+    def run(self, today=None):
+        """
+        Materialize everything due up to today (default: the current UTC day).
+        Returns {'users', 'expenses', 'failed', 'deferred'}.
+        """
+        today = today or today_utc()
+        deadline = time.monotonic() + self.run_timeout
+        report = {'users': 0, 'expenses': 0, 'failed': 0, 'deferred': 0}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='recurring') as pool:
+            futures = [
+                pool.submit(self._run_user, user_id, rules, today, deadline)
+                for user_id, rules in self.due_rules(today).items()
+            ]
+            for future in futures:
+                outcome, written = future.result()
+                report[outcome] += 1
+                report['expenses'] += written
+        with self._lock:
+            self.runs += 1
+            self.expenses += report['expenses']
+            self.failures += report['failed']
+        logger.info(f"Recurring expenses: {report['expenses']} written for {report['users']} user(s), "
+                    f"{report['failed']} failed, {report['deferred']} deferred")
+        return report
+
+    def _run_user(self, user_id, rules, today, deadline):
+        if time.monotonic() > deadline:
+            return 'deferred', 0
+        try:
+            written, months = materialize_user(self.storage, user_id, rules, today)
+            if months and self.on_written:
+                self.on_written(user_id, months)
+            return 'users', len(written)
+        except Exception as e:
+            logger.error(f"Error materializing recurring expenses for {user_id}: {e}")
+            return 'failed', 0
+
+    def start(self, interval=RECURRING_INTERVAL):
+        """Run every interval seconds on a daemon thread (no-op if interval is 0)"""
+        if interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, args=(interval,), name='recurring-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self, interval):
+        while not self._stop.is_set():
+            try:
+                self.run()
+            except Exception as e:
+                logger.error(f"Recurring expense run failed: {e}")
+            self._stop.wait(interval)
+
+    def stats(self):
+        """Return run counters"""
+        with self._lock:
+            return {
+                'runs': self.runs,
+                'expenses': self.expenses,
+                'failures': self.failures,
+                'running': self._thread is not None and not self._stop.is_set()
+            }
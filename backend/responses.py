@@ -0,0 +1,94 @@
+"""
+JSON encoding and compression for API responses
+
+Responses are encoded with orjson straight to UTF-8 bytes. datetime values,
+including Firestore's DatetimeWithNanoseconds, are written as ISO 8601
+strings, so handlers return documents as read instead of converting each
+date field in Python first. Keys are sorted as before, so bodies are
+byte-for-byte stable for the same data.
+
+Bodies of at least COMPRESS_MIN_SIZE bytes are compressed with brotli (when
+the optional Brotli package is installed) or gzip, whichever the client's
+Accept-Encoding prefers. Streamed responses are sent uncompressed.
+"""
+
+from datetime import date
+import decimal
+import gzip
+import os
+
+import orjson
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+JSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+# Smallest body worth compressing, and the levels used (fast settings suited
+# to dynamic responses)
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/csv', 'text/plain')
+
+# Preferred first when the client rates several encodings equally
+SUPPORTED_ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+
+def _default(value):
+    """Types orjson does not encode natively"""
+    # datetime subclasses (Firestore timestamps) and dates
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode_json(value):
+    """Encode a value as JSON bytes"""
+    return orjson.dumps(value, default=_default, option=JSON_OPTIONS)
+
+
+class OrjsonProvider:
+    """
+    dumps/loads/response for the app's JSON provider. Mixed into Flask's or
+    Quart's JSONProvider, which supply _app and _prepare_response_obj.
+    """
+
+    mimetype = 'application/json'
+
+    def dumps(self, obj, **kwargs):
+        return encode_json(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(encode_json(obj), mimetype=self.mimetype)
+
+
+def compressible(mimetype, size):
+    """Whether a body of this type and size is worth compressing"""
+    return mimetype in COMPRESSIBLE_MIMETYPES and size is not None and size >= COMPRESS_MIN_SIZE
+
+
+def negotiate_encoding(accept_encodings):
+    """The supported Content-Encoding the client rates highest, or None"""
+    best, best_quality = None, 0
+    for encoding in SUPPORTED_ENCODINGS:
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(data, encoding):
+    """Compress a body with 'br' or 'gzip'"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
@@ -0,0 +1,210 @@
+"""
+Result cache for the per-month analytics endpoints
+
+Dashboard refreshes call /api/summary and /api/report for the same month
+over and over. Their payloads are cached per (user_id, endpoint, month)
+together with the month's data version (its ETag, derived from the version
+counters every write bumps in the same batch). A lookup with a different
+version is a miss, so a write from any process, the recurring scheduler or
+a CLI command makes older entries unusable. Writes through this process
+also drop the entries right away, and entries expire after a TTL.
+
+Two backends are available: an in-process LRU (default) and Redis, which
+works with any Redis-compatible server (Redis, Valkey, KeyDB, a local
+stand-in) and lets several worker processes share one cache.
+"""
+
+from collections import OrderedDict
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Endpoints whose payloads are cached (invalidation drops all of them)
+CACHED_ENDPOINTS = ('summary', 'report')
+
+
+class CacheBackend:
+    """Key/value store with per-entry TTL used by ResultCache"""
+
+    name = 'base'
+
+    def get(self, key):
+        """Return the cached value or None"""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        """Store a JSON-serializable value for ttl seconds"""
+        raise NotImplementedError
+
+    def delete(self, keys):
+        """Remove keys (missing keys are ignored)"""
+        raise NotImplementedError
+
+    def size(self):
+        """Number of cached entries, if known"""
+        return None
+
+
+class MemoryCacheBackend(CacheBackend):
+    """In-process LRU with TTL, guarded by a lock"""
+
+    name = 'memory'
+
+    def __init__(self, max_size=2048, clock=time.monotonic):
+        self.max_size = max_size
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (self._clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class RedisCacheBackend(CacheBackend):
+    """Cache stored in a Redis-compatible server; LRU is left to its maxmemory policy"""
+
+    name = 'redis'
+
+    def __init__(self, client, prefix='finance-tracker:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, json.dumps(value), ex=max(1, int(ttl)))
+
+    def delete(self, keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+
+class ResultCache:
+    """
+    Analytics results keyed by (user_id, endpoint, month) and stored with
+    the data version they were computed for.
+
+    A result computed while a write raced it is stored under the version
+    read before the computation; the write changed the version, so later
+    requests miss instead of getting it.
+    """
+
+    def __init__(self, backend, ttl=300):
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(user_id, endpoint, month):
+        return f"result:{user_id}:{endpoint}:{month}"
+
+    def get(self, user_id, endpoint, month, version):
+        """Return the payload cached for version (the month's ETag) or None"""
+        try:
+            entry = self.backend.get(self._key(user_id, endpoint, month))
+        except Exception as e:
+            # A cache outage should only cost a recomputation
+            logger.warning(f"Result cache read failed: {e}")
+            entry = None
+        value = entry['payload'] if entry is not None and entry.get('version') == version else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, user_id, endpoint, month, version, payload):
+        """Cache a payload computed for version"""
+        try:
+            self.backend.set(self._key(user_id, endpoint, month), {'version': version, 'payload': payload}, self.ttl)
+        except Exception as e:
+            logger.warning(f"Result cache write failed: {e}")
+
+    def invalidate(self, user_id, months):
+        """
+        Drop every cached endpoint for the given months of a user. Only frees
+        the entries early: the version check already turns them into misses.
+        """
+        months = {month for month in months if month}
+        if not months:
+            return
+        with self._lock:
+            self.invalidations += len(months)
+        try:
+            self.backend.delete([
+                self._key(user_id, endpoint, month) for month in months for endpoint in CACHED_ENDPOINTS
+            ])
+        except Exception as e:
+            # Entries left behind expire after the TTL
+            logger.error(f"Result cache invalidation failed: {e}")
+
+    def stats(self):
+        """Return hit-rate metrics"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': self.backend.name,
+                'size': self.backend.size(),
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+def create_result_cache():
+    """
+    Create the result cache selected by RESULT_CACHE_BACKEND (memory or
+    redis, using REDIS_URL). RESULT_CACHE_TTL and RESULT_CACHE_SIZE set the
+    TTL in seconds and the in-process entry limit.
+    """
+    backend_name = os.environ.get('RESULT_CACHE_BACKEND', 'memory').lower()
+    ttl = int(os.environ.get('RESULT_CACHE_TTL', 300))
+
+    if backend_name == 'redis':
+        import redis
+        client = redis.Redis.from_url(os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+        backend = RedisCacheBackend(client)
+    elif backend_name == 'memory':
+        backend = MemoryCacheBackend(max_size=int(os.environ.get('RESULT_CACHE_SIZE', 2048)))
+    else:
+        raise ValueError(f"Unknown result cache backend: {backend_name}")
+
+    return ResultCache(backend, ttl=ttl)
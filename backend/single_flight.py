@@ -0,0 +1,201 @@
+"""
+Single-flight coalescing and per-user admission for the analytics queries
+
+A dashboard opening in several tabs, or a client retrying, sends identical
+summary/report/trends requests for the same user at the same moment. When
+the result cache is cold each of them would read the same rollup, budgets or
+expense range. Instead the first request for a key runs the query and every
+identical request that arrives while it is in flight waits for it and gets
+the same result.
+
+Keys include the data version (ETag) the request read, so a request made
+after a write never joins a query that started before the write.
+
+Distinct queries of one user are admitted through ANALYTICS_USER_CONCURRENCY
+slots; up to ANALYTICS_QUEUE_SIZE more wait (at most ANALYTICS_QUEUE_TIMEOUT
+seconds) for a slot. Beyond that the request fails with Overloaded, which the
+handlers turn into 429 Too Many Requests with a Retry-After header, so one
+user cannot tie up the query pool. Coalesced requests do not take a slot.
+"""
+
+import asyncio
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+import os
+import threading
+
+ANALYTICS_USER_CONCURRENCY = int(os.environ.get('ANALYTICS_USER_CONCURRENCY', 2))
+ANALYTICS_QUEUE_SIZE = int(os.environ.get('ANALYTICS_QUEUE_SIZE', 4))
+ANALYTICS_QUEUE_TIMEOUT = float(os.environ.get('ANALYTICS_QUEUE_TIMEOUT', 10))
+# Seconds a rejected client is asked to wait before retrying
+ANALYTICS_RETRY_AFTER = int(os.environ.get('ANALYTICS_RETRY_AFTER', 1))
+
+
+class Overloaded(Exception):
+    """A user's analytics slots and queue are full"""
+
+    def __init__(self, retry_after=ANALYTICS_RETRY_AFTER):
+        super().__init__('Too many concurrent analytics requests')
+        self.retry_after = retry_after
+
+
+class _UserSlots:
+    """A user's query slots and the number of queries running or waiting for one"""
+
+    def __init__(self, semaphore):
+        self.semaphore = semaphore
+        self.pending = 0
+
+
+class SingleFlight:
+    """Thread-safe single-flight group with per-user admission (Flask app)"""
+
+    def __init__(self, concurrency=ANALYTICS_USER_CONCURRENCY, queue_size=ANALYTICS_QUEUE_SIZE,
+                 queue_timeout=ANALYTICS_QUEUE_TIMEOUT, retry_after=ANALYTICS_RETRY_AFTER):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._calls = {}  # (user_id, key) -> Future of the query in flight
+        self._users = {}  # user_id -> _UserSlots
+        self.executed = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    def do(self, user_id, key, query, *args):
+        """Return query(*args), sharing the result with identical calls in flight"""
+        call_key = (user_id, key)
+        with self._lock:
+            call = self._calls.get(call_key)
+            leader = call is None
+            if leader:
+                call = self._calls[call_key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return call.result()
+
+        try:
+            with self._admit(user_id):
+                result = query(*args)
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[call_key]
+
+    @contextmanager
+    def _admit(self, user_id):
+        with self._lock:
+            slots = self._users.get(user_id)
+            if slots is None:
+                slots = self._users[user_id] = _UserSlots(threading.BoundedSemaphore(self.concurrency))
+            if slots.pending >= self.concurrency + self.queue_size:
+                self.rejected += 1
+                raise Overloaded(self.retry_after)
+            slots.pending += 1
+        try:
+            if not slots.semaphore.acquire(timeout=self.queue_timeout):
+                with self._lock:
+                    self.rejected += 1
+                raise Overloaded(self.retry_after)
+            try:
+                with self._lock:
+                    self.executed += 1
+                yield
+            finally:
+                slots.semaphore.release()
+        finally:
+            with self._lock:
+                slots.pending -= 1
+                if not slots.pending:
+                    del self._users[user_id]
+
+    def stats(self):
+        """Return coalescing and admission metrics"""
+        with self._lock:
+            return {
+                'executed': self.executed,
+                'coalesced': self.coalesced,
+                'rejected': self.rejected,
+                'in_flight': len(self._calls),
+                'users': len(self._users)
+            }
+
+
+class AsyncSingleFlight:
+    """asyncio counterpart of SingleFlight (ASGI app); use from one event loop"""
+
+    def __init__(self, concurrency=ANALYTICS_USER_CONCURRENCY, queue_size=ANALYTICS_QUEUE_SIZE,
+                 queue_timeout=ANALYTICS_QUEUE_TIMEOUT, retry_after=ANALYTICS_RETRY_AFTER):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._calls = {}  # (user_id, key) -> task of the query in flight
+        self._users = {}  # user_id -> _UserSlots
+        self.executed = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    async def do(self, user_id, key, query, *args):
+        """Return await query(*args), sharing the result with identical calls in flight"""
+        call_key = (user_id, key)
+        call = self._calls.get(call_key)
+        if call is None:
+            call = self._calls[call_key] = asyncio.ensure_future(self._run(user_id, query, *args))
+            call.add_done_callback(lambda task: self._finish(call_key, task))
+        else:
+            self.coalesced += 1
+        # A cancelled request (client gone) leaves the query running for the others
+        return await asyncio.shield(call)
+
+    def _finish(self, call_key, task):
+        del self._calls[call_key]
+        if not task.cancelled():
+            # Retrieved here so it is not reported as unhandled when every waiter left
+            task.exception()
+
+    async def _run(self, user_id, query, *args):
+        async with self._admit(user_id):
+            return await query(*args)
+
+    @asynccontextmanager
+    async def _admit(self, user_id):
+        slots = self._users.get(user_id)
+        if slots is None:
+            slots = self._users[user_id] = _UserSlots(asyncio.BoundedSemaphore(self.concurrency))
+        if slots.pending >= self.concurrency + self.queue_size:
+            self.rejected += 1
+            raise Overloaded(self.retry_after)
+        slots.pending += 1
+        try:
+            try:
+                await asyncio.wait_for(slots.semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise Overloaded(self.retry_after)
+            try:
+                self.executed += 1
+                yield
+            finally:
+                slots.semaphore.release()
+        finally:
+            slots.pending -= 1
+            if not slots.pending:
+                del self._users[user_id]
+
+    def stats(self):
+        """Return coalescing and admission metrics"""
+        return {
+            'executed': self.executed,
+            'coalesced': self.coalesced,
+            'rejected': self.rejected,
+            'in_flight': len(self._calls),
+            'users': len(self._users)
+        }
@@ -0,0 +1,1903 @@
+"""
+Storage backends for the Finance Tracker API
+
+The routes in app.py talk to a Storage object instead of Firestore directly,
+so the same handlers can run against Firestore, an in-memory store (tests,
+benchmarks, profiling) or a local SQLite database (small deployments).
+
+Amounts are stored as integer cents in amount_cents, next to the float
+amount (see money.py).
+
+Each backend also keeps a per-user, per-month rollup (see analytics.py)
+and the note/category search index (see expense_filters.py) current in the
+same transaction as every expense write, and bumps a per-user, per-month
+data version on every expense or budget write (used for ETags and, through
+watch_versions, for live updates).
+
+The Firestore client libraries are imported inside the Firestore methods:
+they take about a third of a second to load, which the other backends and
+tools importing this module should not pay.
+"""
+
+from datetime import date, datetime, timezone
+import copy
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import uuid
+
+from analytics import expense_columns, month_key, month_keys, month_range, rollup_category, summarize_expenses
+from expense_filters import (
+    index_entries, matches_filters, merge_search_changes, search_index_changes, sort_order, sort_page
+)
+from firebase_app import READINESS_TIMEOUT, firebase
+from money import ExpenseColumns, amount_cents, money_fields, to_cents
+
+# Fields stored on each expense and budget document
+EXPENSE_FIELDS = ('amount', 'amount_cents', 'category', 'date', 'note', 'created_at', 'updated_at')
+BUDGET_FIELDS = ('amount', 'amount_cents', 'month', 'category', 'created_at', 'updated_at')
+RECURRING_FIELDS = (
+    'amount', 'amount_cents', 'category', 'note', 'frequency', 'start_date', 'end_date', 'next_date',
+    'created_at', 'updated_at'
+)
+
+# Expense fields a rollup is computed from (amount for documents without amount_cents)
+ROLLUP_FIELDS = ('amount', 'amount_cents', 'category')
+# Expense fields read into ExpenseColumns
+COLUMN_FIELDS = ('amount', 'amount_cents', 'category', 'date')
+
+# Firestore's limit on writes per batch
+MAX_BATCH_WRITES = 500
+
+# Read-then-write attempts before giving up on a document that keeps changing
+MAX_WRITE_ATTEMPTS = 5
+
+# Budget ids derived from month and category (see budget_document_id)
+BUDGET_ID_PATTERN = re.compile(r'^(\d{4}-\d{2})_[0-9a-f]{20}$')
+
+# Bounds used when scanning a user's whole history
+EARLIEST_DATE = datetime(1970, 1, 1)
+LATEST_DATE = datetime(9999, 12, 31, 23, 59, 59)
+
+
+def rollup_deltas(old, new):
+    """
+    Return the rollup changes caused by an expense going from old to new
+    (None for a create or delete) as {month: {category: (cents, count)}}.
+    """
+    deltas = {}
+
+    def apply(expense, sign):
+        month = month_key(expense['date'])
+        category = rollup_category(expense.get('category'))
+        entry = deltas.setdefault(month, {}).setdefault(category, [0, 0])
+        entry[0] += sign * amount_cents(expense)
+        entry[1] += sign
+
+    if old:
+        apply(old, -1)
+    if new:
+        apply(new, 1)
+
+    result = {}
+    for month, categories in deltas.items():
+        changed = {category: tuple(entry) for category, entry in categories.items() if entry[0] or entry[1]}
+        if changed:
+            result[month] = changed
+    return result
+
+
+def expense_months(*expenses):
+    """Months whose data changes when these expenses (None is ignored) are written"""
+    return {month_key(expense['date']) for expense in expenses if expense}
+
+
+def budget_document_id(user_id, month, category):
+    """
+    Deterministic id of a user's budget for a month and category, so setting
+    a budget is a single upsert and concurrent requests cannot create
+    duplicates. The month stays readable; user and category are hashed
+    (categories are free text and ids must be unique in flat tables).
+    """
+    digest = hashlib.sha1(f"{user_id}:{category}".encode('utf-8')).hexdigest()[:20]
+    return f"{month}_{digest}"
+
+
+def budget_id_month(budget_id):
+    """Month encoded in a deterministic budget id, or None for older random ids"""
+    match = BUDGET_ID_PATTERN.match(budget_id)
+    return match.group(1) if match else None
+
+
+def user_range_bounds(user_counts, shards):
+    """
+    Split users, given as (user_id, expense count) ordered by user_id, into
+    at most shards ranges holding about as many expenses each. Returns the
+    user ids the second and later ranges start at.
+    """
+    user_counts = list(user_counts)
+    total = sum(count for _, count in user_counts)
+    bounds = []
+    seen = 0
+    for user_id, count in user_counts:
+        if seen >= total * (len(bounds) + 1) / shards and len(bounds) < shards - 1:
+            bounds.append(user_id)
+        seen += count
+    return bounds
+
+
+def merge_rollup_deltas(target, deltas):
+    """Add the changes in deltas into target (both as returned by rollup_deltas)"""
+    for month, categories in deltas.items():
+        month_entry = target.setdefault(month, {})
+        for category, (amount, count) in categories.items():
+            current_amount, current_count = month_entry.get(category, (0, 0))
+            month_entry[category] = (current_amount + amount, current_count + count)
+    return target
+
+
+class Storage:
+    """
+    Interface for expense and budget reads and writes.
+
+    Every method takes the owning user_id. Documents are returned as plain
+    dicts with an 'id' key and datetime values for 'date', 'created_at' and
+    'updated_at'.
+    """
+
+    name = 'base'
+
+    # Expenses
+    def list_expenses(self, user_id, start_date, end_date, fields=None):
+        """
+        Return expenses with start_date <= date <= end_date, ordered by date.
+        fields limits the returned fields (plus 'id') to what the caller needs.
+        """
+        raise NotImplementedError
+
+    def page_expenses(self, user_id, start_date, end_date, limit, start_after=None):
+        """
+        Return up to limit expenses in the date range ordered by (date, id),
+        starting after the (date, id) cursor of the previous page.
+        """
+        raise NotImplementedError
+
+    def list_expense_columns(self, user_id, start_date, end_date):
+        """Return a date range's expenses as ExpenseColumns (amounts, categories and dates only)"""
+        return expense_columns(self.list_expenses(user_id, start_date, end_date, COLUMN_FIELDS))
+
+    def iter_expenses(self, user_id, start_date, end_date, start_after=None, chunk_size=500):
+        """Yield expenses ordered by (date, id) without loading the whole range at once"""
+        while True:
+            page = self.page_expenses(user_id, start_date, end_date, chunk_size, start_after)
+            # Take the cursor before callers get (and possibly modify) the documents
+            last = (page[-1]['date'], page[-1]['id']) if len(page) == chunk_size else None
+            yield from page
+            if last is None:
+                return
+            start_after = last
+
+    def query_expenses(self, user_id, start_date, end_date, filters, limit=None, start_after=None):
+        """
+        Return expenses in the date range that pass filters (categories,
+        min_amount, max_amount, search_tokens; see expense_filters), ordered
+        by filters['sort']. start_after is the sort_key of the last expense
+        of the previous page.
+        """
+        raise NotImplementedError
+
+    def get_expense(self, user_id, expense_id):
+        """Return a single expense or None if it does not exist"""
+        raise NotImplementedError
+
+    def add_expense(self, user_id, data):
+        """Store a new expense, update its month's rollup and return its id"""
+        raise NotImplementedError
+
+    def add_expenses(self, user_id, items):
+        """
+        Store many new expenses with batched writes. items is a list of
+        (expense_id or None, data); ids that already exist are skipped so a
+        retried import does not duplicate rows. Returns the ids written.
+        """
+        raise NotImplementedError
+
+    def update_expense(self, user_id, expense_id, data):
+        """
+        Apply a partial update to an existing expense and move its amount
+        between rollups if the date or category changed. Returns
+        (previous, merged) expenses, or None if it does not exist.
+        """
+        raise NotImplementedError
+
+    def delete_expense(self, user_id, expense_id):
+        """Delete an expense and remove it from its rollup. Returns the deleted expense or None."""
+        raise NotImplementedError
+
+    # Budgets
+    def list_budgets(self, user_id, month, fields=None):
+        """
+        Return all budgets for a month (YYYY-MM), or for every month if month
+        is None, optionally only some fields
+        """
+        raise NotImplementedError
+
+    def get_budget(self, user_id, budget_id):
+        """Return a single budget or None if it does not exist"""
+        raise NotImplementedError
+
+    def upsert_budget(self, user_id, data):
+        """
+        Create or overwrite the budget for data's month and category (stored
+        under budget_document_id). created_at is kept on overwrite. Returns
+        (budget_id, created).
+        """
+        raise NotImplementedError
+
+    def delete_budget(self, user_id, budget_id):
+        """Delete a budget. Returns the deleted budget's month, or None if it does not exist."""
+        raise NotImplementedError
+
+    def migrate_budget_ids(self, user_id):
+        """
+        Move budgets stored under random ids (written before ids were derived
+        from month and category) to their deterministic id. When a month and
+        category has several budgets the most recently updated one wins.
+        Returns the ids removed.
+        """
+        groups = {}
+        for budget in self.list_budgets(user_id, None):
+            budget_id = budget_document_id(user_id, budget['month'], budget.get('category') or '')
+            groups.setdefault(budget_id, []).append(budget)
+
+        removed = []
+        for budget_id, budgets in groups.items():
+            stale = [budget for budget in budgets if budget['id'] != budget_id]
+            if not stale:
+                continue
+            latest = max(budgets, key=lambda budget: budget['updated_at'])
+            if latest['id'] != budget_id:
+                data = {field: latest[field] for field in BUDGET_FIELDS if field in latest}
+                data['category'] = data.get('category') or ''
+                self.upsert_budget(user_id, data)
+            for budget in stale:
+                self.delete_budget(user_id, budget['id'])
+                removed.append(budget['id'])
+        return removed
+
+    def migrate_amounts(self, user_id):
+        """
+        Store amount_cents (and the amount rounded to cents) on a user's
+        expenses, budgets and recurring rules written before amounts were kept
+        in cents. Returns the number of documents updated. Rollups are
+        converted by rebuilding them (rebuild_rollups).
+        """
+        raise NotImplementedError
+
+    # Recurring expense rules (see recurring.py)
+    def list_recurring_rules(self, user_id):
+        """Return all of a user's recurring expense rules"""
+        raise NotImplementedError
+
+    def get_recurring_rule(self, user_id, rule_id):
+        """Return a single rule or None if it does not exist"""
+        raise NotImplementedError
+
+    def add_recurring_rule(self, user_id, data):
+        """Store a new rule. Returns its id."""
+        raise NotImplementedError
+
+    def update_recurring_rule(self, user_id, rule_id, data):
+        """Apply a partial update to a rule. Returns the merged rule, or None if it does not exist."""
+        raise NotImplementedError
+
+    def delete_recurring_rule(self, user_id, rule_id):
+        """Delete a rule (its expenses stay). Returns whether it existed."""
+        raise NotImplementedError
+
+    def list_due_recurring_rules(self, before):
+        """Return (user_id, rule) for every user's rules whose next_date is on or before before"""
+        raise NotImplementedError
+
+    # Rollups
+    def get_rollup(self, user_id, month):
+        """Return the stored rollup for a month or None if it was never built"""
+        raise NotImplementedError
+
+    def rebuild_rollup(self, user_id, month, bump_version=True):
+        """
+        Recompute a month's rollup from raw expenses, store and return it.
+        The month's version is bumped (the totals may differ from what clients
+        cached) unless bump_version is False: building a missing rollup
+        changes no data, so ETags already sent stay valid.
+        """
+        raise NotImplementedError
+
+    def list_rollup_months(self, user_id):
+        """Return the months that have a stored rollup"""
+        raise NotImplementedError
+
+    def list_user_ids(self):
+        """Return the ids of all users with stored data"""
+        raise NotImplementedError
+
+    def rebuild_rollups(self, user_id):
+        """Recompute every rollup for a user. Returns the months rebuilt."""
+        history = self.list_expenses(user_id, EARLIEST_DATE, LATEST_DATE, fields=('date',))
+        months = {month_key(expense['date']) for expense in history}
+        # Also reset stale rollups of months that no longer have expenses
+        months.update(self.list_rollup_months(user_id))
+        for month in sorted(months):
+            self.rebuild_rollup(user_id, month)
+        return sorted(months)
+
+    # Search index
+    def rebuild_search_index(self, user_id):
+        """
+        Recompute a user's search index from their expenses (e.g. for expenses
+        written before the index existed). Returns the number of index entries.
+        """
+        raise NotImplementedError
+
+    # Fleet statistics (see fleet_stats.py)
+    def expense_partitions(self, shards):
+        """
+        Split all users into at most shards user id ranges with about as many
+        expenses each. Returns the user ids the second and later ranges start at.
+        """
+        raise NotImplementedError
+
+    def scan_expenses(self, first_user, end_user, fields=None):
+        """
+        Yield (user_id, expense) for every expense of the users whose id is
+        at least first_user and below end_user (None: no bound)
+        """
+        raise NotImplementedError
+
+    def scan_budgets(self, first_user, end_user):
+        """Yield (user_id, budget) for every budget of the users in the range (as scan_expenses)"""
+        raise NotImplementedError
+
+    def get_stats(self, stats_id):
+        """Return a document of the stats collection or None"""
+        raise NotImplementedError
+
+    def set_stats(self, stats_id, data):
+        """Store (replace) a stats document, stamped with updated_at"""
+        raise NotImplementedError
+
+    def delete_stats(self, stats_id):
+        """Delete a stats document if it exists"""
+        raise NotImplementedError
+
+    # Data versions
+    def get_versions(self, user_id, months):
+        """
+        Return {month: version} for a user's months. The version goes up on
+        every expense or budget write touching the month (0 if never written).
+        """
+        raise NotImplementedError
+
+    def watch_versions(self, user_id, month, callback):
+        """
+        Call callback() after each change to the month's data version (and,
+        on Firestore, once when the listener starts). Returns a function that
+        stops the notifications. callback may run on any thread, possibly
+        while a write is in progress, so it must only hand the change off.
+        """
+        raise NotImplementedError
+
+    # Readiness
+    def ping(self):
+        """Raise if the backend cannot be reached"""
+        raise NotImplementedError
+
+
+class VersionWatchers:
+    """
+    watch_versions for the in-process backends: writes notify the callbacks
+    registered for the months they touch. Only writes made by this process
+    are seen.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks = {}  # (user_id, month) -> [callback]
+
+    def watch(self, user_id, month, callback):
+        key = (user_id, month)
+        with self._lock:
+            self._callbacks.setdefault(key, []).append(callback)
+
+        def unwatch():
+            with self._lock:
+                callbacks = self._callbacks.get(key, [])
+                if callback in callbacks:
+                    callbacks.remove(callback)
+                if not callbacks:
+                    self._callbacks.pop(key, None)
+        return unwatch
+
+    def notify(self, user_id, months):
+        with self._lock:
+            callbacks = [callback for month in months for callback in self._callbacks.get((user_id, month), ())]
+        for callback in callbacks:
+            callback()
+
+
+class FirestoreDocuments:
+    """
+    Document layout, queries and write helpers shared by the sync and async
+    (async_storage.py) Firestore backends. Queries, batches and transactions
+    take the same arguments on Client and AsyncClient.
+
+    Documents live under users/{uid}/expenses, users/{uid}/budgets,
+    users/{uid}/rollups/{YYYY-MM} and users/{uid}/versions/{YYYY-MM}; fleet
+    statistics under stats/{id}.
+    Rollups and versions are updated with firestore.Increment in the same
+    batch or transaction as the expense or budget. An increment to a month
+    without a rollup creates one holding only that change, so rollups are
+    marked complete when they are built from the month's expenses and one
+    without the mark is treated as missing (see _stored_rollup).
+    """
+
+    def __init__(self, client_factory):
+        self._client_factory = client_factory
+
+    @property
+    def db(self):
+        # Created on first use, once per process (see firebase_app)
+        return self._client_factory()
+
+    def _ping_ref(self):
+        # Reading a missing document is enough to prove the connection works
+        return self.db.collection('_health').document('ping')
+
+    def _expenses(self, user_id):
+        return self.db.collection('users').document(user_id).collection('expenses')
+
+    def _budgets(self, user_id):
+        return self.db.collection('users').document(user_id).collection('budgets')
+
+    def _rollups(self, user_id):
+        return self.db.collection('users').document(user_id).collection('rollups')
+
+    def _recurring(self, user_id):
+        return self.db.collection('users').document(user_id).collection('recurring')
+
+    def _due_recurring(self, before):
+        """Rules of every user due on or before a date (a collection-group query)"""
+        return self.db.collection_group('recurring').where('next_date', '<=', before)
+
+    def _versions(self, user_id):
+        return self.db.collection('users').document(user_id).collection('versions')
+
+    def _stats(self):
+        return self.db.collection('stats')
+
+    def _user_range(self, collection, first_user, end_user):
+        """
+        Collection-group query over the users in [first_user, end_user).
+        Paths order by their segments, so users/<first_user> sorts before
+        that user's documents and users/<end_user> after every earlier user's.
+        """
+        query = self.db.collection_group(collection)
+        if first_user is not None:
+            query = query.where('__name__', '>=', self.db.document('users', first_user))
+        if end_user is not None:
+            query = query.where('__name__', '<', self.db.document('users', end_user))
+        return query
+
+    def _search_index(self, user_id):
+        return self.db.collection('users').document(user_id).collection('search_index')
+
+    @staticmethod
+    def _watch_version(client, user_id, month, callback):
+        """on_snapshot listener on a version document (needs the sync Client)"""
+        ref = client.collection('users').document(user_id).collection('versions').document(month)
+        watch = ref.on_snapshot(lambda snapshots, changes, read_time: callback())
+        return watch.unsubscribe
+
+    @staticmethod
+    def _to_dict(snapshot):
+        data = snapshot.to_dict()
+        data['id'] = snapshot.id
+        return data
+
+    @staticmethod
+    def _stored_rollup(snapshot):
+        """A rollup snapshot's data, or None if it is missing or was never built in full"""
+        if not snapshot.exists:
+            return None
+        rollup = snapshot.to_dict()
+        if not rollup.pop('complete', False):
+            return None
+        return rollup
+
+    def _write_rollup_deltas(self, writer, user_id, deltas):
+        """Add rollup increments to a batch or transaction, one write per month"""
+        from google.cloud import firestore
+
+        for month, categories in deltas.items():
+            writer.set(self._rollups(user_id).document(month), {
+                'month': month,
+                'total_cents': firestore.Increment(sum(cents for cents, _ in categories.values())),
+                'count': firestore.Increment(sum(count for _, count in categories.values())),
+                'categories': {
+                    category: {'total_cents': firestore.Increment(cents), 'count': firestore.Increment(count)}
+                    for category, (cents, count) in categories.items()
+                },
+                'updated_at': datetime.now()
+            }, merge=True)
+
+    def _write_versions(self, writer, user_id, months):
+        """Add version bumps for the touched months to a batch or transaction"""
+        from google.cloud import firestore
+
+        for month in months:
+            writer.set(self._versions(user_id).document(month), {
+                'version': firestore.Increment(1),
+                'updated_at': datetime.now()
+            }, merge=True)
+
+    def _write_search_index(self, writer, user_id, changes):
+        """Add search index updates to a batch or transaction, one write per (month, word)"""
+        from google.cloud import firestore
+
+        for (month, token), ids in changes.items():
+            writer.set(self._search_index(user_id).document(f"{month}_{token}"), {
+                'ids': {expense_id: True if present else firestore.DELETE_FIELD for expense_id, present in ids.items()}
+            }, merge=True)
+
+    def _search_refs(self, user_id, start_date, end_date, tokens):
+        """Index documents of every searched word in every month of the range"""
+        index = self._search_index(user_id)
+        return [index.document(f"{month}_{token}") for month in month_keys(start_date, end_date) for token in tokens]
+
+    @staticmethod
+    def _search_matches(snapshots):
+        """Ids of the expenses holding every searched word, from the _search_refs documents"""
+        postings = {}  # month -> [ids of each word]
+        for snapshot in snapshots:
+            month = snapshot.id.partition('_')[0]
+            ids = set((snapshot.to_dict() or {}).get('ids', {})) if snapshot.exists else set()
+            postings.setdefault(month, []).append(ids)
+        matches = set()
+        for month_postings in postings.values():
+            matches |= set.intersection(*month_postings)
+        return matches
+
+    @staticmethod
+    def _filter_matches(expenses, start_date, end_date, filters, limit, start_after):
+        """Apply range, filters, sort and cursor to the expenses a search matched"""
+        # Firestore returns timezone-aware UTC datetimes; bounds and cursors are naive UTC
+        def aware(value):
+            return value.replace(tzinfo=timezone.utc) if isinstance(value, datetime) and not value.tzinfo else value
+
+        start_date, end_date = aware(start_date), aware(end_date)
+        matches = [
+            expense for expense in expenses
+            if start_date <= aware(expense['date']) <= end_date and matches_filters(expense, filters)
+        ]
+        if start_after:
+            start_after = tuple(aware(value) for value in start_after)
+        return sort_page(matches, filters['sort'], limit, start_after)
+
+    def _filtered_expenses(self, user_id, start_date, end_date, filters, start_after):
+        """Expense query with the category and amount filters and sort order pushed down"""
+        from google.cloud import firestore
+
+        query = self._expense_range(user_id, start_date, end_date)
+        if filters.get('categories'):
+            query = query.where('category', 'in', list(filters['categories']))
+        if filters.get('min_amount') is not None:
+            query = query.where('amount', '>=', filters['min_amount'])
+        if filters.get('max_amount') is not None:
+            query = query.where('amount', '<=', filters['max_amount'])
+        fields, descending = sort_order(filters['sort'])
+        direction = firestore.Query.DESCENDING if descending else firestore.Query.ASCENDING
+        for field in fields + ('__name__',):
+            query = query.order_by(field, direction=direction)
+        if start_after:
+            query = query.start_after(dict(zip(fields + ('__name__',), start_after)))
+        return query
+
+    def _expense_range(self, user_id, start_date, end_date, fields=None):
+        query = self._expenses(user_id).where('date', '>=', start_date).where('date', '<=', end_date)
+        if fields:
+            # Field mask: only these fields are sent over the wire
+            query = query.select(list(fields))
+        return query
+
+    def _ordered_expenses(self, user_id, start_date, end_date, start_after):
+        query = self._expense_range(user_id, start_date, end_date).order_by('date').order_by('__name__')
+        if start_after:
+            query = query.start_after({'date': start_after[0], '__name__': start_after[1]})
+        return query
+
+    @staticmethod
+    def _expense_chunks(items):
+        """
+        Split (expense_id, data) items into chunks that fit in one batch
+        alongside their rollup, version and search index writes, dropping
+        repeated ids
+        """
+        seen = set()
+        chunk = []
+        months = set()
+        entries = set()
+        for expense_id, data in items:
+            if expense_id:
+                if expense_id in seen:
+                    continue
+                seen.add(expense_id)
+            month = month_key(data['date'])
+            expense_entries = index_entries(data)
+            # Each batch holds the expense creates, a rollup and a version write
+            # per month and a search index write per (month, word)
+            if len(chunk) + 2 * len(months | {month}) + len(entries | expense_entries) >= MAX_BATCH_WRITES:
+                yield chunk
+                chunk = []
+                months = set()
+                entries = set()
+            chunk.append((expense_id, data))
+            months.add(month)
+            entries |= expense_entries
+        if chunk:
+            yield chunk
+
+    def _budget_query(self, user_id, month, fields=None):
+        query = self._budgets(user_id)
+        if month is not None:
+            query = query.where('month', '==', month)
+        if fields:
+            query = query.select(list(fields))
+        return query
+
+
+class FirestoreStorage(FirestoreDocuments, Storage):
+    """Storage backed by Cloud Firestore (see FirestoreDocuments for the layout)"""
+
+    name = 'firestore'
+
+    def list_expenses(self, user_id, start_date, end_date, fields=None):
+        return [self._to_dict(doc) for doc in self._expense_range(user_id, start_date, end_date, fields).stream()]
+
+    def page_expenses(self, user_id, start_date, end_date, limit, start_after=None):
+        query = self._ordered_expenses(user_id, start_date, end_date, start_after).limit(limit)
+        return [self._to_dict(doc) for doc in query.stream()]
+
+    def iter_expenses(self, user_id, start_date, end_date, start_after=None, chunk_size=500):
+        # Documents are yielded as they arrive from the query stream
+        for doc in self._ordered_expenses(user_id, start_date, end_date, start_after).stream():
+            yield self._to_dict(doc)
+
+    def query_expenses(self, user_id, start_date, end_date, filters, limit=None, start_after=None):
+        if filters.get('search_tokens'):
+            # Index documents first, then only the expenses they point to
+            refs = self._search_refs(user_id, start_date, end_date, filters['search_tokens'])
+            ids = self._search_matches(self.db.get_all(refs))
+            collection = self._expenses(user_id)
+            snapshots = self.db.get_all([collection.document(expense_id) for expense_id in ids]) if ids else []
+            expenses = [self._to_dict(snapshot) for snapshot in snapshots if snapshot.exists]
+            return self._filter_matches(expenses, start_date, end_date, filters, limit, start_after)
+
+        query = self._filtered_expenses(user_id, start_date, end_date, filters, start_after)
+        if limit is not None:
+            query = query.limit(limit)
+        return [self._to_dict(doc) for doc in query.stream()]
+
+    def get_expense(self, user_id, expense_id):
+        doc = self._expenses(user_id).document(expense_id).get()
+        return self._to_dict(doc) if doc.exists else None
+
+    def add_expense(self, user_id, data):
+        doc_ref = self._expenses(user_id).document()
+        batch = self.db.batch()
+        batch.create(doc_ref, data)
+        self._write_rollup_deltas(batch, user_id, rollup_deltas(None, data))
+        self._write_versions(batch, user_id, expense_months(data))
+        self._write_search_index(batch, user_id, search_index_changes(doc_ref.id, None, data))
+        batch.commit()
+        return doc_ref.id
+
+    def add_expenses(self, user_id, items):
+        written = []
+        for chunk in self._expense_chunks(items):
+            written.extend(self._commit_expense_chunk(user_id, chunk))
+        return written
+
+    def _commit_expense_chunk(self, user_id, chunk):
+        """Write one batch of new expenses with their rollup and version increments"""
+        collection = self._expenses(user_id)
+        keyed_refs = [collection.document(expense_id) for expense_id, _ in chunk if expense_id]
+        existing = {snapshot.id for snapshot in self.db.get_all(keyed_refs) if snapshot.exists} if keyed_refs else set()
+
+        batch = self.db.batch()
+        deltas = {}
+        search_changes = {}
+        written = []
+        for expense_id, data in chunk:
+            if expense_id in existing:
+                continue
+            doc_ref = collection.document(expense_id) if expense_id else collection.document()
+            batch.create(doc_ref, data)
+            merge_rollup_deltas(deltas, rollup_deltas(None, data))
+            merge_search_changes(search_changes, search_index_changes(doc_ref.id, None, data))
+            written.append(doc_ref.id)
+        if written:
+            self._write_rollup_deltas(batch, user_id, deltas)
+            self._write_versions(batch, user_id, deltas.keys())
+            self._write_search_index(batch, user_id, search_changes)
+            batch.commit()
+        return written
+
+    @staticmethod
+    def _commit_unless_changed(batch):
+        """
+        Commit a batch whose document write carries a last_update_time
+        precondition. Returns False if the document changed or was deleted
+        since it was read, so the caller can re-read and retry.
+        """
+        from google.api_core import exceptions as google_exceptions
+
+        try:
+            batch.commit()
+            return True
+        except google_exceptions.FailedPrecondition:
+            return False
+
+    def update_expense(self, user_id, expense_id, data):
+        # One read plus one precondition-guarded commit (no transaction
+        # begin/commit round-trips); retried only if the expense changed
+        doc_ref = self._expenses(user_id).document(expense_id)
+        for _ in range(MAX_WRITE_ATTEMPTS):
+            snapshot = doc_ref.get()
+            if not snapshot.exists:
+                return None
+            old = self._to_dict(snapshot)
+            merged = dict(old, **data)
+            batch = self.db.batch()
+            batch.update(doc_ref, data, option=self.db.write_option(last_update_time=snapshot.update_time))
+            self._write_rollup_deltas(batch, user_id, rollup_deltas(old, merged))
+            self._write_versions(batch, user_id, expense_months(old, merged))
+            self._write_search_index(batch, user_id, search_index_changes(expense_id, old, merged))
+            if self._commit_unless_changed(batch):
+                return old, merged
+        raise RuntimeError(f"Expense {expense_id} changed during {MAX_WRITE_ATTEMPTS} update attempts")
+
+    def delete_expense(self, user_id, expense_id):
+        doc_ref = self._expenses(user_id).document(expense_id)
+        for _ in range(MAX_WRITE_ATTEMPTS):
+            snapshot = doc_ref.get()
+            if not snapshot.exists:
+                return None
+            old = self._to_dict(snapshot)
+            batch = self.db.batch()
+            batch.delete(doc_ref, option=self.db.write_option(last_update_time=snapshot.update_time))
+            self._write_rollup_deltas(batch, user_id, rollup_deltas(old, None))
+            self._write_versions(batch, user_id, expense_months(old))
+            self._write_search_index(batch, user_id, search_index_changes(expense_id, old, None))
+            if self._commit_unless_changed(batch):
+                return old
+        raise RuntimeError(f"Expense {expense_id} changed during {MAX_WRITE_ATTEMPTS} delete attempts")
+
+    def list_budgets(self, user_id, month, fields=None):
+        return [self._to_dict(doc) for doc in self._budget_query(user_id, month, fields).stream()]
+
+    def get_budget(self, user_id, budget_id):
+        doc = self._budgets(user_id).document(budget_id).get()
+        return self._to_dict(doc) if doc.exists else None
+
+    def upsert_budget(self, user_id, data):
+        from google.api_core import exceptions as google_exceptions
+
+        budget_id = budget_document_id(user_id, data['month'], data.get('category', ''))
+        doc_ref = self._budgets(user_id).document(budget_id)
+
+        # New budgets take one commit; an existing one fails the create
+        # precondition and is overwritten by a second
+        batch = self.db.batch()
+        batch.create(doc_ref, data)
+        self._write_versions(batch, user_id, [data['month']])
+        try:
+            batch.commit()
+            return budget_id, True
+        except google_exceptions.Conflict:
+            pass
+
+        batch = self.db.batch()
+        batch.set(doc_ref, {key: value for key, value in data.items() if key != 'created_at'}, merge=True)
+        self._write_versions(batch, user_id, [data['month']])
+        batch.commit()
+        return budget_id, False
+
+    def delete_budget(self, user_id, budget_id):
+        from google.api_core import exceptions as google_exceptions
+
+        doc_ref = self._budgets(user_id).document(budget_id)
+        month = budget_id_month(budget_id)
+        if month is None:
+            # Random id from before deterministic ids: read it for the month
+            snapshot = doc_ref.get()
+            if not snapshot.exists:
+                return None
+            month = snapshot.get('month')
+
+        # Delete and version bump in one commit; the exists precondition
+        # reports missing budgets without a separate read
+        batch = self.db.batch()
+        batch.delete(doc_ref, option=self.db.write_option(exists=True))
+        self._write_versions(batch, user_id, [month])
+        try:
+            batch.commit()
+        except google_exceptions.NotFound:
+            return None
+        return month
+
+    def migrate_amounts(self, user_id):
+        updates = []
+        for collection in (self._expenses(user_id), self._budgets(user_id), self._recurring(user_id)):
+            for doc in collection.select(['amount', 'amount_cents']).stream():
+                data = doc.to_dict()
+                if data.get('amount_cents') is None:
+                    updates.append((doc.reference, money_fields(to_cents(data.get('amount') or 0))))
+        for start in range(0, len(updates), MAX_BATCH_WRITES):
+            batch = self.db.batch()
+            for doc_ref, data in updates[start:start + MAX_BATCH_WRITES]:
+                batch.update(doc_ref, data)
+            batch.commit()
+        return len(updates)
+
+    def list_recurring_rules(self, user_id):
+        return [self._to_dict(doc) for doc in self._recurring(user_id).stream()]
+
+    def get_recurring_rule(self, user_id, rule_id):
+        doc = self._recurring(user_id).document(rule_id).get()
+        return self._to_dict(doc) if doc.exists else None
+
+    def add_recurring_rule(self, user_id, data):
+        doc_ref = self._recurring(user_id).document()
+        doc_ref.create(data)
+        return doc_ref.id
+
+    def update_recurring_rule(self, user_id, rule_id, data):
+        from google.api_core import exceptions as google_exceptions
+
+        doc_ref = self._recurring(user_id).document(rule_id)
+        snapshot = doc_ref.get()
+        if not snapshot.exists:
+            return None
+        try:
+            doc_ref.update(data)
+        except google_exceptions.NotFound:
+            return None
+        return dict(self._to_dict(snapshot), **data)
+
+    def delete_recurring_rule(self, user_id, rule_id):
+        from google.api_core import exceptions as google_exceptions
+
+        try:
+            self._recurring(user_id).document(rule_id).delete(option=self.db.write_option(exists=True))
+        except google_exceptions.NotFound:
+            return False
+        return True
+
+    def list_due_recurring_rules(self, before):
+        # Rules live under users/<user_id>/recurring
+        return [(doc.reference.parent.parent.id, self._to_dict(doc)) for doc in self._due_recurring(before).stream()]
+
+    def get_rollup(self, user_id, month):
+        return self._stored_rollup(self._rollups(user_id).document(month).get())
+
+    def rebuild_rollup(self, user_id, month, bump_version=True):
+        from google.cloud import firestore
+
+        start_date, end_date = month_range(month)
+        rollup_ref = self._rollups(user_id).document(month)
+        query = self._expense_range(user_id, start_date, end_date, ROLLUP_FIELDS)
+
+        # Reading the month inside the transaction makes concurrent expense
+        # writes retry instead of being overwritten by the rebuilt totals
+        @firestore.transactional
+        def run(transaction):
+            rollup_ref.get(transaction=transaction)
+            expenses = [doc.to_dict() for doc in transaction.get(query)]
+            rollup = summarize_expenses(month, expenses)
+            rollup['updated_at'] = datetime.now()
+            transaction.set(rollup_ref, dict(rollup, complete=True))
+            if bump_version:
+                self._write_versions(transaction, user_id, [month])
+            return rollup
+
+        return run(self.db.transaction())
+
+    def list_rollup_months(self, user_id):
+        return [doc_ref.id for doc_ref in self._rollups(user_id).list_documents()]
+
+    def list_user_ids(self):
+        return [doc_ref.id for doc_ref in self.db.collection('users').list_documents()]
+
+    def expense_partitions(self, shards):
+        # Partition cursors are expense paths, balanced by document count;
+        # cut at their users so every user falls in exactly one range
+        bounds = []
+        for partition in self.db.collection_group('expenses').get_partitions(shards):
+            if partition.end_at is not None:
+                user_id = partition.end_at.parent.parent.id
+                if not bounds or user_id > bounds[-1]:
+                    bounds.append(user_id)
+        return bounds
+
+    def scan_expenses(self, first_user, end_user, fields=None):
+        query = self._user_range('expenses', first_user, end_user)
+        if fields:
+            query = query.select(list(fields))
+        for doc in query.stream():
+            yield doc.reference.parent.parent.id, self._to_dict(doc)
+
+    def scan_budgets(self, first_user, end_user):
+        for doc in self._user_range('budgets', first_user, end_user).stream():
+            yield doc.reference.parent.parent.id, self._to_dict(doc)
+
+    def get_stats(self, stats_id):
+        doc = self._stats().document(stats_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def set_stats(self, stats_id, data):
+        self._stats().document(stats_id).set(dict(data, updated_at=datetime.now()))
+
+    def delete_stats(self, stats_id):
+        self._stats().document(stats_id).delete()
+
+    def rebuild_search_index(self, user_id):
+        entries = {}
+        for doc in self._expenses(user_id).select(['category', 'note', 'date']).stream():
+            merge_search_changes(entries, search_index_changes(doc.id, None, self._to_dict(doc)))
+
+        # Not atomic: run it while the user is not writing. Entries are
+        # overwritten whole and entries of words no longer used are deleted
+        index = self._search_index(user_id)
+        documents = {f"{month}_{token}": {'ids': ids} for (month, token), ids in entries.items()}
+        writes = [('delete', doc_ref, None) for doc_ref in index.list_documents() if doc_ref.id not in documents]
+        writes += [('set', index.document(doc_id), data) for doc_id, data in documents.items()]
+        for start in range(0, len(writes), MAX_BATCH_WRITES):
+            batch = self.db.batch()
+            for action, doc_ref, data in writes[start:start + MAX_BATCH_WRITES]:
+                if action == 'delete':
+                    batch.delete(doc_ref)
+                else:
+                    batch.set(doc_ref, data)
+            batch.commit()
+        return len(entries)
+
+    def get_versions(self, user_id, months):
+        versions = {month: 0 for month in months}
+        refs = [self._versions(user_id).document(month) for month in versions]
+        for snapshot in self.db.get_all(refs):
+            if snapshot.exists:
+                versions[snapshot.id] = snapshot.get('version') or 0
+        return versions
+
+    def watch_versions(self, user_id, month, callback):
+        return self._watch_version(self.db, user_id, month, callback)
+
+    def ping(self):
+        self._ping_ref().get(retry=None, timeout=READINESS_TIMEOUT)
+
+
+class MemoryStorage(Storage):
+    """Process-local storage kept in dicts, guarded by a lock"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._expenses = {}  # user_id -> {expense_id: data}
+        self._budgets = {}   # user_id -> {budget_id: data}
+        self._rollups = {}   # user_id -> {month: rollup}
+        self._versions = {}  # user_id -> {month: version}
+        self._search = {}    # user_id -> {(month, token): {expense_id}}
+        self._recurring = {}  # user_id -> {rule_id: data}
+        self._stats = {}     # stats_id -> data
+        self._watchers = VersionWatchers()
+
+    @staticmethod
+    def _new_id():
+        return uuid.uuid4().hex[:20]
+
+    @staticmethod
+    def _copy(doc_id, data, fields=None):
+        result = {field: data[field] for field in fields if field in data} if fields else dict(data)
+        result['id'] = doc_id
+        return result
+
+    def _apply_rollup_deltas(self, user_id, deltas):
+        """Apply rollup changes; the caller holds the lock"""
+        user_rollups = self._rollups.setdefault(user_id, {})
+        for month, categories in deltas.items():
+            rollup = user_rollups.setdefault(month, {'month': month, 'total_cents': 0, 'count': 0, 'categories': {}})
+            for category, (cents, count) in categories.items():
+                entry = rollup['categories'].setdefault(category, {'total_cents': 0, 'count': 0})
+                entry['total_cents'] += cents
+                entry['count'] += count
+                rollup['total_cents'] += cents
+                rollup['count'] += count
+            rollup['updated_at'] = datetime.now()
+
+    def _apply_search_changes(self, user_id, changes):
+        """Apply search index changes; the caller holds the lock"""
+        user_index = self._search.setdefault(user_id, {})
+        for entry, ids in changes.items():
+            expense_ids = user_index.setdefault(entry, set())
+            for expense_id, present in ids.items():
+                if present:
+                    expense_ids.add(expense_id)
+                else:
+                    expense_ids.discard(expense_id)
+            if not expense_ids:
+                del user_index[entry]
+
+    def _bump_versions(self, user_id, months):
+        """Increment data versions; the caller holds the lock"""
+        months = list(months)
+        user_versions = self._versions.setdefault(user_id, {})
+        for month in months:
+            user_versions[month] = user_versions.get(month, 0) + 1
+        self._watchers.notify(user_id, months)
+
+    def list_expenses(self, user_id, start_date, end_date, fields=None):
+        with self._lock:
+            matches = sorted(
+                (data['date'], doc_id, data)
+                for doc_id, data in self._expenses.get(user_id, {}).items()
+                if start_date <= data['date'] <= end_date
+            )
+            return [self._copy(doc_id, data, fields) for _, doc_id, data in matches]
+
+    def _expenses_after(self, user_id, start_date, end_date, start_after):
+        items = self.list_expenses(user_id, start_date, end_date)
+        if start_after:
+            items = [item for item in items if (item['date'], item['id']) > tuple(start_after)]
+        return items
+
+    def page_expenses(self, user_id, start_date, end_date, limit, start_after=None):
+        return self._expenses_after(user_id, start_date, end_date, start_after)[:limit]
+
+    def list_expense_columns(self, user_id, start_date, end_date):
+        # Read straight from the stored documents, without copying them
+        with self._lock:
+            return expense_columns(
+                data for data in self._expenses.get(user_id, {}).values() if start_date <= data['date'] <= end_date
+            )
+
+    def iter_expenses(self, user_id, start_date, end_date, start_after=None, chunk_size=500):
+        yield from self._expenses_after(user_id, start_date, end_date, start_after)
+
+    def query_expenses(self, user_id, start_date, end_date, filters, limit=None, start_after=None):
+        with self._lock:
+            user_expenses = self._expenses.get(user_id, {})
+            if filters.get('search_tokens'):
+                user_index = self._search.get(user_id, {})
+                ids = set()
+                for month in month_keys(start_date, end_date):
+                    ids |= set.intersection(*(
+                        user_index.get((month, token), set()) for token in filters['search_tokens']
+                    ))
+                candidates = ((expense_id, user_expenses[expense_id]) for expense_id in ids)
+            else:
+                candidates = user_expenses.items()
+            matches = [
+                self._copy(doc_id, data) for doc_id, data in candidates
+                if start_date <= data['date'] <= end_date and matches_filters(data, filters)
+            ]
+        return sort_page(matches, filters['sort'], limit, start_after)
+
+    def get_expense(self, user_id, expense_id):
+        with self._lock:
+            data = self._expenses.get(user_id, {}).get(expense_id)
+            return self._copy(expense_id, data) if data is not None else None
+
+    def add_expense(self, user_id, data):
+        expense_id = self._new_id()
+        with self._lock:
+            self._expenses.setdefault(user_id, {})[expense_id] = dict(data)
+            self._apply_rollup_deltas(user_id, rollup_deltas(None, data))
+            self._apply_search_changes(user_id, search_index_changes(expense_id, None, data))
+            self._bump_versions(user_id, expense_months(data))
+        return expense_id
+
+    def add_expenses(self, user_id, items):
+        written = []
+        deltas = {}
+        search_changes = {}
+        with self._lock:
+            user_expenses = self._expenses.setdefault(user_id, {})
+            for expense_id, data in items:
+                if expense_id in user_expenses:
+                    continue
+                expense_id = expense_id or self._new_id()
+                user_expenses[expense_id] = dict(data)
+                merge_rollup_deltas(deltas, rollup_deltas(None, data))
+                merge_search_changes(search_changes, search_index_changes(expense_id, None, data))
+                written.append(expense_id)
+            self._apply_rollup_deltas(user_id, deltas)
+            self._apply_search_changes(user_id, search_changes)
+            self._bump_versions(user_id, deltas.keys())
+        return written
+
+    def update_expense(self, user_id, expense_id, data):
+        with self._lock:
+            current = self._expenses.get(user_id, {}).get(expense_id)
+            if current is None:
+                return None
+            old = self._copy(expense_id, current)
+            current.update(data)
+            self._apply_rollup_deltas(user_id, rollup_deltas(old, current))
+            self._apply_search_changes(user_id, search_index_changes(expense_id, old, current))
+            self._bump_versions(user_id, expense_months(old, current))
+            return old, self._copy(expense_id, current)
+
+    def delete_expense(self, user_id, expense_id):
+        with self._lock:
+            old = self._expenses.get(user_id, {}).pop(expense_id, None)
+            if old is None:
+                return None
+            self._apply_rollup_deltas(user_id, rollup_deltas(old, None))
+            self._apply_search_changes(user_id, search_index_changes(expense_id, old, None))
+            self._bump_versions(user_id, expense_months(old))
+            return self._copy(expense_id, old)
+
+    def list_budgets(self, user_id, month, fields=None):
+        with self._lock:
+            return [
+                self._copy(doc_id, data, fields)
+                for doc_id, data in self._budgets.get(user_id, {}).items()
+                if month is None or data.get('month') == month
+            ]
+
+    def get_budget(self, user_id, budget_id):
+        with self._lock:
+            data = self._budgets.get(user_id, {}).get(budget_id)
+            return self._copy(budget_id, data) if data is not None else None
+
+    def upsert_budget(self, user_id, data):
+        budget_id = budget_document_id(user_id, data['month'], data.get('category', ''))
+        with self._lock:
+            user_budgets = self._budgets.setdefault(user_id, {})
+            created = budget_id not in user_budgets
+            if created:
+                user_budgets[budget_id] = dict(data)
+            else:
+                user_budgets[budget_id].update({key: value for key, value in data.items() if key != 'created_at'})
+            self._bump_versions(user_id, [data['month']])
+        return budget_id, created
+
+    def delete_budget(self, user_id, budget_id):
+        with self._lock:
+            old = self._budgets.get(user_id, {}).pop(budget_id, None)
+            if old is None:
+                return None
+            self._bump_versions(user_id, [old['month']])
+            return old['month']
+
+    def migrate_amounts(self, user_id):
+        updated = 0
+        with self._lock:
+            for documents in (self._expenses, self._budgets, self._recurring):
+                for data in documents.get(user_id, {}).values():
+                    if data.get('amount_cents') is None:
+                        data.update(money_fields(to_cents(data.get('amount') or 0)))
+                        updated += 1
+        return updated
+
+    def list_recurring_rules(self, user_id):
+        with self._lock:
+            return [self._copy(rule_id, data) for rule_id, data in self._recurring.get(user_id, {}).items()]
+
+    def get_recurring_rule(self, user_id, rule_id):
+        with self._lock:
+            data = self._recurring.get(user_id, {}).get(rule_id)
+            return self._copy(rule_id, data) if data is not None else None
+
+    def add_recurring_rule(self, user_id, data):
+        rule_id = self._new_id()
+        with self._lock:
+            self._recurring.setdefault(user_id, {})[rule_id] = dict(data)
+        return rule_id
+
+    def update_recurring_rule(self, user_id, rule_id, data):
+        with self._lock:
+            current = self._recurring.get(user_id, {}).get(rule_id)
+            if current is None:
+                return None
+            current.update(data)
+            return self._copy(rule_id, current)
+
+    def delete_recurring_rule(self, user_id, rule_id):
+        with self._lock:
+            return self._recurring.get(user_id, {}).pop(rule_id, None) is not None
+
+    def list_due_recurring_rules(self, before):
+        with self._lock:
+            return [
+                (user_id, self._copy(rule_id, data))
+                for user_id, rules in self._recurring.items()
+                for rule_id, data in rules.items()
+                if data.get('next_date') is not None and data['next_date'] <= before
+            ]
+
+    def get_rollup(self, user_id, month):
+        with self._lock:
+            rollup = self._rollups.get(user_id, {}).get(month)
+            return copy.deepcopy(rollup) if rollup is not None else None
+
+    def rebuild_rollup(self, user_id, month, bump_version=True):
+        start_date, end_date = month_range(month)
+        with self._lock:
+            rollup = summarize_expenses(month, self.list_expense_columns(user_id, start_date, end_date))
+            rollup['updated_at'] = datetime.now()
+            self._rollups.setdefault(user_id, {})[month] = rollup
+            if bump_version:
+                self._bump_versions(user_id, [month])
+            return copy.deepcopy(rollup)
+
+    def list_rollup_months(self, user_id):
+        with self._lock:
+            return list(self._rollups.get(user_id, {}))
+
+    def list_user_ids(self):
+        with self._lock:
+            return sorted(set(self._expenses) | set(self._budgets))
+
+    @staticmethod
+    def _in_range(user_id, first_user, end_user):
+        return (first_user is None or user_id >= first_user) and (end_user is None or user_id < end_user)
+
+    def expense_partitions(self, shards):
+        with self._lock:
+            counts = sorted((user_id, len(expenses)) for user_id, expenses in self._expenses.items())
+        return user_range_bounds(counts, shards)
+
+    def scan_expenses(self, first_user, end_user, fields=None):
+        with self._lock:
+            items = [
+                (user_id, self._copy(expense_id, data, fields))
+                for user_id, expenses in sorted(self._expenses.items())
+                if self._in_range(user_id, first_user, end_user)
+                for expense_id, data in expenses.items()
+            ]
+        yield from items
+
+    def scan_budgets(self, first_user, end_user):
+        with self._lock:
+            items = [
+                (user_id, self._copy(budget_id, data))
+                for user_id, budgets in sorted(self._budgets.items())
+                if self._in_range(user_id, first_user, end_user)
+                for budget_id, data in budgets.items()
+            ]
+        yield from items
+
+    def get_stats(self, stats_id):
+        with self._lock:
+            data = self._stats.get(stats_id)
+            return copy.deepcopy(data) if data is not None else None
+
+    def set_stats(self, stats_id, data):
+        with self._lock:
+            self._stats[stats_id] = dict(copy.deepcopy(data), updated_at=datetime.now())
+
+    def delete_stats(self, stats_id):
+        with self._lock:
+            self._stats.pop(stats_id, None)
+
+    def rebuild_search_index(self, user_id):
+        with self._lock:
+            entries = {}
+            for expense_id, data in self._expenses.get(user_id, {}).items():
+                merge_search_changes(entries, search_index_changes(expense_id, None, data))
+            self._search[user_id] = {entry: set(ids) for entry, ids in entries.items()}
+            return len(entries)
+
+    def get_versions(self, user_id, months):
+        with self._lock:
+            user_versions = self._versions.get(user_id, {})
+            return {month: user_versions.get(month, 0) for month in months}
+
+    def watch_versions(self, user_id, month, callback):
+        return self._watchers.watch(user_id, month, callback)
+
+    def ping(self):
+        pass
+
+
+class SQLiteStorage(Storage):
+    """
+    Storage in a single SQLite database file.
+
+    Expenses are indexed on (user_id, date), (user_id, category, date) and
+    (user_id, amount), and budgets on (user_id, month, category), so the
+    month range and filtered queries the routes issue stay index scans.
+    Rollups are two tables (month totals and per-category totals) and the
+    search index one (user_id, month, token, expense_id) table, all written in
+    the same SQL transaction as the expense. Fleet statistics are JSON
+    documents in a stats table. One
+    connection is shared behind a lock, which also makes ':memory:'
+    databases usable from Flask's threaded server.
+    """
+
+    name = 'sqlite'
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS expenses (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            amount REAL NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            date TEXT NOT NULL,
+            note TEXT NOT NULL DEFAULT '',
+            created_at TEXT,
+            updated_at TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON expenses (user_id, date);
+        CREATE INDEX IF NOT EXISTS idx_expenses_user_category ON expenses (user_id, category, date);
+        CREATE INDEX IF NOT EXISTS idx_expenses_user_amount ON expenses (user_id, amount);
+        CREATE TABLE IF NOT EXISTS budgets (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            amount REAL NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            category TEXT NOT NULL DEFAULT '',
+            created_at TEXT,
+            updated_at TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_budgets_user_month ON budgets (user_id, month, category);
+        CREATE TABLE IF NOT EXISTS rollups (
+            user_id TEXT NOT NULL,
+            month TEXT NOT NULL,
+            total_cents INTEGER NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT,
+            PRIMARY KEY (user_id, month)
+        );
+        CREATE TABLE IF NOT EXISTS rollup_categories (
+            user_id TEXT NOT NULL,
+            month TEXT NOT NULL,
+            category TEXT NOT NULL,
+            total_cents INTEGER NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month, category)
+        );
+        CREATE TABLE IF NOT EXISTS versions (
+            user_id TEXT NOT NULL,
+            month TEXT NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month)
+        );
+        CREATE TABLE IF NOT EXISTS recurring_rules (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            amount REAL NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            note TEXT NOT NULL DEFAULT '',
+            frequency TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT,
+            next_date TEXT,
+            created_at TEXT,
+            updated_at TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_recurring_user ON recurring_rules (user_id);
+        CREATE INDEX IF NOT EXISTS idx_recurring_next_date ON recurring_rules (next_date);
+        CREATE TABLE IF NOT EXISTS stats (
+            id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at TEXT
+        );
+        CREATE TABLE IF NOT EXISTS search_index (
+            user_id TEXT NOT NULL,
+            month TEXT NOT NULL,
+            token TEXT NOT NULL,
+            expense_id TEXT NOT NULL,
+            PRIMARY KEY (user_id, month, token, expense_id)
+        );
+    """
+
+    DATETIME_FIELDS = ('date', 'start_date', 'end_date', 'next_date', 'created_at', 'updated_at')
+
+    # Cent columns added to databases created before amounts were kept in
+    # cents, filled from the float column next to them: (table, column, float column)
+    CENTS_COLUMNS = (
+        ('expenses', 'amount_cents', 'amount'),
+        ('budgets', 'amount_cents', 'amount'),
+        ('recurring_rules', 'amount_cents', 'amount'),
+        ('rollups', 'total_cents', 'total'),
+        ('rollup_categories', 'total_cents', 'total')
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(self.SCHEMA)
+        self._migrate_cents()
+        self._watchers = VersionWatchers()
+
+    def _migrate_cents(self):
+        """Add and fill the cent columns of an older database, in one transaction"""
+        with self._conn:
+            for table, column, float_column in self.CENTS_COLUMNS:
+                columns = {row['name'] for row in self._conn.execute(f'PRAGMA table_info({table})')}
+                if column in columns:
+                    continue
+                self._conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0')
+                self._conn.execute(f'UPDATE {table} SET {column} = CAST(ROUND({float_column} * 100) AS INTEGER)')
+
+    @staticmethod
+    def _new_id():
+        return uuid.uuid4().hex[:20]
+
+    @classmethod
+    def _to_db(cls, data):
+        """Convert datetimes to ISO strings for storage, adding amount_cents to an amount without it"""
+        values = {
+            key: value.isoformat() if key in cls.DATETIME_FIELDS and isinstance(value, datetime) else value
+            for key, value in data.items()
+        }
+        if 'amount' in values and values.get('amount_cents') is None:
+            values['amount_cents'] = amount_cents(values)
+        return values
+
+    @classmethod
+    def _from_row(cls, row):
+        data = dict(row)
+        data.pop('user_id', None)
+        for field in cls.DATETIME_FIELDS:
+            if data.get(field):
+                data[field] = datetime.fromisoformat(data[field])
+        return data
+
+    @staticmethod
+    def _columns(fields, allowed):
+        """SELECT column list for an optional field projection"""
+        if not fields:
+            return '*'
+        return ', '.join(['id'] + [field for field in fields if field in allowed])
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._from_row(row) for row in rows]
+
+    def _insert(self, table, fields, user_id, data, doc_id=None, ignore_existing=False):
+        """
+        Insert a row; the caller holds the lock and the transaction.
+        Returns the new id, or None if ignore_existing skipped a duplicate.
+        """
+        doc_id = doc_id or self._new_id()
+        values = self._to_db(data)
+        columns = ['id', 'user_id'] + [field for field in fields if field in values]
+        params = [doc_id, user_id] + [values[field] for field in columns[2:]]
+        verb = 'INSERT OR IGNORE' if ignore_existing else 'INSERT'
+        sql = f"{verb} INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        cursor = self._conn.execute(sql, params)
+        return doc_id if cursor.rowcount else None
+
+    def _update(self, table, fields, user_id, doc_id, data):
+        """Update a row; the caller holds the lock and the transaction"""
+        values = {key: value for key, value in self._to_db(data).items() if key in fields}
+        if not values:
+            return
+        assignments = ', '.join(f'{key} = ?' for key in values)
+        sql = f'UPDATE {table} SET {assignments} WHERE user_id = ? AND id = ?'
+        self._conn.execute(sql, list(values.values()) + [user_id, doc_id])
+
+    def _apply_rollup_deltas(self, user_id, deltas):
+        """Upsert rollup rows; the caller holds the lock and the transaction"""
+        if not deltas:
+            return
+        now = datetime.now().isoformat()
+        stored = {
+            row['month'] for row in self._conn.execute(
+                f"SELECT month FROM rollups WHERE user_id = ? AND month IN ({', '.join('?' * len(deltas))})",
+                [user_id, *deltas]
+            )
+        }
+        for month, categories in deltas.items():
+            if month not in stored:
+                # No rollup yet (e.g. expenses stored before rollups existed):
+                # build it from the rows, which already include this write
+                self._store_rollup(user_id, month)
+                continue
+            self._conn.execute(
+                """INSERT INTO rollups (user_id, month, total_cents, count, updated_at) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT (user_id, month) DO UPDATE SET
+                       total_cents = total_cents + excluded.total_cents, count = count + excluded.count,
+                       updated_at = excluded.updated_at""",
+                (user_id, month, sum(cents for cents, _ in categories.values()),
+                 sum(count for _, count in categories.values()), now)
+            )
+            self._conn.executemany(
+                """INSERT INTO rollup_categories (user_id, month, category, total_cents, count) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT (user_id, month, category) DO UPDATE SET
+                       total_cents = total_cents + excluded.total_cents, count = count + excluded.count""",
+                [(user_id, month, category, cents, count) for category, (cents, count) in categories.items()]
+            )
+
+    def _apply_search_changes(self, user_id, changes):
+        """Insert and delete search index rows; the caller holds the lock and the transaction"""
+        added, removed = [], []
+        for (month, token), ids in changes.items():
+            for expense_id, present in ids.items():
+                (added if present else removed).append((user_id, month, token, expense_id))
+        self._conn.executemany(
+            'INSERT OR IGNORE INTO search_index (user_id, month, token, expense_id) VALUES (?, ?, ?, ?)', added
+        )
+        self._conn.executemany(
+            'DELETE FROM search_index WHERE user_id = ? AND month = ? AND token = ? AND expense_id = ?', removed
+        )
+
+    def _bump_versions(self, user_id, months):
+        """Increment data versions; the caller holds the lock and the transaction"""
+        months = [month for month in months if month]
+        self._conn.executemany(
+            """INSERT INTO versions (user_id, month, version) VALUES (?, ?, 1)
+               ON CONFLICT (user_id, month) DO UPDATE SET version = version + 1""",
+            [(user_id, month) for month in months]
+        )
+        # Readers a callback hands off to wait on the lock, so they see the committed write
+        self._watchers.notify(user_id, months)
+
+    def list_expenses(self, user_id, start_date, end_date, fields=None):
+        return self._query(
+            f'SELECT {self._columns(fields, EXPENSE_FIELDS)} FROM expenses '
+            'WHERE user_id = ? AND date >= ? AND date <= ? ORDER BY date, id',
+            (user_id, start_date.isoformat(), end_date.isoformat())
+        )
+
+    def list_expense_columns(self, user_id, start_date, end_date):
+        # Plain tuples instead of Row objects and dicts; dates stay ISO strings
+        # up to the YYYY-MM-DD the ordinal needs
+        columns = ExpenseColumns()
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.row_factory = None
+            cursor.execute(
+                'SELECT amount_cents, category, substr(date, 1, 10) FROM expenses '
+                'WHERE user_id = ? AND date >= ? AND date <= ?',
+                (user_id, start_date.isoformat(), end_date.isoformat())
+            )
+            for cents, category, day in cursor:
+                columns.append(cents, rollup_category(category), date.fromisoformat(day).toordinal())
+        return columns
+
+    def page_expenses(self, user_id, start_date, end_date, limit, start_after=None):
+        sql = 'SELECT * FROM expenses WHERE user_id = ? AND date >= ? AND date <= ?'
+        params = [user_id, start_date.isoformat(), end_date.isoformat()]
+        if start_after:
+            cursor_date = start_after[0].isoformat()
+            sql += ' AND (date > ? OR (date = ? AND id > ?))'
+            params += [cursor_date, cursor_date, start_after[1]]
+        sql += ' ORDER BY date, id LIMIT ?'
+        return self._query(sql, params + [limit])
+
+    def query_expenses(self, user_id, start_date, end_date, filters, limit=None, start_after=None):
+        sql = 'SELECT * FROM expenses WHERE user_id = ? AND date >= ? AND date <= ?'
+        params = [user_id, start_date.isoformat(), end_date.isoformat()]
+        if filters.get('categories'):
+            sql += f" AND category IN ({', '.join('?' * len(filters['categories']))})"
+            params += list(filters['categories'])
+        if filters.get('min_amount') is not None:
+            sql += ' AND amount >= ?'
+            params.append(filters['min_amount'])
+        if filters.get('max_amount') is not None:
+            sql += ' AND amount <= ?'
+            params.append(filters['max_amount'])
+        tokens = filters.get('search_tokens')
+        if tokens:
+            # Expenses holding every searched word in the index entries of their month
+            months = month_keys(start_date, end_date)
+            sql += (
+                ' AND id IN (SELECT expense_id FROM search_index WHERE user_id = ?'
+                f" AND month IN ({', '.join('?' * len(months))}) AND token IN ({', '.join('?' * len(tokens))})"
+                ' GROUP BY expense_id HAVING COUNT(*) = ?)'
+            )
+            params += [user_id] + months + list(tokens) + [len(tokens)]
+        fields, descending = sort_order(filters['sort'])
+        columns = ', '.join(fields + ('id',))
+        if start_after:
+            sql += f" AND ({columns}) {'<' if descending else '>'} ({', '.join('?' * len(start_after))})"
+            params += [value.isoformat() if isinstance(value, datetime) else value for value in start_after]
+        order = ' DESC' if descending else ''
+        sql += ' ORDER BY ' + ', '.join(f'{field}{order}' for field in fields + ('id',))
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return self._query(sql, params)
+
+    def get_expense(self, user_id, expense_id):
+        rows = self._query('SELECT * FROM expenses WHERE user_id = ? AND id = ?', (user_id, expense_id))
+        return rows[0] if rows else None
+
+    def add_expense(self, user_id, data):
+        with self._lock, self._conn:
+            expense_id = self._insert('expenses', EXPENSE_FIELDS, user_id, data)
+            self._apply_rollup_deltas(user_id, rollup_deltas(None, data))
+            self._apply_search_changes(user_id, search_index_changes(expense_id, None, data))
+            self._bump_versions(user_id, expense_months(data))
+        return expense_id
+
+    def add_expenses(self, user_id, items):
+        written = []
+        deltas = {}
+        search_changes = {}
+        with self._lock, self._conn:
+            for expense_id, data in items:
+                expense_id = self._insert('expenses', EXPENSE_FIELDS, user_id, data, expense_id, ignore_existing=True)
+                if expense_id:
+                    merge_rollup_deltas(deltas, rollup_deltas(None, data))
+                    merge_search_changes(search_changes, search_index_changes(expense_id, None, data))
+                    written.append(expense_id)
+            self._apply_rollup_deltas(user_id, deltas)
+            self._apply_search_changes(user_id, search_changes)
+            self._bump_versions(user_id, deltas.keys())
+        return written
+
+    def update_expense(self, user_id, expense_id, data):
+        with self._lock, self._conn:
+            old = self.get_expense(user_id, expense_id)
+            if old is None:
+                return None
+            merged = dict(old, **data)
+            self._update('expenses', EXPENSE_FIELDS, user_id, expense_id, data)
+            self._apply_rollup_deltas(user_id, rollup_deltas(old, merged))
+            self._apply_search_changes(user_id, search_index_changes(expense_id, old, merged))
+            self._bump_versions(user_id, expense_months(old, merged))
+            return old, merged
+
+    def delete_expense(self, user_id, expense_id):
+        with self._lock, self._conn:
+            old = self.get_expense(user_id, expense_id)
+            if old is None:
+                return None
+            self._conn.execute('DELETE FROM expenses WHERE user_id = ? AND id = ?', (user_id, expense_id))
+            self._apply_rollup_deltas(user_id, rollup_deltas(old, None))
+            self._apply_search_changes(user_id, search_index_changes(expense_id, old, None))
+            self._bump_versions(user_id, expense_months(old))
+            return old
+
+    def list_budgets(self, user_id, month, fields=None):
+        sql = f'SELECT {self._columns(fields, BUDGET_FIELDS)} FROM budgets WHERE user_id = ?'
+        if month is None:
+            return self._query(sql, (user_id,))
+        return self._query(sql + ' AND month = ?', (user_id, month))
+
+    def get_budget(self, user_id, budget_id):
+        rows = self._query('SELECT * FROM budgets WHERE user_id = ? AND id = ?', (user_id, budget_id))
+        return rows[0] if rows else None
+
+    def upsert_budget(self, user_id, data):
+        budget_id = budget_document_id(user_id, data['month'], data.get('category', ''))
+        with self._lock, self._conn:
+            created = self._insert('budgets', BUDGET_FIELDS, user_id, data, budget_id, ignore_existing=True) is not None
+            if not created:
+                self._update('budgets', BUDGET_FIELDS, user_id, budget_id,
+                             {key: value for key, value in data.items() if key != 'created_at'})
+            self._bump_versions(user_id, [data['month']])
+        return budget_id, created
+
+    def delete_budget(self, user_id, budget_id):
+        with self._lock, self._conn:
+            old = self.get_budget(user_id, budget_id)
+            if old is None:
+                return None
+            self._conn.execute('DELETE FROM budgets WHERE user_id = ? AND id = ?', (user_id, budget_id))
+            self._bump_versions(user_id, [old['month']])
+            return old['month']
+
+    def migrate_amounts(self, user_id):
+        # The cent columns were filled when the database was opened (_migrate_cents)
+        return 0
+
+    def list_recurring_rules(self, user_id):
+        return self._query('SELECT * FROM recurring_rules WHERE user_id = ?', (user_id,))
+
+    def get_recurring_rule(self, user_id, rule_id):
+        rows = self._query('SELECT * FROM recurring_rules WHERE user_id = ? AND id = ?', (user_id, rule_id))
+        return rows[0] if rows else None
+
+    def add_recurring_rule(self, user_id, data):
+        with self._lock, self._conn:
+            return self._insert('recurring_rules', RECURRING_FIELDS, user_id, data)
+
+    def update_recurring_rule(self, user_id, rule_id, data):
+        with self._lock, self._conn:
+            old = self.get_recurring_rule(user_id, rule_id)
+            if old is None:
+                return None
+            self._update('recurring_rules', RECURRING_FIELDS, user_id, rule_id, data)
+            return dict(old, **data)
+
+    def delete_recurring_rule(self, user_id, rule_id):
+        with self._lock, self._conn:
+            cursor = self._conn.execute('DELETE FROM recurring_rules WHERE user_id = ? AND id = ?', (user_id, rule_id))
+            return cursor.rowcount > 0
+
+    def list_due_recurring_rules(self, before):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT * FROM recurring_rules WHERE next_date <= ?', (before.isoformat(),)
+            ).fetchall()
+        return [(row['user_id'], self._from_row(row)) for row in rows]
+
+    def get_rollup(self, user_id, month):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT total_cents, count, updated_at FROM rollups WHERE user_id = ? AND month = ?', (user_id, month)
+            ).fetchone()
+            if row is None:
+                return None
+            categories = self._conn.execute(
+                'SELECT category, total_cents, count FROM rollup_categories WHERE user_id = ? AND month = ?',
+                (user_id, month)
+            ).fetchall()
+        return {
+            'month': month,
+            'total_cents': row['total_cents'],
+            'count': row['count'],
+            'categories': {
+                item['category']: {'total_cents': item['total_cents'], 'count': item['count']} for item in categories
+            },
+            'updated_at': datetime.fromisoformat(row['updated_at']) if row['updated_at'] else None
+        }
+
+    def _store_rollup(self, user_id, month):
+        """Recompute and store a month's rollup rows; the caller holds the lock and the transaction"""
+        start_date, end_date = month_range(month)
+        rollup = summarize_expenses(month, self.list_expense_columns(user_id, start_date, end_date))
+        rollup['updated_at'] = datetime.now()
+        self._conn.execute('DELETE FROM rollup_categories WHERE user_id = ? AND month = ?', (user_id, month))
+        self._conn.execute(
+            'INSERT OR REPLACE INTO rollups (user_id, month, total_cents, count, updated_at) VALUES (?, ?, ?, ?, ?)',
+            (user_id, month, rollup['total_cents'], rollup['count'], rollup['updated_at'].isoformat())
+        )
+        self._conn.executemany(
+            'INSERT INTO rollup_categories (user_id, month, category, total_cents, count) VALUES (?, ?, ?, ?, ?)',
+            [(user_id, month, category, entry['total_cents'], entry['count'])
+             for category, entry in rollup['categories'].items()]
+        )
+        return rollup
+
+    def rebuild_rollup(self, user_id, month, bump_version=True):
+        with self._lock, self._conn:
+            rollup = self._store_rollup(user_id, month)
+            if bump_version:
+                self._bump_versions(user_id, [month])
+        return rollup
+
+    def list_rollup_months(self, user_id):
+        with self._lock:
+            rows = self._conn.execute('SELECT month FROM rollups WHERE user_id = ?', (user_id,)).fetchall()
+        return [row['month'] for row in rows]
+
+    def list_user_ids(self):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT user_id FROM expenses UNION SELECT user_id FROM budgets ORDER BY user_id'
+            ).fetchall()
+        return [row['user_id'] for row in rows]
+
+    @staticmethod
+    def _user_range(first_user, end_user):
+        """WHERE clause and parameters of a [first_user, end_user) user range"""
+        conditions, params = ['1'], []
+        if first_user is not None:
+            conditions.append('user_id >= ?')
+            params.append(first_user)
+        if end_user is not None:
+            conditions.append('user_id < ?')
+            params.append(end_user)
+        return ' AND '.join(conditions), params
+
+    def expense_partitions(self, shards):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT user_id, COUNT(*) FROM expenses GROUP BY user_id ORDER BY user_id'
+            ).fetchall()
+        return user_range_bounds([tuple(row) for row in rows], shards)
+
+    def _scan(self, table, columns, first_user, end_user):
+        where, params = self._user_range(first_user, end_user)
+        # A cursor of its own, read in chunks, so other threads are not held up by a whole scan
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.execute(f'SELECT user_id, {columns} FROM {table} WHERE {where} ORDER BY user_id, id', params)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(1000)
+            if not rows:
+                return
+            for row in rows:
+                yield row['user_id'], self._from_row(row)
+
+    def scan_expenses(self, first_user, end_user, fields=None):
+        return self._scan('expenses', self._columns(fields, EXPENSE_FIELDS), first_user, end_user)
+
+    def scan_budgets(self, first_user, end_user):
+        return self._scan('budgets', '*', first_user, end_user)
+
+    def get_stats(self, stats_id):
+        with self._lock:
+            row = self._conn.execute('SELECT data, updated_at FROM stats WHERE id = ?', (stats_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(json.loads(row['data']), updated_at=datetime.fromisoformat(row['updated_at']))
+
+    def set_stats(self, stats_id, data):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO stats (id, data, updated_at) VALUES (?, ?, ?)',
+                (stats_id, json.dumps(data), datetime.now().isoformat())
+            )
+
+    def delete_stats(self, stats_id):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM stats WHERE id = ?', (stats_id,))
+
+    def rebuild_search_index(self, user_id):
+        entries = {}
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                'SELECT id, category, note, date FROM expenses WHERE user_id = ?', (user_id,)
+            ).fetchall()
+            for row in rows:
+                expense = self._from_row(row)
+                merge_search_changes(entries, search_index_changes(expense['id'], None, expense))
+            self._conn.execute('DELETE FROM search_index WHERE user_id = ?', (user_id,))
+            self._apply_search_changes(user_id, entries)
+        return len(entries)
+
+    def get_versions(self, user_id, months):
+        versions = {month: 0 for month in months}
+        if versions:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT month, version FROM versions WHERE user_id = ? AND month IN ({', '.join('?' * len(versions))})",
+                    [user_id] + list(versions)
+                ).fetchall()
+            versions.update({row['month']: row['version'] for row in rows})
+        return versions
+
+    def watch_versions(self, user_id, month, callback):
+        return self._watchers.watch(user_id, month, callback)
+
+    def ping(self):
+        with self._lock:
+            self._conn.execute('SELECT 1').fetchone()
+
+
+def create_storage(backend=None):
+    """
+    Create the storage backend selected by STORAGE_BACKEND
+    (firestore, memory or sqlite). SQLite uses SQLITE_PATH.
+    """
+    backend = (backend or os.environ.get('STORAGE_BACKEND', 'firestore')).lower()
+
+    if backend == 'firestore':
+        return FirestoreStorage(firebase.firestore_client)
+    if backend == 'memory':
+        return MemoryStorage()
+    if backend == 'sqlite':
+        return SQLiteStorage(os.environ.get('SQLITE_PATH', 'finance_tracker.db'))
+
+    raise ValueError(f"Unknown storage backend: {backend}")
@@ -0,0 +1,79 @@
+"""
+Cache of verified Firebase ID tokens
+
+require_auth runs on every protected request and the dashboard sends the
+same token several times per page load. Decoded tokens are kept in a
+bounded LRU keyed by a hash of the token (the raw token is never stored)
+and dropped once the token's own 'exp' claim has passed.
+"""
+
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+
+
+class TokenCache:
+    """Thread-safe LRU cache of decoded tokens with expiry from the 'exp' claim"""
+
+    def __init__(self, max_size=1024, clock=time.time):
+        self.max_size = max_size
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # token hash -> (expires_at, decoded_token)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def get(self, token):
+        """Return the cached decoded token, or None if missing or expired"""
+        key = self._key(token)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, decoded_token = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return decoded_token
+
+    def put(self, token, decoded_token):
+        """Cache a decoded token until its 'exp' claim"""
+        expires_at = decoded_token.get('exp')
+        if not expires_at or expires_at <= self._clock():
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (expires_at, decoded_token)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop all cached tokens"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
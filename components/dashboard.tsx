@@ -56,20 +56,18 @@ export function Dashboard({ onNavigate }: DashboardProps) {
     setError("")
 
     try {
-      // Load summary data
-      const summaryResponse = await apiClient.getSummary(user.uid, selectedMonth)
-      if (summaryResponse.success) {
-        setSummaryData(summaryResponse.data)
+      // Load summary and category breakdown in one request
+      const dashboardResponse = await apiClient.getDashboard(user.uid, selectedMonth, ["summary", "report"])
+      if (dashboardResponse.success && dashboardResponse.data?.summary) {
+        setSummaryData(dashboardResponse.data.summary)
       } else {
-        throw new Error(summaryResponse.error || "Failed to load summary")
+        throw new Error(dashboardResponse.error || "Failed to load summary")
       }
 
-      // Load report data for category breakdown
-      const reportResponse = await apiClient.getReport(user.uid, selectedMonth)
-      if (reportResponse.success) {
-        setExpensesByCategory(reportResponse.data.expenses_by_category || {})
-      } else {
-        console.warn("Failed to load report data:", reportResponse.error)
+      // The category breakdown is optional: without it the summary still renders
+      setExpensesByCategory(dashboardResponse.data.report?.expenses_by_category || {})
+      if (!dashboardResponse.data.report) {
+        console.warn("Failed to load report data")
       }
     } catch (error: any) {
       setError(error.message || "Failed to load dashboard data")
@@ -6,6 +6,52 @@ interface ApiResponse<T = any> {
   error?: string
 }
 
+// Month status pushed by the live status stream
+export interface BudgetStatus {
+  month: string
+  total_expenses: number
+  total_budget: number
+  remaining_budget: number
+  budget_usage_percent: number
+  budget_status: "no_budget" | "under_budget" | "over_budget"
+  expense_count: number
+  budget_count: number
+  categories: Record<string, number>
+}
+
+// JSON Merge Patch (RFC 7386), the format of live status "delta" events
+function mergePatch(target: Record<string, any>, patch: Record<string, any>): Record<string, any> {
+  const result = { ...target }
+  for (const [key, value] of Object.entries(patch)) {
+    if (value === null) {
+      delete result[key]
+    } else if (typeof value === "object" && !Array.isArray(value)) {
+      result[key] = mergePatch(result[key] ?? {}, value)
+    } else {
+      result[key] = value
+    }
+  }
+  return result
+}
+
+// Server-side filters of the expense listing
+export interface ExpenseFilters {
+  categories?: string[]
+  minAmount?: number
+  maxAmount?: number
+  sort?: "date" | "-date" | "amount" | "-amount"
+  // Words that must all appear in the note or category
+  search?: string
+}
+
+function setExpenseFilters(params: URLSearchParams, filters: ExpenseFilters) {
+  for (const category of filters.categories ?? []) params.append("category", category)
+  if (filters.minAmount !== undefined) params.set("min_amount", String(filters.minAmount))
+  if (filters.maxAmount !== undefined) params.set("max_amount", String(filters.maxAmount))
+  if (filters.sort) params.set("sort", filters.sort)
+  if (filters.search) params.set("q", filters.search)
+}
+
 class ApiClient {
   private baseURL: string
   private token: string | null = null
@@ -18,7 +64,7 @@ class ApiClient {
     this.token = token
   }
 
-  private async request<T>(endpoint: string, options: RequestInit = {}): Promise<ApiResponse<T>> {
+  private async request<T>(endpoint: string, options: RequestInit = {}, retried = false): Promise<ApiResponse<T>> {
     const url = `${this.baseURL}${endpoint}`
 
     const headers: HeadersInit = {
@@ -36,6 +82,13 @@ class ApiClient {
         headers,
       })
 
+      // Analytics limits reached: wait as asked and retry a read once
+      if (response.status === 429 && !retried && (options.method ?? "GET") === "GET") {
+        const retryAfter = Number(response.headers.get("Retry-After") ?? 1)
+        await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000))
+        return this.request<T>(endpoint, options, true)
+      }
+
       const data = await response.json()
 
       if (!response.ok) {
@@ -68,6 +121,26 @@ class ApiClient {
     return this.request(`/api/users/${userId}/expenses${params}`)
   }
 
+  async getExpensesPage(
+    userId: string,
+    month: string,
+    pageSize = 100,
+    startAfter?: string | null,
+    filters: ExpenseFilters = {},
+  ) {
+    const params = new URLSearchParams({ month, page_size: String(pageSize) })
+    if (startAfter) params.set("start_after", startAfter)
+    setExpenseFilters(params, filters)
+    return this.request(`/api/users/${userId}/expenses?${params.toString()}`)
+  }
+
+  // Filtered, sorted or searched expenses of a month, all at once
+  async searchExpenses(userId: string, month: string, filters: ExpenseFilters) {
+    const params = new URLSearchParams({ month })
+    setExpenseFilters(params, filters)
+    return this.request(`/api/users/${userId}/expenses?${params.toString()}`)
+  }
+
   async addExpense(
     userId: string,
     expense: {
@@ -83,6 +156,20 @@ class ApiClient {
     })
   }
 
+  async importExpenses(userId: string, file: Blob, format: "csv" | "ndjson", idempotencyKey?: string) {
+    const headers: Record<string, string> = {
+      "Content-Type": format === "csv" ? "text/csv" : "application/x-ndjson",
+    }
+    if (idempotencyKey) {
+      headers["Idempotency-Key"] = idempotencyKey
+    }
+    return this.request(`/api/users/${userId}/expenses/import`, {
+      method: "POST",
+      body: file,
+      headers,
+    })
+  }
+
   async updateExpense(
     userId: string,
     expenseId: string,
@@ -131,6 +218,50 @@ class ApiClient {
     })
   }
 
+  // Recurring expense endpoints
+  async getRecurringExpenses(userId: string) {
+    return this.request(`/api/users/${userId}/recurring`)
+  }
+
+  async addRecurringExpense(
+    userId: string,
+    rule: {
+      amount: number
+      category: string
+      frequency: "weekly" | "monthly" | "yearly"
+      note?: string
+      start_date?: string
+      end_date?: string
+    },
+  ) {
+    return this.request(`/api/users/${userId}/recurring`, {
+      method: "POST",
+      body: JSON.stringify(rule),
+    })
+  }
+
+  async updateRecurringExpense(
+    userId: string,
+    ruleId: string,
+    rule: {
+      amount?: number
+      category?: string
+      note?: string
+      end_date?: string | null
+    },
+  ) {
+    return this.request(`/api/users/${userId}/recurring/${ruleId}`, {
+      method: "PUT",
+      body: JSON.stringify(rule),
+    })
+  }
+
+  async deleteRecurringExpense(userId: string, ruleId: string) {
+    return this.request(`/api/users/${userId}/recurring/${ruleId}`, {
+      method: "DELETE",
+    })
+  }
+
   // Analytics endpoints
   async getSummary(userId: string, month: string) {
     return this.request(`/api/summary/${userId}/${month}`)
@@ -139,6 +270,128 @@ class ApiClient {
   async getReport(userId: string, month: string) {
     return this.request(`/api/report/${userId}/${month}`)
   }
+
+  // Live month status over Server-Sent Events instead of polling getSummary.
+  // onStatus gets the full status on connect and after every change; the
+  // stream reconnects when it ends (e.g. token expiry). Returns a function
+  // that closes it.
+  watchBudgetStatus(
+    userId: string,
+    month: string,
+    onStatus: (status: BudgetStatus) => void,
+    onError?: (error: string) => void,
+  ) {
+    const controller = new AbortController()
+    let status: Record<string, any> | null = null
+
+    const handleEvent = (block: string) => {
+      let event = "message"
+      let data = ""
+      for (const line of block.split("\n")) {
+        if (line.startsWith("event: ")) event = line.slice(7)
+        else if (line.startsWith("data: ")) data += line.slice(6)
+      }
+      if (!data) return
+      if (event === "status") status = JSON.parse(data)
+      else if (event === "delta" && status) status = mergePatch(status, JSON.parse(data))
+      if (status) onStatus(status as BudgetStatus)
+    }
+
+    const listen = async () => {
+      while (!controller.signal.aborted) {
+        try {
+          // fetch rather than EventSource, which cannot send the Authorization header
+          const response = await fetch(`${this.baseURL}/api/summary/${userId}/${month}/events`, {
+            headers: this.token ? { Authorization: `Bearer ${this.token}` } : {},
+            signal: controller.signal,
+          })
+          if (!response.ok || !response.body) {
+            throw new Error(`HTTP ${response.status}: ${response.statusText}`)
+          }
+
+          const reader = response.body.pipeThrough(new TextDecoderStream()).getReader()
+          let buffer = ""
+          for (;;) {
+            const { value, done } = await reader.read()
+            if (done) break
+            buffer += value
+            let end
+            while ((end = buffer.indexOf("\n\n")) >= 0) {
+              handleEvent(buffer.slice(0, end))
+              buffer = buffer.slice(end + 2)
+            }
+          }
+        } catch (error) {
+          if (controller.signal.aborted) return
+          onError?.(error instanceof Error ? error.message : "Network error")
+        }
+        await new Promise((resolve) => setTimeout(resolve, 5000))
+      }
+    }
+
+    listen()
+    return () => controller.abort()
+  }
+
+  // Expenses, budgets, summary and report for a month in one request
+  async getDashboard(
+    userId: string,
+    month: string,
+    include?: Array<"expenses" | "budgets" | "summary" | "report">,
+  ) {
+    const params = new URLSearchParams({ month })
+    if (include?.length) params.set("include", include.join(","))
+    return this.request(`/api/users/${userId}/dashboard?${params.toString()}`)
+  }
+
+  async getTrends(
+    userId: string,
+    options: { start?: string; end?: string; granularity?: "day" | "week" | "month" } = {},
+  ) {
+    const params = new URLSearchParams()
+    if (options.start) params.set("start", options.start)
+    if (options.end) params.set("end", options.end)
+    if (options.granularity) params.set("granularity", options.granularity)
+    const query = params.toString()
+    return this.request(`/api/trends/${userId}${query ? `?${query}` : ""}`)
+  }
+
+  // Whole-history (or start/end day range) export as a CSV or Parquet file
+  async exportData(
+    userId: string,
+    options: { dataset?: "expenses" | "budgets"; format?: "csv" | "parquet"; start?: string; end?: string } = {},
+  ): Promise<ApiResponse<Blob>> {
+    const params = new URLSearchParams()
+    if (options.dataset) params.set("dataset", options.dataset)
+    if (options.format) params.set("format", options.format)
+    if (options.start) params.set("start", options.start)
+    if (options.end) params.set("end", options.end)
+    const query = params.toString()
+
+    try {
+      const response = await fetch(`${this.baseURL}/api/users/${userId}/export${query ? `?${query}` : ""}`, {
+        headers: this.token ? { Authorization: `Bearer ${this.token}` } : {},
+      })
+
+      if (!response.ok) {
+        const data = await response.json().catch(() => ({}))
+        return {
+          success: false,
+          error: data.error || `HTTP ${response.status}: ${response.statusText}`,
+        }
+      }
+
+      return {
+        success: true,
+        data: await response.blob(),
+      }
+    } catch (error) {
+      return {
+        success: false,
+        error: error instanceof Error ? error.message : "Network error",
+      }
+    }
+  }
 }
 
 export const apiClient = new ApiClient(API_BASE_URL)